@@ -0,0 +1,46 @@
+"""
+Fixtures for the benchmark suite
+
+Run with:
+    pytest benchmarks --benchmark-autosave
+"""
+import os
+import sys
+from unittest.mock import patch
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pytebis.tebis import Tebis  # noqa: E402
+from pytebis.synthetic import buildConfigPayload, makeSeries  # noqa: E402
+from pytebis.fakeserver import FakeTebisServer, makeMsts  # noqa: E402
+
+PATTERNS = ('noise', 'step', 'constant', 'nan')
+
+
+def make_columns(rows, cols, nanRatio=0.05):
+    return [makeSeries(rows, PATTERNS[i % len(PATTERNS)], nanRatio, seed=i) for i in range(cols)]
+
+
+def make_types(cols):
+    return [('timestamp', np.int64)] + [(f'mst{i}', np.float32) for i in range(cols)]
+
+
+def config_payload(count):
+    return buildConfigPayload(makeMsts(count))
+
+
+@pytest.fixture(scope='session')
+def local_server():
+    '''a local Tebis server with 200 msts'''
+    with FakeTebisServer(msts=200) as server:
+        yield server
+
+
+@pytest.fixture
+def offline_tebis():
+    with patch('pytebis.tebis.Tebis.refreshMsts'):
+        teb = Tebis(configuration={'host': '127.0.0.1'})
+    teb.reductions = [1000, 10000, 60000]
+    return teb
@@ -0,0 +1,56 @@
+"""
+Benchmarks for the conversion of decoded results (pandas, json, csv, aggregation)
+"""
+from unittest.mock import Mock
+import numpy as np
+import pandas as pd
+import pytest
+from pytebis.tebis import getDataSeries_as_Json
+from pytebis.aggregate import aggregateSeries
+from pytebis.csvexport import getDataAsCSVString
+from conftest import make_columns, make_types
+
+AGGREGATIONS = ['mean', 'min', 'max', 'first', 'last', 'count']
+
+
+def make_result(rows, cols):
+    data = np.empty(rows, dtype=make_types(cols))
+    data['timestamp'] = 1700000000000 + np.arange(rows, dtype=np.int64) * 1000
+    for i, values in enumerate(make_columns(rows, cols)):
+        data[f'mst{i}'] = values
+    return data
+
+
+@pytest.fixture(scope='module')
+def result():
+    return make_result(864000, 10)
+
+
+def test_pandas(benchmark, offline_tebis, result):
+    offline_tebis.getDataAsNP = Mock(return_value=result)
+    benchmark(offline_tebis.getDataAsPD, ['mst0'], 0, 1)
+
+
+def test_json(benchmark):
+    benchmark(getDataSeries_as_Json, make_result(86400, 10))
+
+
+def test_csv(benchmark):
+    benchmark(getDataAsCSVString, make_result(86400, 10), timezone='Europe/Berlin')
+
+
+def test_csv_pandas(benchmark, offline_tebis):
+    offline_tebis.getDataAsNP = Mock(return_value=make_result(86400, 10))
+    benchmark(lambda: offline_tebis.getDataAsPD(['mst0'], 0, 1).to_csv(float_format='%.3f'))
+
+
+def test_aggregate(benchmark, result):
+    benchmark(aggregateSeries, result, 900000, AGGREGATIONS, 1000)
+
+
+def test_aggregate_pandas_resample(benchmark, result):
+    def resample():
+        df = pd.DataFrame(result)
+        df = df.set_index(pd.DatetimeIndex(pd.to_datetime(df['timestamp'], unit='ms')))
+        return df.drop(columns=['timestamp']).resample('15min').agg(AGGREGATIONS)
+    benchmark(resample)
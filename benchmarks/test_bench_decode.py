@@ -0,0 +1,52 @@
+"""
+Benchmarks for the decoding of LoadData and GetConfig payloads
+"""
+import pytest
+from pytebis.synthetic import buildLoadDataPayload, FUNCTION_VALUES, FUNCTION_LINEAR, FUNCTION_GROUPS, FUNCTION_NAN
+from conftest import make_columns, make_types, config_payload
+import numpy as np
+
+
+@pytest.mark.parametrize('rows,cols', [(86400, 10), (3600, 100), (600000, 1)])
+@pytest.mark.parametrize('compress', [True, False])
+def test_decode_mixed(benchmark, offline_tebis, rows, cols, compress):
+    raw = buildLoadDataPayload(make_columns(rows, cols), 1700000000000, 1000, compress=compress)
+    types = make_types(cols)
+    benchmark.extra_info['payloadBytes'] = len(raw)
+    benchmark(offline_tebis._Tebis__checkBinaryResultHeader, raw, types)
+
+
+@pytest.mark.parametrize('function', [FUNCTION_NAN, FUNCTION_VALUES, FUNCTION_LINEAR, FUNCTION_GROUPS])
+@pytest.mark.parametrize('byteCount', [8, 4, 2])
+def test_decode_function(benchmark, offline_tebis, function, byteCount):
+    rows, cols = 86400, 10
+    pattern = {FUNCTION_NAN: 'nan', FUNCTION_VALUES: 'noise', FUNCTION_LINEAR: 'constant', FUNCTION_GROUPS: 'step'}[function]
+    from pytebis.synthetic import makeSeries
+    columns = [makeSeries(rows, pattern, 0.0 if function == FUNCTION_LINEAR else 0.02, seed=i) for i in range(cols)]
+    raw = buildLoadDataPayload(columns, 1700000000000, 1000, functions=[function] * cols, byteCount=byteCount)
+    benchmark.extra_info['payloadBytes'] = len(raw)
+    benchmark(offline_tebis._Tebis__checkBinaryResultHeader, raw, make_types(cols))
+
+
+@pytest.mark.parametrize('nanRatio', [0.0, 0.2, 0.5])
+def test_decode_nan_segments(benchmark, offline_tebis, nanRatio):
+    raw = buildLoadDataPayload(make_columns(86400, 10, nanRatio), 1700000000000, 1000, functions=[FUNCTION_VALUES] * 10)
+    benchmark(offline_tebis._Tebis__checkBinaryResultHeader, raw, make_types(10))
+
+
+def test_decode_config(benchmark, offline_tebis):
+    raw = config_payload(2000)
+    result = benchmark(offline_tebis.loadMstsFromSocket, raw)
+    assert len(result) == 2000
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_decode_column_cache(benchmark, cached):
+    from pytebis.decoder import decodeBinaryResult, ColumnCache
+    raw = buildLoadDataPayload(make_columns(86400, 10), 1700000000000, 1000)
+    types = make_types(10)
+    keys = [(i, 1000, 86400, 0) for i in range(10)]
+    cache = ColumnCache()
+    if cached:
+        decodeBinaryResult(raw, types, cache=cache, cacheKeys=keys, changed=set())
+    benchmark(decodeBinaryResult, raw, types, cache=cache if cached else None, cacheKeys=keys, changed=set())
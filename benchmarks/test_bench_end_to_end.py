@@ -0,0 +1,54 @@
+"""
+End-to-end benchmarks against the local Tebis server (pytebis.fakeserver)
+"""
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from pytebis.tebis import Tebis
+
+END = 1700000000
+
+
+@pytest.fixture
+def tebis(local_server):
+    local_server.latency = 0.0
+    local_server.bandwidth = None
+    return Tebis(configuration=local_server.configuration())
+
+
+def test_refresh(benchmark, tebis):
+    benchmark(tebis.refreshMsts)
+
+
+@pytest.mark.parametrize('ids,seconds', [(10, 86400), (200, 3600), (1, 100000)])
+@pytest.mark.parametrize('maxParallel', [1, 4])
+def test_get_data(benchmark, tebis, ids, seconds, maxParallel):
+    tebis.config['requests']['maxParallel'] = maxParallel
+    tebis.config['requests']['maxIdsPerRequest'] = 50
+    result = benchmark(tebis.getDataAsNP, list(range(1, ids + 1)), END - seconds, END, 1)
+    assert len(result) == seconds
+
+
+@pytest.mark.parametrize('decodeProcesses', [0, 2, 4])
+def test_process_decode(benchmark, local_server, decodeProcesses):
+    '''100 msts over 6 hours in chunks of 20 msts, decoded in the calling thread or in worker processes'''
+    tebis = Tebis(configuration=local_server.configuration(
+        requests={'maxIdsPerRequest': 20, 'maxParallel': 8, 'adaptive': False, 'decodeProcesses': decodeProcesses}))
+    try:
+        tebis.getDataAsNP([1], END - 60, END, 1)  # starts the worker processes
+        benchmark(tebis.getDataAsNP, list(range(1, 101)), END - 21600, END, 1)
+    finally:
+        tebis.closeDecodePool()
+
+
+@pytest.mark.parametrize('clients', [1, 8, 32])
+def test_concurrent_clients(benchmark, tebis, local_server, clients):
+    '''clients query in parallel, the server answers with 20 ms latency and 100 MB/s'''
+    local_server.latency = 0.02
+    local_server.bandwidth = 100e6
+
+    def run(pool):
+        futures = [pool.submit(tebis.getDataAsNP, [1, 2, 3, 4], END - 3600, END, 1) for _ in range(clients)]
+        return [future.result() for future in futures]
+
+    with ThreadPoolExecutor(clients) as pool:
+        benchmark(run, pool)
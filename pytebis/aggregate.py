@@ -0,0 +1,81 @@
+"""Vectorized per-window aggregation of structured result arrays.
+
+The aggregation works directly on the arrays returned by getDataAsNP. NaN values
+are ignored by all functions, a window without any valid value results in NaN
+(count 0).
+"""
+import re
+import numpy as np
+
+AGGREGATIONS = ('mean', 'min', 'max', 'first', 'last', 'count', 'sum', 'integral')
+
+_UNITS = {'ms': 1, 's': 1000, 'sec': 1000, 'min': 60000, 'm': 60000, 'h': 3600000, 'd': 86400000}
+
+
+def parseInterval(every):
+    '''converts 15, 0.5, '15min', '1h', '30s', '500ms' or '1d' to milliseconds'''
+    if isinstance(every, (int, float, np.integer, np.floating)):
+        return int(round(every * 1000))
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)\s*', str(every))
+    if match is None or match.group(2).lower() not in _UNITS:
+        raise ValueError(f'Invalid interval {every}')
+    return int(round(float(match.group(1)) * _UNITS[match.group(2).lower()]))
+
+
+def aggregateSeries(data, every, funcs=('mean',), rate=None, origin=0):
+    '''aggregates all value columns of data per window of every (ms)
+    rate (ms) is used for the integral, if None it is taken from the timestamps
+    returns a structured array with the window start as timestamp and a column <name>_<func> per value column and function'''
+    for func in funcs:
+        if func not in AGGREGATIONS:
+            raise ValueError(f'Unknown aggregation {func}')
+    if data is None:
+        return None
+    names = [name for name in data.dtype.names if name != 'timestamp']
+    dtype = [('timestamp', np.int64)]
+    for name in names:
+        for func in funcs:
+            dtype.append((f'{name}_{func}', np.int64 if func == 'count' else np.float64))
+    if len(data) == 0:
+        return np.empty(0, dtype=dtype)
+    timestamps = np.asarray(data['timestamp'], dtype=np.int64)
+    bins = (timestamps - origin) // every
+    starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+    result = np.empty(len(starts), dtype=dtype)
+    result['timestamp'] = bins[starts] * every + origin
+    if rate is None:
+        rate = int(np.median(np.diff(timestamps))) if len(timestamps) > 1 else every
+    positions = np.arange(len(data))
+    for name in names:
+        values = np.asarray(data[name], dtype=np.float64)
+        valid = ~np.isnan(values)
+        count = np.add.reduceat(valid, starts).astype(np.int64)
+        empty = count == 0
+        total = None
+        for func in funcs:
+            column = f'{name}_{func}'
+            if func == 'count':
+                result[column] = count
+                continue
+            if func in ('sum', 'mean', 'integral'):
+                if total is None:
+                    total = np.add.reduceat(np.where(valid, values, 0.0), starts)
+                if func == 'sum':
+                    out = total.copy()
+                elif func == 'mean':
+                    out = total / np.maximum(count, 1)
+                else:
+                    out = total * (rate / 1000.0)
+            elif func == 'min':
+                out = np.fmin.reduceat(values, starts)
+            elif func == 'max':
+                out = np.fmax.reduceat(values, starts)
+            elif func == 'first':
+                index = np.minimum.reduceat(np.where(valid, positions, len(data)), starts)
+                out = values[np.minimum(index, len(data) - 1)]
+            elif func == 'last':
+                index = np.maximum.reduceat(np.where(valid, positions, -1), starts)
+                out = values[np.maximum(index, 0)]
+            out[empty] = np.nan
+            result[column] = out
+    return result
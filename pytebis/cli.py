@@ -0,0 +1,196 @@
+"""Command line interface of pytebis.
+
+    pytebis export --host 192.168.1.10 --names-file msts.txt --start 2024-01-01 --end 2024-02-01 \\
+        --rate 1 --format parquet --output export/ --window 1d --chunk-size 100 --workers 4
+
+The export is split into parts (time window x mst chunk) which are loaded by a
+pool of worker threads sharing one Tebis instance. Every finished part is written
+to its own file (part-<window>-<chunk>.<format>) through a temporary file, so an
+aborted export is resumed by running the same command again: existing parts are
+skipped.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pytebis.aggregate import parseInterval
+from pytebis.timeutils import toTimestampMs
+
+FORMATS = {'csv': 'csv', 'parquet': 'parquet', 'feather': 'feather'}
+
+
+def readNames(path):
+    '''one mst per line, numbers are used as ids. Empty lines and lines starting with # are ignored'''
+    names = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            names.append(int(line) if line.isdigit() else line)
+    return names
+
+
+def parseTime(value):
+    '''seconds, ms or a date string (local time) to a unix timestamp in ms'''
+    try:
+        value = float(value)
+        if value.is_integer():
+            value = int(value)
+    except ValueError:
+        pass
+    return int(toTimestampMs(value))
+
+
+def planExport(names, startMs, endMs, windowMs, chunkSize):
+    '''returns the parts as (windowIndex, chunkIndex, start, end, names) with start/end in ms'''
+    parts = []
+    windowIndex = 0
+    windowStart = startMs
+    while windowStart < endMs:
+        windowEnd = min(windowStart + windowMs, endMs)
+        for chunkIndex, i in enumerate(range(0, len(names), chunkSize)):
+            parts.append((windowIndex, chunkIndex, windowStart, windowEnd, names[i:i + chunkSize]))
+        windowIndex += 1
+        windowStart = windowEnd
+    return parts
+
+
+def partPath(output, windowIndex, chunkIndex, format):
+    return os.path.join(output, f'part-{windowIndex:05d}-{chunkIndex:04d}.{FORMATS[format]}')
+
+
+def writePart(df, path, format):
+    '''writes the DataFrame through a temporary file, the part only exists when it is complete'''
+    tmp = path + '.tmp'
+    try:
+        if format == 'parquet':
+            df.to_parquet(tmp)
+        elif format == 'feather':
+            df.reset_index().to_feather(tmp)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def exportCSVPart(teb, names, start, end, rate, path):
+    '''writes the part with the CSV writer of pytebis (no pandas) through a temporary file, returns (values, size)'''
+    tmp = path + '.tmp'
+    try:
+        # shortest representation, no digits are lost
+        rows = teb.exportCSV(tmp, names, start, end, rate, precision=None)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return rows * len(names), os.path.getsize(path)
+
+
+def checkFormat(format):
+    if format in ('parquet', 'feather') and importlib.util.find_spec('pyarrow') is None:
+        raise SystemExit(f'The format {format} needs pyarrow. Do "pip install pyarrow"')
+
+
+def connect(args):
+    from pytebis.tebis import Tebis
+    configuration = {}
+    if args.config is not None:
+        with open(args.config, encoding='utf-8') as f:
+            configuration = json.load(f)
+    for key in ('host', 'port', 'configfile'):
+        if getattr(args, key) is not None:
+            configuration[key] = getattr(args, key)
+    return Tebis(configuration=configuration)
+
+
+def export(teb, names, args, out=sys.stderr):
+    '''runs the export, returns the number of failed parts'''
+    startMs, endMs = parseTime(args.start), parseTime(args.end)
+    parts = planExport(names, startMs, endMs, parseInterval(args.window), args.chunk_size)
+    os.makedirs(args.output, exist_ok=True)
+    todo = [part for part in parts if not os.path.exists(partPath(args.output, part[0], part[1], args.format))]
+    if len(todo) < len(parts):
+        print(f'Resuming: {len(parts) - len(todo)} of {len(parts)} parts already exported', file=out)
+    started = time.perf_counter()
+    totalRows = 0
+    totalBytes = 0
+    failed = 0
+
+    def run(part):
+        windowIndex, chunkIndex, start, end, chunkNames = part
+        path = partPath(args.output, windowIndex, chunkIndex, args.format)
+        with teb.requestPriority('bulk'):
+            if args.format == 'csv':
+                return exportCSVPart(teb, chunkNames, start, end, args.rate, path)
+            df = teb.getDataAsPD(chunkNames, start, end, args.rate)
+        return len(df) * len(df.columns), writePart(df, path, args.format)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix='pytebis-export') as pool:
+        futures = dict((pool.submit(run, part), part) for part in todo)
+        for done, future in enumerate(as_completed(futures), start=1):
+            windowIndex, chunkIndex = futures[future][:2]
+            name = os.path.basename(partPath(args.output, windowIndex, chunkIndex, args.format))
+            try:
+                values, size = future.result()
+            except Exception as e:
+                failed += 1
+                logging.getLogger('pytebis').debug('Export of %s failed', name, exc_info=True)
+                print(f'[{done}/{len(todo)}] {name} failed: {e!r}', file=out)
+                continue
+            totalRows += values
+            totalBytes += size
+            elapsed = max(time.perf_counter() - started, 1e-9)
+            print(f'[{done}/{len(todo)}] {name} {values} values, {size / 1e6:.1f} MB | '
+                  f'{totalRows / elapsed:,.0f} values/s, {totalBytes / 1e6 / elapsed:.1f} MB/s', file=out)
+    if failed:
+        print(f'{failed} parts failed, run the same command again to resume', file=out)
+    else:
+        print(f'Exported {len(todo)} parts, {totalRows} values in {time.perf_counter() - started:.1f}s', file=out)
+    return failed
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog='pytebis', description='Tebis command line tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    exportParser = subparsers.add_parser('export', help='export msts to csv, parquet or feather files')
+    exportParser.add_argument('--host', help='Tebis server')
+    exportParser.add_argument('--port', type=int, help='Tebis port [4712]')
+    exportParser.add_argument('--configfile', help='Tebis instance (configfile on the server)')
+    exportParser.add_argument('--config', help='json file with the Tebis configuration')
+    names = exportParser.add_mutually_exclusive_group(required=True)
+    names.add_argument('--names-file', help='file with one mst name or id per line')
+    names.add_argument('--names', help='comma separated mst names or ids')
+    exportParser.add_argument('--start', required=True, help='unix timestamp or date (local time)')
+    exportParser.add_argument('--end', required=True, help='unix timestamp or date (local time)')
+    exportParser.add_argument('--rate', type=float, default=1, help='reduction in seconds [1]')
+    exportParser.add_argument('--format', choices=sorted(FORMATS), default='csv', help='output format [csv]')
+    exportParser.add_argument('--output', default='export', help='output directory [export]')
+    exportParser.add_argument('--window', default='1d', help='timespan of one part e.g. 6h, 1d [1d]')
+    exportParser.add_argument('--chunk-size', type=int, default=100, help='msts per part [100]')
+    exportParser.add_argument('--workers', type=int, default=4, help='parts loaded in parallel [4]')
+    return parser
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    if args.command == 'export':
+        checkFormat(args.format)
+        if args.names_file is not None:
+            names = readNames(args.names_file)
+        else:
+            names = [int(name) if name.strip().isdigit() else name.strip() for name in args.names.split(',')]
+        teb = connect(args)
+        return 1 if export(teb, names, args) else 0
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
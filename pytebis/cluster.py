@@ -0,0 +1,194 @@
+"""Client for several redundant Tebis servers.
+
+TebisCluster is a Tebis which sends every request to one of several endpoints
+serving the same configfile. The msts, groups and the tree are loaded once and
+shared, only the routing of the single requests differs:
+
+- 'leastOutstanding' picks the endpoint with the fewest running requests
+- 'latency' weights the running requests with the measured latency (EWMA), so a
+  slow server gets less of the work
+
+An endpoint failing 'failureThreshold' times in a row is skipped for
+'resetTimeout' seconds (circuit breaker), then a single trial request decides
+if it is used again. A failed request is retried immediately on another endpoint.
+"""
+import logging
+import random
+import threading
+import time
+from pytebis.tebis import Tebis, TebisException, TebisConnectionException, TebisTimeoutException, selective_merge
+
+BALANCING = ('leastOutstanding', 'latency')
+
+
+class TebisEndpoint:
+    ''' state of a single Tebis server of a cluster '''
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.outstanding = 0
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutiveFailures = 0
+        self.openUntil = None
+        self.trial = False
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def isAvailable(self, now):
+        if self.openUntil is None:
+            return True
+        # half open: one trial request after the reset timeout
+        return now >= self.openUntil and not self.trial
+
+    def status(self):
+        return {'host': self.host, 'port': self.port, 'outstanding': self.outstanding, 'latency': self.latency,
+                'requests': self.requests, 'failures': self.failures, 'open': self.openUntil is not None}
+
+    def __repr__(self):
+        return f"TebisEndpoint({self.host}:{self.port})"
+
+
+def parseEndpoint(endpoint, defaultPort=4712):
+    '''(host, port), 'host:port' or 'host' -> (host, port)'''
+    if isinstance(endpoint, (tuple, list)):
+        return (endpoint[0], int(endpoint[1]))
+    host, _, port = str(endpoint).rpartition(':')
+    if host == '':
+        return (port, defaultPort)
+    return (host, int(port))
+
+
+class TebisCluster(Tebis):
+    '''Tebis client which balances the requests over several servers
+    '''
+
+    def __init__(self, endpoints, configuration=None, **kwargs):
+        default_conf = {
+            'cluster': {
+                'balancing': 'latency',  # 'leastOutstanding' or 'latency'
+                'failureThreshold': 3,  # Consecutive failures until an endpoint is skipped
+                'resetTimeout': 30.0,  # Seconds until a skipped endpoint gets a trial request
+                'maxParallelPerEndpoint': 4,  # Used for 'requests.maxParallel' if it is not configured
+            }
+        }
+        configuration = selective_merge(default_conf, configuration if configuration is not None else {})
+        if configuration['cluster']['balancing'] not in BALANCING:
+            raise ValueError(f"Unknown balancing {configuration['cluster']['balancing']}")
+        defaultPort = configuration.get('port', 4712)
+        self.endpoints = [TebisEndpoint(*parseEndpoint(endpoint, defaultPort)) for endpoint in endpoints]
+        if len(self.endpoints) == 0:
+            raise ValueError('At least one endpoint is needed')
+        self.endpointLock = threading.Lock()
+        configuration.setdefault('host', self.endpoints[0].host)
+        configuration.setdefault('port', self.endpoints[0].port)
+        if 'maxParallel' not in configuration.get('requests', {}):
+            configuration.setdefault('requests', {})['maxParallel'] = \
+                configuration['cluster']['maxParallelPerEndpoint'] * len(self.endpoints)
+        super().__init__(configuration=configuration, **kwargs)
+
+    """
+    wählt den Endpunkt für den nächsten Request
+    exclude enthält die Endpunkte, bei denen der Request bereits fehlgeschlagen ist
+    """
+
+    def acquireEndpoint(self, exclude=()):
+        now = time.monotonic()
+        with self.endpointLock:
+            candidates = [e for e in self.endpoints if e.isAvailable(now) and e not in exclude]
+            if len(candidates) == 0:
+                # every endpoint failed for this request, try the available ones again
+                candidates = [e for e in self.endpoints if e.isAvailable(now)]
+            if len(candidates) == 0:
+                raise TebisConnectionException("No available Tebis endpoint")
+            if self.config['cluster']['balancing'] == 'latency':
+                # endpoints without a measured latency are tried first
+                def cost(e):
+                    return 0.0 if e.latency is None else (e.outstanding + 1) * e.latency
+            else:
+                def cost(e):
+                    return e.outstanding
+            trials = [e for e in candidates if e.openUntil is not None]
+            if len(trials) > 0:
+                # the reset timeout has passed, the next request is the trial
+                endpoint = trials[0]
+                endpoint.trial = True
+            else:
+                best = min(cost(e) for e in candidates)
+                endpoint = random.choice([e for e in candidates if cost(e) == best])
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def releaseEndpoint(self, endpoint, duration=None, failed=False):
+        '''gives the endpoint back after a request, without duration and failed the request was aborted'''
+        alpha = 0.3
+        conf = self.config['cluster']
+        with self.endpointLock:
+            endpoint.outstanding -= 1
+            endpoint.trial = False
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutiveFailures += 1
+                if endpoint.consecutiveFailures >= conf['failureThreshold'] or endpoint.openUntil is not None:
+                    if endpoint.openUntil is None:
+                        logging.getLogger('pytebis').warning(f"Tebis endpoint {endpoint.host}:{endpoint.port} is skipped for {conf['resetTimeout']}s")
+                    endpoint.openUntil = time.monotonic() + conf['resetTimeout']
+            elif duration is not None:
+                endpoint.consecutiveFailures = 0
+                endpoint.openUntil = None
+                endpoint.latency = duration if endpoint.latency is None else (1 - alpha) * endpoint.latency + alpha * duration
+
+    """
+    sendet den Request an einen Endpunkt, bei einem Fehler wird sofort ein anderer Endpunkt versucht
+    Erst wenn alle Endpunkte fehlgeschlagen sind wird mit Backoff gewartet ('retry')
+    """
+
+    def requestOnSocket(self, strRequest, deadline=None, points=None, priority=None):
+        retry = self.config['retry']
+        attempts = max(1, int(retry['attempts']), len(self.endpoints))
+        failed = []
+        backoffs = 0
+        for attempt in range(attempts):
+            endpoint = self.acquireEndpoint(failed)
+            start = time.perf_counter()
+            try:
+                raw = self.requestOnce(strRequest, deadline, points, endpoint.address, priority)
+            except TebisException as e:
+                self.releaseEndpoint(endpoint, failed=True)
+                if attempt + 1 >= attempts:
+                    raise
+                if endpoint not in failed:
+                    failed.append(endpoint)
+                self.instrumentation.count('retries')
+                logging.getLogger('pytebis').warning(f"Tebis request on {endpoint.host}:{endpoint.port} failed ({e!r})")
+                if len(failed) < len(self.endpoints):
+                    self.instrumentation.count('failovers')
+                    continue
+                # all endpoints failed, wait before the next round
+                failed = []
+                wait = min(retry['maxBackoff'], retry['backoff'] * 2 ** backoffs)
+                backoffs += 1
+                if retry['jitter']:
+                    wait = random.uniform(0, wait)
+                if deadline is not None and time.monotonic() + wait >= deadline:
+                    raise TebisTimeoutException("Deadline of the Tebis query exceeded") from e
+                time.sleep(wait)
+            except Exception:
+                self.releaseEndpoint(endpoint, failed=True)
+                raise
+            except BaseException:
+                # KeyboardInterrupt, SystemExit: the endpoint didn't fail, only the slot is given back
+                self.releaseEndpoint(endpoint)
+                raise
+            else:
+                self.releaseEndpoint(endpoint, time.perf_counter() - start)
+                return raw
+
+    def getEndpointStatus(self):
+        with self.endpointLock:
+            return [endpoint.status() for endpoint in self.endpoints]
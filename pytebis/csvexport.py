@@ -0,0 +1,93 @@
+"""Vectorized CSV formatting of the structured arrays returned by getDataAsNP.
+
+The timestamps are converted as a whole column (datetime64 to ISO text), the
+value cells of a row are formatted by a single printf with a row template, which
+is faster than numpy's float to str conversion and pandas' per cell formatting.
+No DataFrame and no DatetimeIndex are built. The rows are written in chunks of
+chunkRows, so the memory for the text stays bounded::
+
+    writeCSV(data, 'out.csv', precision=2, naRep='', timestampFormat='iso')
+
+timestampFormat:
+    'iso'   local time 2024-01-01 12:00:00 (.fff when the rate is below 1s)
+    'ms'    unix timestamp in ms
+    's'     unix timestamp in seconds
+    other   strftime format, formatted per row (slow)
+"""
+import datetime
+import io
+import numpy as np
+from pytebis.timeutils import localizeTimestamps
+
+TIMESTAMP_FORMATS = ('iso', 'ms', 's')
+
+
+def formatTimestamps(timestamps, timestampFormat='iso', timezone=None):
+    '''int64 ms -> str array, timezone is applied to 'iso' and strftime formats'''
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if timestampFormat == 'ms':
+        return timestamps.astype(str)
+    if timestampFormat == 's':
+        if np.all(timestamps % 1000 == 0):
+            return (timestamps // 1000).astype(str)
+        return np.round(timestamps / 1000.0, 3).astype(str)
+    if timezone is not None:
+        timestamps = localizeTimestamps(timestamps, timezone)
+    if timestampFormat == 'iso':
+        unit = 's' if np.all(timestamps % 1000 == 0) else 'ms'
+        text = timestamps.astype('datetime64[ms]').astype(f'datetime64[{unit}]').astype(str)
+        if len(text) > 0:
+            # 2024-01-01T12:00:00 -> 2024-01-01 12:00:00 on the fixed width buffer
+            chars = text.view(np.uint32).reshape(len(text), -1)
+            chars[:, 10] = ord(' ')
+        return text
+    epoch = datetime.datetime(1970, 1, 1)
+    return np.array([(epoch + datetime.timedelta(milliseconds=int(ts))).strftime(timestampFormat) for ts in timestamps])
+
+
+def valueFormat(precision=3, floatFormat=None):
+    '''printf format of a value cell'''
+    if floatFormat is not None:
+        return floatFormat
+    if precision is None:
+        return '%s'
+    return f'%.{int(precision)}f'
+
+
+def writeCSV(data, out, precision=3, naRep='', floatFormat=None, timestampFormat='iso', timezone=None,
+             delimiter=',', header=True, chunkRows=100000):
+    '''writes the structured array data (timestamp + value columns) to out (path or text stream)
+    precision = digits after the point, floatFormat (e.g. '%.2e') replaces it, precision None writes the shortest repr
+    returns the number of written rows'''
+    if isinstance(out, (str, bytes)) or hasattr(out, '__fspath__'):
+        with open(out, 'w', encoding='utf-8', newline='') as f:
+            return writeCSV(data, f, precision, naRep, floatFormat, timestampFormat, timezone, delimiter, header, chunkRows)
+    names = [name for name in data.dtype.names if name != 'timestamp']
+    if header:
+        out.write(delimiter.join(['timestamp'] + names) + '\n')
+    cellFormat = valueFormat(precision, floatFormat)
+    # one printf per row, the cells are formatted in C
+    rowFormat = '%s' + (delimiter + cellFormat) * len(names)
+    nanCell = delimiter + cellFormat % float('nan')
+    rows = len(data)
+    for start in range(0, rows, chunkRows):
+        chunk = data[start:start + chunkRows]
+        columns = [formatTimestamps(chunk['timestamp'], timestampFormat, timezone).tolist()]
+        hasNan = False
+        for name in names:
+            values = chunk[name]
+            hasNan = hasNan or bool(np.isnan(values).any())
+            # shortest repr of the float32 values
+            columns.append(values.astype(str).tolist() if cellFormat == '%s' else values.tolist())
+        text = '\n'.join(map(rowFormat.__mod__, zip(*columns)))
+        if hasNan and naRep != 'nan':
+            text = text.replace(nanCell, delimiter + naRep)
+        out.write(text)
+        out.write('\n')
+    return rows
+
+
+def getDataAsCSVString(data, **options):
+    out = io.StringIO()
+    writeCSV(data, out, **options)
+    return out.getvalue()
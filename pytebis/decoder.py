@@ -0,0 +1,334 @@
+"""Decoder of the binary LoadData answers.
+
+The functions are independent of the Tebis class, so they can be used in worker
+processes, too. decodeShared() decodes a payload from shared memory into a result
+array in shared memory (see Tebis 'decodeProcesses').
+"""
+import hashlib
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+from pytebis.lazyloader import LazyLoader
+from pytebis.instrumentation import Instrumentation
+
+shared_memory = LazyLoader('shared_memory', globals(), 'multiprocessing.shared_memory')
+
+_DISABLED = Instrumentation(enabled=False)
+
+
+def decodeBinaryResult(raw, dtype, resultarr=None, offset=0, instrumentation=_DISABLED, cache=None, cacheKeys=None,
+                       changed=None):
+    # raw can be bytes or a memoryview (shared memory)
+    # with a ColumnCache the value columns with the same encoded bytes as last time (cacheKeys[i] for the i-th value column)
+    # are copied from the cache, the names of the decoded columns are added to changed (set)
+    payload = readPayload(raw, instrumentation)
+    if payload is False:
+        return False
+    m_intNmbCols, m_intNmbRows, data = payload
+    m_intPos = 0
+    if resultarr is None:
+        resultarr = np.empty(m_intNmbRows, dtype=dtype)
+    valueColumn = 0
+    for x in range(0 + offset, m_intNmbCols + offset):
+        column_name = resultarr.dtype.names[x]
+        columnStart = m_intPos
+        col = struct.unpack('>hh', data[m_intPos:m_intPos + 4])
+        m_intPos += 4
+        intZero = col[0]  # ?
+        intColType = col[1]  # ?  301 == Timestamp?  | 8 = WertSpalte
+        precount = 0
+        segments = []
+        while precount < m_intNmbRows:  # Schauen ob die Spalte in mehrere Blöcke aufgeteilt ist
+            Length = struct.unpack('>B', data[m_intPos:m_intPos + 1])[0]
+            m_intPos += 1
+            # Die Anzahl ist größer als ein Byte dann kommt die Anzahl als Int (4Byte)
+            if Length == 255:
+                m_intLength = struct.unpack(
+                    '>I', data[m_intPos:m_intPos + 4])[0]
+                m_intPos += 4
+            else:
+                m_intLength = Length
+            m_isNAN = struct.unpack('>B', data[m_intPos:m_intPos + 1])[0]
+            m_intPos += 1
+            if m_isNAN == 0:
+                segments.append([precount, m_intLength])
+            elif m_isNAN == 255:
+                resultarr[column_name][precount:precount +
+                                       m_intLength] = np.nan
+            else:
+                None
+            precount += m_intLength
+        # Die Breite des Datentyps in Bytes
+        m_intByteCount = struct.unpack(
+            '>B', data[m_intPos:m_intPos + 1])[0]
+        m_intPos += 1
+        # Die Funktion 111 = Ein Wert in allen Zeilen |
+        m_intFunction = struct.unpack('>B', data[m_intPos:m_intPos + 1])[0]
+        m_intPos += 1
+        if intColType == 8 and cache is not None:
+            key = cacheKeys[valueColumn]
+            valueColumn += 1
+            columnEnd = valueColumnEnd(data, m_intPos, segments, m_intFunction, m_intByteCount)
+            fingerprint = cache.fingerprint(data[columnStart:columnEnd])
+            values = cache.get(key, fingerprint)
+            if values is not None and len(values) == m_intNmbRows:
+                instrumentation.count('unchangedColumns')
+                resultarr[column_name] = values
+                m_intPos = columnEnd
+                continue
+        if intColType == 301:  # TimeStamp Col
+            for segment in segments:
+                y = segment[0]
+                m_intLength = segment[1]
+                value = struct.unpack('>qq', data[m_intPos:m_intPos + 16])
+                m_intStepSize = value[1]
+                if offset != 0:
+                    x -= 1
+                else:
+                    resultarr[column_name][y:y + m_intLength] = np.linspace(value[0], value[0] + (
+                        m_intLength * m_intStepSize) - m_intStepSize, num=m_intLength)
+                m_intPos += 16
+        elif intColType == 8:  # Wert Col
+            if m_intFunction == 109:  # ?  alle Werte nan?
+                for segment in segments:
+                    y = segment[0]
+                    m_intLength = segment[1]
+                    if m_isNAN == 255:
+                        resultarr[column_name][y:y + m_intLength] = np.nan
+                    else:
+                        None
+            elif m_intFunction == 110:  # alle Werte sind unterschiedlich
+                for segment in segments:
+                    y = segment[0]
+                    m_intLength = segment[1]
+                    values = getValueFromBinArray(
+                        data, m_intPos, m_intByteCount, arraycount=m_intLength)
+                    resultarr[column_name][y:y + m_intLength] = values[0]
+                    m_intPos = int(values[1])
+            elif m_intFunction == 111:  # Alle Werte gleich
+                value = getValueFromBin(
+                    data, m_intPos, m_intByteCount)
+                m_intPos = int(value[1])
+                step = getValueFromBin(
+                    data, m_intPos, m_intByteCount)
+                m_intPos = int(step[1])
+                for segment in segments:
+                    y = segment[0]
+                    m_intLength = segment[1]
+                    resultarr[column_name][y:y + m_intLength] = np.linspace(
+                        value[0], value[0] + (m_intLength * step[0]) - step[0], num=m_intLength)
+                None
+            elif m_intFunction == 112:  # Gruppen gleicher Werte
+                m_intGroupCount = 0
+                for segment in segments:
+                    y = segment[0]
+                    m_intSegmentLength = segment[1]
+                    valcount = 0
+                    while valcount < m_intSegmentLength:
+                        if m_intGroupCount == 0:
+                            m_intGroupCount = struct.unpack(
+                                '>B', data[m_intPos:m_intPos + 1])[0]
+                            m_intPos += 1
+                            if m_intGroupCount == 0:
+                                break
+                            value = getValueFromBin(
+                                data, m_intPos, m_intByteCount)
+                            m_intPos = int(value[1])
+                        length = m_intGroupCount
+                        if valcount + length > m_intSegmentLength:
+                            length = m_intSegmentLength - valcount
+                        m_intGroupCount -= length
+
+                        resultarr[column_name][y + valcount:y +
+                                               valcount + length] = value[0]
+                        valcount += length
+            else:
+                None
+            if cache is not None:
+                cache.put(key, fingerprint, resultarr[column_name])
+                if changed is not None:
+                    changed.add(column_name)
+        None
+    None
+    return resultarr
+
+
+def readPayload(raw, instrumentation=_DISABLED):
+    '''checks header and footer of a LoadData answer and decompresses the column blocks
+    returns (columns, rows, data) or False'''
+    prefix = bytes(raw[:32])
+    m_intPos = 0
+    m_intNmbResultSet = int(prefix[m_intPos])
+    m_intPos += 2
+    nextComma = m_intPos + prefix[m_intPos:].find(b',')
+    m_intLengthResultSet = int(prefix[m_intPos:nextComma])
+    m_intPos = nextComma + 1
+    intHeader = struct.unpack('>iiiiiiiii', raw[m_intPos:m_intPos + 36])
+    m_intPos += 36
+    intFooter = struct.unpack('>iiii', raw[-16:])
+    if(intHeader[0] != -1 or intHeader[1] != 463453 or intHeader[2] != 756543 or intHeader[3] != -1 or intFooter[0] != -1 or intFooter[1] != 463453 or intFooter[2] != 756543 or intFooter[3] != -1):
+        return False
+    if intHeader[4] != 2:
+        return False
+    m_intNmbCols = intHeader[5]
+    m_intNmbRows = intHeader[6]
+    m_int2 = intHeader[8]
+    if m_int2 != -1:
+        with instrumentation.span('decompress'):
+            data = zlib.decompress(raw[m_intPos:-16])
+    else:
+        data = raw[m_intPos:-16]
+    instrumentation.count('uncompressedBytes', len(data))
+    if(m_intNmbCols < 0 or m_intNmbRows < 0):
+        return False
+    return m_intNmbCols, m_intNmbRows, data
+
+
+def readSegments(data, pos, rows):
+    '''reads the segments of a column: returns ([[start, length, isNan], ...], position after the segments)
+    only segments with the flag 0 have values in the column data'''
+    segments = []
+    precount = 0
+    while precount < rows:
+        length = data[pos]
+        pos += 1
+        if length == 255:
+            length = struct.unpack('>I', data[pos:pos + 4])[0]
+            pos += 4
+        segments.append([precount, length, data[pos] != 0])
+        pos += 1
+        precount += length
+    return segments, pos
+
+
+def valueColumnEnd(data, pos, segments, function, byteCount):
+    '''position after the values of a value column, pos is the position after the function byte'''
+    rows = sum(length for start, length in segments)
+    if function == 110:
+        return pos + rows * byteCount
+    if function == 111:
+        return pos + 2 * byteCount
+    if function == 112:
+        count = 0
+        while count < rows:
+            groupCount = data[pos]
+            pos += 1
+            if groupCount == 0:
+                break
+            pos += byteCount
+            count += groupCount
+    return pos
+
+
+class ColumnCache:
+    ''' decoded value columns by key (e.g. mst id, nCT, nNmbX, row offset) and the fingerprint of their encoded bytes '''
+
+    def __init__(self, maxEntries=10000):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(encoded):
+        return hashlib.blake2b(encoded, digest_size=16).digest()
+
+    def get(self, key, fingerprint):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != fingerprint:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, fingerprint, values):
+        values = np.array(values, copy=True)
+        with self.lock:
+            self.entries[key] = (fingerprint, values)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def getValueFromBin(data, pos, bytecount, type=None):
+    result = [0.0, pos]
+    if bytecount == 8:
+        result[0] = struct.unpack('>d', data[pos:pos + bytecount])[0]
+        result[1] += bytecount
+    elif bytecount == 4:
+        result[0] = struct.unpack('>i', data[pos:pos + (bytecount)])[0]
+        result[1] += bytecount
+    elif bytecount == 2:
+        result[0] = struct.unpack('>h', data[pos:pos + (bytecount)])[0]
+        result[1] += bytecount
+    elif bytecount == 1:
+        result[0] = struct.unpack('>b', data[pos:pos + (bytecount)])[0]
+        result[1] += bytecount
+    return result
+
+
+def getValueFromBinArray(data, pos, bytecount, arraycount=1, type=None):
+    result = [0.0, pos]
+    if bytecount == 8:
+        result[0] = struct.unpack(
+            f'>{arraycount}d', data[pos:pos + (bytecount * arraycount)])
+        result[1] += bytecount * arraycount
+    elif bytecount == 4:
+        result[0] = struct.unpack(
+            f'>{arraycount}i', data[pos:pos + (bytecount * arraycount)])
+        result[1] += bytecount * arraycount
+    elif bytecount == 2:
+        result[0] = struct.unpack(
+            f'>{arraycount}h', data[pos:pos + (bytecount * arraycount)])
+        result[1] += bytecount * arraycount
+    elif bytecount == 1:
+        result[0] = struct.unpack(
+            f'>{arraycount}b', data[pos:pos + (bytecount * arraycount)])
+        result[1] += bytecount * arraycount
+    return result
+
+
+def decodeShared(inName, inSize, outName, dtype, rows, rowOffset, nmbX, offset):
+    '''decodes the payload in the shared memory inName into the rows rowOffset:rowOffset+nmbX
+    of the result array (rows x dtype) in the shared memory outName. Runs in a worker process'''
+    source = shared_memory.SharedMemory(name=inName)
+    target = shared_memory.SharedMemory(name=outName)
+    error = None
+    try:
+        ok = _decodeInto(source, inSize, target, dtype, rows, rowOffset, nmbX, offset)
+    except Exception as e:
+        # the traceback would keep the views of the shared memory alive
+        error = ValueError(f'Decoding the LoadData answer failed: {e!r}')
+    finally:
+        source.close()
+        target.close()
+    if error is not None:
+        raise error
+    return ok
+
+
+def releaseSharedMemory(sharedMemory):
+    '''closes and removes a shared memory block created by this process'''
+    sharedMemory.close()
+    try:
+        sharedMemory.unlink()
+    except FileNotFoundError:
+        None  # already released
+
+
+def _decodeInto(source, inSize, target, dtype, rows, rowOffset, nmbX, offset):
+    result = np.ndarray(rows, dtype=dtype, buffer=target.buf)
+    return decodeBinaryResult(source.buf[:inSize], dtype, result[rowOffset:rowOffset + nmbX], offset) is not False
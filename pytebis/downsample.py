@@ -0,0 +1,78 @@
+"""Client side downsampling of structured result arrays.
+
+All functions return a subset of the rows of the passed array (sorted by time),
+so the values stay exact and all columns share the timestamp column.
+"""
+import numpy as np
+
+
+def _valueNames(data):
+    return [name for name in data.dtype.names if name != 'timestamp']
+
+
+def _bucketEdges(n, buckets):
+    return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+
+def downsampleMinMax(data, buckets):
+    '''keeps the rows holding the min and max value of every column per bucket'''
+    if data is None or buckets <= 0 or len(data) <= buckets * 2:
+        return data
+    n = len(data)
+    edges = _bucketEdges(n, buckets)
+    bucketIds = np.repeat(np.arange(buckets), np.diff(edges))
+    firsts = edges[:-1][np.diff(edges) > 0]
+    keep = np.zeros(n, dtype=bool)
+    for name in _valueNames(data):
+        values = np.asarray(data[name], dtype=np.float64)
+        valid = ~np.isnan(values)
+        for sign in (1.0, -1.0):
+            # sort by bucket, then by value. NaN are moved to the end of the bucket
+            order = np.lexsort((np.where(valid, sign * values, np.inf), bucketIds))
+            first = order[np.searchsorted(bucketIds[order], bucketIds[firsts])]
+            keep[first[valid[first]]] = True
+    if not keep.any():
+        keep[[0, n - 1]] = True
+    return data[keep]
+
+
+def downsampleLTTB(data, points):
+    '''Largest-Triangle-Three-Buckets per column. The result is the union of the rows selected for each column'''
+    if data is None or points < 3 or len(data) <= points:
+        return data
+    n = len(data)
+    x = np.asarray(data['timestamp'], dtype=np.float64)
+    keep = np.zeros(n, dtype=bool)
+    for name in _valueNames(data):
+        y = np.asarray(data[name], dtype=np.float64)
+        valid = np.flatnonzero(~np.isnan(y))
+        if len(valid) <= points:
+            keep[valid] = True
+            continue
+        keep[valid[lttbIndices(x[valid], y[valid], points)]] = True
+    if not keep.any():
+        keep[[0, n - 1]] = True
+    return data[keep]
+
+
+def lttbIndices(x, y, points):
+    '''returns the indices selected by the Largest-Triangle-Three-Buckets algorithm'''
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    result = np.empty(points, dtype=np.int64)
+    result[0] = 0
+    result[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        nextStart, nextEnd = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if nextEnd <= nextStart:
+            nextEnd = nextStart + 1
+        avgX = x[nextStart:nextEnd].mean()
+        avgY = y[nextStart:nextEnd].mean()
+        area = np.abs((x[a] - avgX) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avgY - y[a]))
+        a = start + int(np.argmax(area))
+        result[i + 1] = a
+    return result
@@ -0,0 +1,269 @@
+"""A local stand-in for the Tebis socket server.
+
+The server speaks the Tebis protocol (request up to the closing ``<tebis>``,
+answer with the 16 byte header ``"version error size"``) and answers GetConfig
+and LoadData with payloads from pytebis.synthetic. It runs an asyncio loop in a
+background thread, so many clients can be served concurrently from one process::
+
+    with FakeTebisServer(msts=500, latency=0.05, bandwidth=50e6) as server:
+        teb = Tebis(configuration=server.configuration())
+        teb.getDataAsNP([1, 2, 3], start, end, 1)
+
+The values of a mst are a function of its id and the timestamps, so overlapping
+or repeated requests always deliver the same data. Latency, bandwidth limits and
+faults (error answers, dropped connections, stalls) can be set for all requests
+or queued for the next ones with injectFault().
+"""
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+import numpy as np
+from pytebis.synthetic import buildLoadDataPayload, buildConfigPayload
+
+FAULT_ERROR = 'error'  # header with error 1
+FAULT_DROP = 'drop'  # connection is closed after half of the payload
+FAULT_STALL = 'stall'  # no answer until the client disconnects
+FAULTS = (FAULT_ERROR, FAULT_DROP, FAULT_STALL)
+
+MST_DTYPE = [('ID', np.int64), ('MSTName', np.str_, 100), ('UNIT', np.str_, 10), ('MSTDesc', np.str_, 255),
+             ('Val1', np.float32), ('Val2', np.float32), ('Val3', np.float32), ('Val4', np.float32), ('Val5', np.float32)]
+VMST_DTYPE = [('ID', np.int64), ('MSTName', np.str_, 100), ('UNIT', np.str_, 10), ('MSTDesc', np.str_, 255),
+              ('Rate', np.int64), ('Formula', np.str_, 255), ('refresh', np.int64)]
+REDUCTION_DTYPE = [('ID', np.int64), ('Reduction', np.int64)]
+GROUP_DTYPE = [('ID', np.int64), ('GrpName', np.str_, 100), ('GroupDesc', np.str_, 100), ('Group1', np.str_, 100)]
+
+_TAG = re.compile(r'<(\w+)>(.*?)</\1>', re.S)
+
+
+def makeMsts(count, start=1):
+    '''structured array with count msts named mst<id>'''
+    msts = np.zeros(count, dtype=MST_DTYPE)
+    msts['ID'] = np.arange(start, start + count)
+    msts['MSTName'] = [f'mst{id}' for id in msts['ID']]
+    msts['UNIT'] = 'bar'
+    msts['MSTDesc'] = [f'synthetic signal {id}' for id in msts['ID']]
+    return msts
+
+
+def syntheticValues(id, timestamps):
+    '''deterministic values for the mst id at the timestamps (ms). The pattern depends on id % 4:
+    0 noise, 1 steps, 2 constant, 3 sine with gaps (NaN)'''
+    seconds = timestamps // 1000
+    pattern = id % 4
+    if pattern == 0:
+        return 50.0 + ((seconds * 2654435761 + id * 40503) % 2000 - 1000) / 100.0
+    if pattern == 1:
+        return ((seconds // 100 + id) % 5).astype(np.float64)
+    if pattern == 2:
+        return np.full(len(timestamps), float(id))
+    values = np.round(np.sin(seconds / 600.0 + id) * 100.0, 2)
+    values[(seconds // 60 + id) % 10 == 0] = np.nan
+    return values
+
+
+def parseRequest(request):
+    '''returns the tags of a request as dict'''
+    return dict(_TAG.findall(request))
+
+
+class FakeTebisServer:
+    ''' Tebis protocol server for tests, benchmarks and load tests '''
+
+    def __init__(self, msts=100, vmsts=None, reductions=(1000, 10000, 60000, 600000), groups=None, series=None,
+                 host='127.0.0.1', port=0, latency=0.0, jitter=0.0, bandwidth=None, errorRate=0.0, dropRate=0.0,
+                 stallRate=0.0, compress=True, seed=None):
+        '''msts: number or structured array (MST_DTYPE), series: callable(id, timestamps) -> float array
+        latency/jitter in seconds, bandwidth in bytes per second, the rates are probabilities per request'''
+        self.msts = makeMsts(msts) if isinstance(msts, int) else msts
+        self.vmsts = np.zeros(0, dtype=VMST_DTYPE) if vmsts is None else vmsts
+        self.reductions = np.zeros(len(reductions), dtype=REDUCTION_DTYPE)
+        self.reductions['ID'] = np.arange(1, len(reductions) + 1)
+        self.reductions['Reduction'] = reductions
+        self.groups = np.zeros(0, dtype=GROUP_DTYPE) if groups is None else groups
+        self.series = syntheticValues if series is None else series
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.errorRate = errorRate
+        self.dropRate = dropRate
+        self.stallRate = stallRate
+        self.compress = compress
+        self.random = random.Random(seed)
+        self.faults = []
+        self.lock = threading.Lock()
+        self.stats = {'connections': 0, 'active': 0, 'maxActive': 0, 'GetConfig': 0, 'LoadData': 0,
+                      'bytesSent': 0, 'faults': 0}
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.started = threading.Event()
+
+    # region lifecycle
+
+    def start(self):
+        self.thread = threading.Thread(target=self.__run, name='FakeTebisServer', daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def stop(self):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def __run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.__handle, self.host, self.port, limit=2 ** 20, backlog=1024))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            # stalled or slow connections are cancelled
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def configuration(self, **kwargs):
+        '''Tebis configuration for this server, kwargs are added'''
+        conf = {'host': self.host, 'port': self.port}
+        conf.update(kwargs)
+        return conf
+
+    # endregion
+
+    def injectFault(self, fault, count=1):
+        '''the next count requests fail with fault (error, drop or stall)'''
+        if fault not in FAULTS:
+            raise ValueError(f'Unknown fault {fault}')
+        with self.lock:
+            self.faults.extend([fault] * count)
+
+    def getStats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def __count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+            if name == 'active' and self.stats['active'] > self.stats['maxActive']:
+                self.stats['maxActive'] = self.stats['active']
+
+    def __nextFault(self):
+        with self.lock:
+            if self.faults:
+                return self.faults.pop(0)
+            draw = self.random.random()
+        for fault, rate in ((FAULT_ERROR, self.errorRate), (FAULT_DROP, self.dropRate), (FAULT_STALL, self.stallRate)):
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    # region payloads
+
+    def configPayload(self, type):
+        tables = {'Msts': self.msts, 'VMsts': self.vmsts, 'RsRedCTs': self.reductions, 'Grps': self.groups}
+        if type not in tables:
+            return None
+        return buildConfigPayload(tables[type])
+
+    def loadDataPayload(self, ids, nCT, nNmbX, timeR):
+        known = set(self.msts['ID'].tolist()) | set(self.vmsts['ID'].tolist())
+        if nCT not in self.reductions['Reduction'] or any(id not in known for id in ids):
+            return None
+        timestamps = timeR - np.arange(nNmbX - 1, -1, -1, dtype=np.int64) * nCT
+        columns = [np.asarray(self.series(id, timestamps), dtype=np.float64) for id in ids]
+        return buildLoadDataPayload(columns, timeR, nCT, compress=self.compress)
+
+    def answer(self, request):
+        '''returns the payload for the request or None (error answer)'''
+        tags = parseRequest(request)
+        procedure = tags.get('szProcedure')
+        if procedure == 'GetConfig':
+            self.__count('GetConfig')
+            return self.configPayload(tags.get('szTebObjType'))
+        if procedure == 'LoadData':
+            self.__count('LoadData')
+            try:
+                ids = [int(id) for id in tags['arrMsts'].split(',')]
+                nNmbX, nCT, timeR = int(tags['nNmbX']), int(tags['nCT']), int(tags['nTimeR'])
+            except (KeyError, ValueError):
+                return None
+            return self.loadDataPayload(ids, nCT, nNmbX, timeR)
+        return None
+
+    # endregion
+
+    async def __handle(self, reader, writer):
+        self.__count('connections')
+        self.__count('active')
+        try:
+            request = b''
+            while request.count(b'<tebis>') < 2:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    return
+                request += chunk
+            started = time.monotonic()
+            payload = await self.loop.run_in_executor(None, self.answer, request.decode('latin-1'))
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+            delay -= time.monotonic() - started
+            if delay > 0:
+                await asyncio.sleep(delay)
+            fault = self.__nextFault()
+            if fault is not None:
+                self.__count('faults')
+            if fault == FAULT_STALL:
+                await reader.read()
+                return
+            if payload is None or fault == FAULT_ERROR:
+                writer.write(b'1 1 0'.ljust(16, b'\x00'))
+                await writer.drain()
+                return
+            writer.write(('1 0 ' + str(len(payload))).encode('ascii').ljust(16, b'\x00'))
+            if fault == FAULT_DROP:
+                payload = payload[:len(payload) // 2]
+            await self.__send(writer, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logging.getLogger('pytebis').debug('FakeTebisServer: client disconnected')
+        finally:
+            self.__count('active', -1)
+            writer.close()
+
+    async def __send(self, writer, payload):
+        if self.bandwidth is None:
+            writer.write(payload)
+            await writer.drain()
+        else:
+            chunkSize = max(1024, int(self.bandwidth / 100))
+            for i in range(0, len(payload), chunkSize):
+                chunk = payload[i:i + chunkSize]
+                writer.write(chunk)
+                await writer.drain()
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+        self.__count('bytesSent', len(payload))
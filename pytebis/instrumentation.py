@@ -0,0 +1,125 @@
+"""Timing and byte counters for the Tebis requests.
+
+Tebis reports the phases of a request (connect, send, wait, receive, decompress,
+decode, convert) as spans and the transferred sizes as counters. When the
+instrumentation is disabled span() returns a shared no-op context and count()
+returns immediately.
+
+The results are collected in a TebisStats registry (by default the module wide
+``stats``), can be passed to hook callbacks and to an OpenTelemetry compatible
+tracer (anything with ``start_as_current_span(name, attributes=...)``).
+"""
+import threading
+import time
+
+
+class TebisStats:
+    ''' thread safe in-process registry of counters and timers '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def addTime(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = {'count': 1, 'total': seconds, 'max': seconds}
+            else:
+                timer['count'] += 1
+                timer['total'] += seconds
+                if seconds > timer['max']:
+                    timer['max'] = seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': dict((name, dict(timer)) for name, timer in self.timers.items()),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+
+
+stats = TebisStats()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def setAttribute(self, key, value):
+        None
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, instrumentation, name, attributes):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.otelSpan = None
+
+    def __enter__(self):
+        tracer = self.instrumentation.tracer
+        if tracer is not None:
+            self.otelContext = tracer.start_as_current_span(self.name, attributes=self.attributes)
+            self.otelSpan = self.otelContext.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        self.instrumentation.stats.addTime(self.name, self.duration)
+        for hook in self.instrumentation.hooks:
+            hook('span', self.name, self.duration, self.attributes)
+        if self.otelSpan is not None:
+            self.otelContext.__exit__(*exc)
+        return False
+
+    def setAttribute(self, key, value):
+        self.attributes[key] = value
+        if self.otelSpan is not None:
+            self.otelSpan.set_attribute(key, value)
+
+
+class Instrumentation:
+    ''' collects the timings and counters of a Tebis instance '''
+
+    def __init__(self, enabled=False, registry=None, tracer=None):
+        self.enabled = enabled
+        self.stats = stats if registry is None else registry
+        self.tracer = tracer
+        self.hooks = []
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name, attributes)
+
+    def count(self, name, value=1, **attributes):
+        if not self.enabled:
+            return
+        self.stats.add(name, value)
+        for hook in self.hooks:
+            hook('count', name, value, attributes)
+
+    def addHook(self, callback):
+        ''' callback(event, name, value, attributes) with event 'span' (value = seconds) or 'count' '''
+        self.hooks.append(callback)
+
+    def removeHook(self, callback):
+        self.hooks.remove(callback)
@@ -0,0 +1,286 @@
+"""Concurrency budget and rate limits per Tebis server.
+
+All Tebis instances of a process which talk to the same server (host, port)
+share one HostLimiter (see getLimiter). A request needs a slot before it
+connects and gives it back after the answer is received:
+
+- 'maxConcurrent' requests run at the same time
+- 'requestsPerSecond' and 'bytesPerSecond' are token buckets, 'burst' seconds
+  of the rate can be used at once. The bytes of a request (sent and received)
+  are booked after the answer, a large answer delays the following requests.
+
+Waiting requests get the slots by priority (lower first, 'interactive' before
+'bulk'), requests with the same priority in the order they arrived. The limiter
+can be used from threads (slot / acquire) and from asyncio tasks (slotAsync /
+acquireAsync) at the same time.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pytebis.lazyloader import LazyLoader
+
+# only needed by the asyncio interface, import pytebis.tebis stays fast
+asyncio = LazyLoader('asyncio', globals(), 'asyncio')
+
+PRIORITIES = {'interactive': 0, 'normal': 5, 'bulk': 10}
+
+
+def parsePriority(priority):
+    '''priority name or number -> number, lower runs first'''
+    if isinstance(priority, str):
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority {priority}')
+        return PRIORITIES[priority]
+    return int(priority)
+
+
+class _Waiter:
+    ''' a waiting thread or asyncio task '''
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def reset(self):
+        '''called under the lock before the waiter checks its state, a later wake() is not lost'''
+        if self.loop is None:
+            self.event.clear()
+        elif self.future.done():
+            self.future = self.loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.__setResult)
+
+    def __setResult(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class HostLimiter:
+    ''' priority semaphore with token buckets for the requests and bytes of one server '''
+
+    def __init__(self, maxConcurrent=None, requestsPerSecond=None, bytesPerSecond=None, burst=1.0, clock=time.monotonic):
+        self.lock = threading.Lock()
+        self.clock = clock
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.active = 0
+        self.stats = {'requests': 0, 'bytes': 0, 'waits': 0, 'waitSeconds': 0.0, 'timeouts': 0}
+        self.configure(maxConcurrent, requestsPerSecond, bytesPerSecond, burst)
+
+    def configure(self, maxConcurrent=None, requestsPerSecond=None, bytesPerSecond=None, burst=1.0):
+        '''changes the limits, None is unlimited'''
+        with self.lock:
+            self.maxConcurrent = maxConcurrent
+            self.requestsPerSecond = requestsPerSecond
+            self.bytesPerSecond = bytesPerSecond
+            self.burst = burst
+            self.updated = self.clock()
+            self.requestTokens = self.__requestCapacity()
+            self.byteTokens = self.__byteCapacity()
+            self.__dispatch()
+
+    def __requestCapacity(self):
+        return None if self.requestsPerSecond is None else max(1.0, self.requestsPerSecond * self.burst)
+
+    def __byteCapacity(self):
+        return None if self.bytesPerSecond is None else self.bytesPerSecond * self.burst
+
+    def __refill(self):
+        now = self.clock()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.requestsPerSecond is not None:
+            self.requestTokens = min(self.__requestCapacity(), self.requestTokens + elapsed * self.requestsPerSecond)
+        if self.bytesPerSecond is not None:
+            self.byteTokens = min(self.__byteCapacity(), self.byteTokens + elapsed * self.bytesPerSecond)
+
+    def __delay(self):
+        '''seconds until the buckets allow the next request, 0 if they allow it now'''
+        delay = 0.0
+        if self.requestsPerSecond is not None and self.requestTokens < 1.0:
+            delay = (1.0 - self.requestTokens) / self.requestsPerSecond
+        if self.bytesPerSecond is not None and self.byteTokens < 0:
+            delay = max(delay, -self.byteTokens / self.bytesPerSecond)
+        return delay
+
+    def __hasSlot(self):
+        return self.maxConcurrent is None or self.active < self.maxConcurrent
+
+    def __take(self):
+        self.active += 1
+        self.stats['requests'] += 1
+        if self.requestsPerSecond is not None:
+            self.requestTokens -= 1.0
+
+    def __dispatch(self, caller=None):
+        '''grants slots to the first waiters, returns the seconds until the buckets allow the next one'''
+        self.__refill()
+        while self.waiters:
+            head = self.waiters[0][2]
+            if head.cancelled:
+                heapq.heappop(self.waiters)
+                continue
+            if not self.__hasSlot():
+                return None
+            delay = self.__delay()
+            if delay > 0:
+                # the head may sleep without a timeout, it polls again and waits only for the delay
+                if head is not caller:
+                    head.wake()
+                return delay
+            heapq.heappop(self.waiters)
+            self.__take()
+            head.granted = True
+            head.wake()
+        return None
+
+    def __enqueue(self, priority, loop=None):
+        '''takes a slot at once (None) or returns a queued waiter'''
+        with self.lock:
+            self.__refill()
+            if not self.waiters and self.__hasSlot() and self.__delay() == 0:
+                self.__take()
+                return None
+            waiter = _Waiter(loop)
+            heapq.heappush(self.waiters, (parsePriority(priority), next(self.sequence), waiter))
+            self.stats['waits'] += 1
+            return waiter
+
+    def __poll(self, waiter):
+        '''grants due slots, returns (granted, seconds to wait at most)'''
+        with self.lock:
+            waiter.reset()
+            delay = self.__dispatch(waiter)
+            return waiter.granted, delay
+
+    def __cancel(self, waiter, started):
+        '''gives up waiting, returns True if the slot was granted meanwhile'''
+        with self.lock:
+            self.stats['waitSeconds'] += self.clock() - started
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.stats['timeouts'] += 1
+            self.__dispatch()
+            return False
+
+    def acquire(self, priority='interactive', timeout=None):
+        '''waits for a slot, returns False if the timeout (seconds) passed first'''
+        waiter = self.__enqueue(priority)
+        if waiter is None:
+            return True
+        started = self.clock()
+        end = None if timeout is None else started + timeout
+        while True:
+            granted, delay = self.__poll(waiter)
+            if granted:
+                break
+            wait = delay
+            if end is not None:
+                remaining = end - self.clock()
+                if remaining <= 0:
+                    return self.__cancel(waiter, started)
+                wait = remaining if wait is None else min(wait, remaining)
+            waiter.event.wait(wait)
+        with self.lock:
+            self.stats['waitSeconds'] += self.clock() - started
+        return True
+
+    async def acquireAsync(self, priority='interactive', timeout=None):
+        '''acquire() for asyncio tasks, the event loop is not blocked'''
+        waiter = self.__enqueue(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return True
+        started = self.clock()
+        end = None if timeout is None else started + timeout
+        try:
+            while True:
+                granted, delay = self.__poll(waiter)
+                if granted:
+                    break
+                wait = delay
+                if end is not None:
+                    remaining = end - self.clock()
+                    if remaining <= 0:
+                        return self.__cancel(waiter, started)
+                    wait = remaining if wait is None else min(wait, remaining)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            # a task cancelled while waiting must not keep a granted slot
+            if self.__cancel(waiter, started):
+                self.release()
+            raise
+        with self.lock:
+            self.stats['waitSeconds'] += self.clock() - started
+        return True
+
+    def release(self, bytes=0):
+        '''gives the slot back and books the transferred bytes'''
+        with self.lock:
+            self.active -= 1
+            self.stats['bytes'] += bytes
+            if self.bytesPerSecond is not None:
+                self.__refill()
+                self.byteTokens -= bytes
+            self.__dispatch()
+
+    @contextmanager
+    def slot(self, priority='interactive', timeout=None):
+        '''with limiter.slot('bulk') as slot: ... slot['bytes'] = transferred bytes'''
+        if not self.acquire(priority, timeout):
+            raise TimeoutError('Waiting for a request slot timed out')
+        usage = {'bytes': 0}
+        try:
+            yield usage
+        finally:
+            self.release(usage['bytes'])
+
+    @asynccontextmanager
+    async def slotAsync(self, priority='interactive', timeout=None):
+        if not await self.acquireAsync(priority, timeout):
+            raise TimeoutError('Waiting for a request slot timed out')
+        usage = {'bytes': 0}
+        try:
+            yield usage
+        finally:
+            self.release(usage['bytes'])
+
+    def status(self):
+        with self.lock:
+            status = dict(self.stats)
+            status['active'] = self.active
+            status['waiting'] = sum(1 for entry in self.waiters if not entry[2].cancelled)
+            return status
+
+
+limiters = {}
+limitersLock = threading.Lock()
+
+
+def getLimiter(host, port, maxConcurrent=None, requestsPerSecond=None, bytesPerSecond=None, burst=1.0):
+    '''the shared limiter of a server, the limits are only used when it is created'''
+    with limitersLock:
+        limiter = limiters.get((host, port))
+        if limiter is None:
+            limiter = HostLimiter(maxConcurrent, requestsPerSecond, bytesPerSecond, burst)
+            limiters[(host, port)] = limiter
+        return limiter
+
+
+def removeLimiter(host, port):
+    with limitersLock:
+        limiters.pop((host, port), None)
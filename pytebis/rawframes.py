@@ -0,0 +1,78 @@
+"""Framing of raw LoadData answers for client side decoders.
+
+streamDataRAW/iterDataRAW pass the answers of the Tebis server through without
+decoding. Every LoadData request of the load plan becomes one frame::
+
+    header (52 bytes, big endian)
+        0  4s   magic b'TBRW'
+        4  B    version (1)
+        5  B    flags (FLAG_LAST on the last frame)
+        6  H    reserved (0)
+        8  I    index of the frame
+        12 I    number of frames
+        16 I    nIds, number of msts in the frame
+        20 I    columnOffset, position of the first mst in the requested msts
+        24 I    rowOffset, position of the first row in the whole result
+        28 I    nNmbX, rows of the frame
+        32 I    nCT, reduction in ms
+        36 q    timeR, timestamp (ms) of the last row
+        44 Q    payload length
+    ids      nIds x int64 big endian
+    payload  LoadData answer as sent by the server ("1,<length>," + binary data)
+
+The frames are written in index order, a consumer can decode them one after
+the other and put the columns at columnOffset/rowOffset of its result.
+"""
+import struct
+
+MAGIC = b'TBRW'
+VERSION = 1
+FLAG_LAST = 1
+
+FRAME_HEADER = struct.Struct('>4sBBHIIIIIIIqQ')
+
+
+def buildFrame(index, count, ids, columnOffset, rowOffset, nNmbX, nCT, timeR, payload):
+    '''header + ids + payload as one bytes object'''
+    flags = FLAG_LAST if index == count - 1 else 0
+    header = FRAME_HEADER.pack(MAGIC, VERSION, flags, 0, index, count, len(ids), columnOffset, rowOffset,
+                               nNmbX, int(nCT), int(timeR), len(payload))
+    return b''.join((header, struct.pack(f'>{len(ids)}q', *[int(id) for id in ids]), payload))
+
+
+def parseFrame(buffer, offset=0):
+    '''reads the frame at offset of buffer (bytes-like)
+    returns (dict with the header fields and 'ids', payload memoryview, offset of the next frame)'''
+    view = memoryview(buffer)
+    if len(view) - offset < FRAME_HEADER.size:
+        raise ValueError('Incomplete frame header')
+    (magic, version, flags, _, index, count, nIds, columnOffset, rowOffset, nNmbX, nCT, timeR,
+     length) = FRAME_HEADER.unpack_from(view, offset)
+    if magic != MAGIC:
+        raise ValueError(f'Invalid frame magic {magic!r}')
+    if version != VERSION:
+        raise ValueError(f'Unsupported frame version {version}')
+    start = offset + FRAME_HEADER.size
+    ids = list(struct.unpack_from(f'>{nIds}q', view, start))
+    start += nIds * 8
+    if len(view) < start + length:
+        raise ValueError('Incomplete frame payload')
+    header = {'index': index, 'count': count, 'last': bool(flags & FLAG_LAST), 'ids': ids,
+              'columnOffset': columnOffset, 'rowOffset': rowOffset, 'nNmbX': nNmbX, 'nCT': nCT, 'timeR': timeR}
+    return header, view[start:start + length], start + length
+
+
+def iterFrames(buffer):
+    '''yields (header, payload) of all frames in buffer'''
+    offset = 0
+    while offset < len(buffer):
+        header, payload, offset = parseFrame(buffer, offset)
+        yield header, payload
+
+
+def writeFrame(out, frame):
+    '''writes a frame to a socket (sendall) or a binary stream (write)'''
+    if hasattr(out, 'sendall'):
+        out.sendall(frame)
+    else:
+        out.write(frame)
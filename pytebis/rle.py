@@ -0,0 +1,332 @@
+"""Run length encoded results for slow changing signals.
+
+The LoadData answers already describe most columns as runs: NaN segments,
+groups of equal values (function 112) and linear segments (function 111).
+decodeRLE() keeps this structure instead of expanding it into dense float32
+arrays, a setpoint that changes ten times a month needs ten runs instead of
+2.6 million values at 1s.
+
+A RLESeries is a table of runs. Run i covers the rows starts[i]:starts[i] + lengths[i]
+with the values values[i] + k * steps[i] (k = 0 .. lengths[i] - 1); NaN runs have
+the value NaN. The runs are sorted, don't overlap and cover all rows. Row r has
+the timestamp timestamp + r * nCT (ms, UTC).
+
+Slicing, the aggregations and aggregate() work on the runs, toDense() builds the
+float array on demand.
+"""
+import struct
+import numpy as np
+from pytebis.aggregate import AGGREGATIONS
+from pytebis.decoder import readPayload, readSegments, getValueFromBin
+
+_VALUE_FORMATS = {8: '>f8', 4: '>i4', 2: '>i2', 1: '>i1'}
+
+
+class RLESeries:
+    ''' run length encoded float column '''
+
+    def __init__(self, starts, lengths, values, steps=None, timestamp=0, nCT=1000, name=None):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.steps = np.zeros(len(self.starts)) if steps is None else np.asarray(steps, dtype=np.float64)
+        self.timestamp = int(timestamp)
+        self.nCT = int(nCT)
+        self.name = name
+
+    @classmethod
+    def fromDense(cls, values, timestamp=0, nCT=1000, name=None):
+        '''runs of equal values (NaN equals NaN) of a dense array'''
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return cls([], [], [], timestamp=timestamp, nCT=nCT, name=name)
+        isNan = np.isnan(values)
+        change = (values[1:] != values[:-1]) & ~(isNan[1:] & isNan[:-1])
+        starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+        lengths = np.diff(np.concatenate((starts, [len(values)])))
+        return cls(starts, lengths, values[starts], timestamp=timestamp, nCT=nCT, name=name)
+
+    @classmethod
+    def concatenate(cls, series, name=None):
+        '''joins consecutive series (same nCT) to one series'''
+        series = [s for s in series if len(s) > 0]
+        if len(series) == 0:
+            return cls([], [], [], name=name)
+        offsets = np.cumsum([0] + [len(s) for s in series[:-1]])
+        return cls(np.concatenate([s.starts + offset for s, offset in zip(series, offsets)]),
+                   np.concatenate([s.lengths for s in series]), np.concatenate([s.values for s in series]),
+                   np.concatenate([s.steps for s in series]), series[0].timestamp, series[0].nCT,
+                   series[0].name if name is None else name).normalize()
+
+    def normalize(self):
+        '''merges neighbouring constant runs with the same value'''
+        if len(self.starts) < 2:
+            return self
+        constant = self.steps == 0
+        isNan = np.isnan(self.values)
+        same = (self.values[1:] == self.values[:-1]) | (isNan[1:] & isNan[:-1])
+        merge = same & constant[1:] & constant[:-1]
+        if not merge.any():
+            return self
+        keep = np.concatenate(([True], ~merge))
+        first = np.flatnonzero(keep)
+        lengths = np.add.reduceat(self.lengths, first)
+        return RLESeries(self.starts[first], lengths, self.values[first], self.steps[first], self.timestamp, self.nCT, self.name)
+
+    def __len__(self):
+        if len(self.starts) == 0:
+            return 0
+        return int(self.starts[-1] + self.lengths[-1])
+
+    @property
+    def runs(self):
+        return len(self.starts)
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.lengths.nbytes + self.values.nbytes + self.steps.nbytes
+
+    def __repr__(self):
+        return f"RLESeries({self.name}, rows={len(self)}, runs={self.runs})"
+
+    def timestamps(self):
+        return self.timestamp + np.arange(len(self), dtype=np.int64) * self.nCT
+
+    def toDense(self, dtype=np.float32):
+        run = np.repeat(np.arange(self.runs), self.lengths)
+        position = np.arange(len(self)) - self.starts[run]
+        return (self.values[run] + self.steps[run] * position).astype(dtype)
+
+    def split(self, rows):
+        '''cuts the runs at the rows, e.g. at window starts'''
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[(rows > 0) & (rows < len(self))]
+        breaks = np.union1d(self.starts, rows)
+        run = np.searchsorted(self.starts, breaks, side='right') - 1
+        values = self.values[run] + self.steps[run] * (breaks - self.starts[run])
+        lengths = np.diff(np.concatenate((breaks, [len(self)])))
+        return RLESeries(breaks, lengths, values, self.steps[run], self.timestamp, self.nCT, self.name)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('RLESeries index out of range')
+            run = np.searchsorted(self.starts, key, side='right') - 1
+            return float(self.values[run] + self.steps[run] * (key - self.starts[run]))
+        if not isinstance(key, slice):
+            raise TypeError('RLESeries indices must be integers or slices')
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError('RLESeries slices must have the step 1')
+        stop = max(start, stop)
+        pieces = self.split([start, stop])
+        inside = (pieces.starts >= start) & (pieces.starts < stop)
+        return RLESeries(pieces.starts[inside] - start, pieces.lengths[inside], pieces.values[inside],
+                         pieces.steps[inside], self.timestamp + start * self.nCT, self.nCT, self.name)
+
+    def changes(self):
+        '''rows where the value differs from the previous row as structured array (timestamp, value)
+        the first row is always included, a change to or from NaN is a change, too. Linear runs change in every row'''
+        dtype = [('timestamp', np.int64), ('value', np.float64)]
+        if self.runs == 0:
+            return np.empty(0, dtype=dtype)
+        linear = (self.steps != 0) & ~np.isnan(self.values)
+        counts = np.where(linear, self.lengths, 1)
+        run = np.repeat(np.arange(self.runs), counts)
+        position = np.arange(len(run)) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = self.starts[run] + position
+        values = self.values[run] + self.steps[run] * position
+        isNan = np.isnan(values)
+        changed = np.concatenate(([True], (values[1:] != values[:-1]) & ~(isNan[1:] & isNan[:-1])))
+        result = np.empty(int(changed.sum()), dtype=dtype)
+        result['timestamp'] = self.timestamp + rows[changed] * self.nCT
+        result['value'] = values[changed]
+        return result
+
+    # region aggregations
+
+    def __runStats(self):
+        valid = ~np.isnan(self.values)
+        last = self.values + self.steps * (self.lengths - 1)
+        sums = np.where(valid, self.lengths * self.values + self.steps * self.lengths * (self.lengths - 1) / 2.0, 0.0)
+        return valid, last, sums
+
+    def count(self):
+        return int(self.lengths[~np.isnan(self.values)].sum())
+
+    def sum(self):
+        return float(self.__runStats()[2].sum())
+
+    def mean(self):
+        count = self.count()
+        return self.sum() / count if count > 0 else np.nan
+
+    def min(self):
+        valid, last, sums = self.__runStats()
+        return float(np.min(np.fmin(self.values, last)[valid])) if valid.any() else np.nan
+
+    def max(self):
+        valid, last, sums = self.__runStats()
+        return float(np.max(np.fmax(self.values, last)[valid])) if valid.any() else np.nan
+
+    def first(self):
+        valid = ~np.isnan(self.values)
+        return float(self.values[valid][0]) if valid.any() else np.nan
+
+    def last(self):
+        valid, last, sums = self.__runStats()
+        return float(last[valid][-1]) if valid.any() else np.nan
+
+    def integral(self):
+        return self.sum() * (self.nCT / 1000.0)
+
+    def aggregate(self, every, funcs=('mean',), origin=0):
+        '''like aggregateSeries per window of every (ms), calculated on the runs
+        returns a structured array with the window start as timestamp and a column <name>_<func> per function'''
+        for func in funcs:
+            if func not in AGGREGATIONS:
+                raise ValueError(f'Unknown aggregation {func}')
+        name = 'value' if self.name is None else self.name
+        dtype = [('timestamp', np.int64)] + [(f'{name}_{func}', np.int64 if func == 'count' else np.float64) for func in funcs]
+        rows = len(self)
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        first = (self.timestamp - origin) // every
+        last = (self.timestamp + (rows - 1) * self.nCT - origin) // every
+        windows = np.arange(first, last + 1, dtype=np.int64)
+        # first row of every window
+        windowRows = np.maximum(0, -((self.timestamp - origin - windows * every) // self.nCT))
+        pieces = self.split(windowRows)
+        pieceWindow = (pieces.timestamp + pieces.starts * self.nCT - origin) // every
+        starts = np.flatnonzero(np.concatenate(([True], pieceWindow[1:] != pieceWindow[:-1])))
+        valid, lastValues, sums = pieces.__runStats()
+        count = np.add.reduceat(np.where(valid, pieces.lengths, 0), starts)
+        empty = count == 0
+        result = np.empty(len(starts), dtype=dtype)
+        result['timestamp'] = pieceWindow[starts] * every + origin
+        positions = np.arange(pieces.runs)
+        for func in funcs:
+            column = f'{name}_{func}'
+            if func == 'count':
+                result[column] = count
+                continue
+            if func in ('sum', 'mean', 'integral'):
+                total = np.add.reduceat(sums, starts)
+                if func == 'sum':
+                    out = total
+                elif func == 'mean':
+                    out = total / np.maximum(count, 1)
+                else:
+                    out = total * (self.nCT / 1000.0)
+            elif func == 'min':
+                out = np.fmin.reduceat(np.fmin(pieces.values, lastValues), starts)
+            elif func == 'max':
+                out = np.fmax.reduceat(np.fmax(pieces.values, lastValues), starts)
+            elif func == 'first':
+                index = np.minimum.reduceat(np.where(valid, positions, pieces.runs), starts)
+                out = pieces.values[np.minimum(index, pieces.runs - 1)]
+            elif func == 'last':
+                index = np.maximum.reduceat(np.where(valid, positions, -1), starts)
+                out = lastValues[np.maximum(index, 0)]
+            out = np.array(out, dtype=np.float64)
+            out[empty] = np.nan
+            result[column] = out
+        return result
+
+    # endregion
+
+
+def _streamRuns(runStarts, runValues, segments, rows):
+    '''maps runs in the value stream (the concatenated data segments) to rows, NaN segments become NaN runs'''
+    segments = np.array(segments, dtype=np.int64).reshape(-1, 3)
+    data = segments[segments[:, 2] == 0]
+    dataStream = np.concatenate(([0], np.cumsum(data[:, 1])[:-1])) if len(data) > 0 else np.zeros(0, dtype=np.int64)
+    starts = []
+    values = []
+    if len(data) > 0 and len(runStarts) > 0:
+        total = int(data[:, 1].sum())
+        breaks = np.union1d(runStarts, dataStream)
+        breaks = breaks[breaks < total]
+        value = np.asarray(runValues, dtype=np.float64)[np.searchsorted(runStarts, breaks, side='right') - 1]
+        segment = np.searchsorted(dataStream, breaks, side='right') - 1
+        starts.append(data[segment, 0] + breaks - dataStream[segment])
+        values.append(value)
+    nan = segments[segments[:, 2] != 0]
+    starts.append(nan[:, 0])
+    values.append(np.full(len(nan), np.nan))
+    starts = np.concatenate(starts)
+    values = np.concatenate(values)
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    lengths = np.diff(np.concatenate((starts, [rows])))
+    keep = lengths > 0
+    return RLESeries(starts[keep], lengths[keep], values[order][keep])
+
+
+def decodeRLEColumn(data, pos, rows):
+    '''decodes one column at pos, returns (kind, RLESeries or (timestamp, nCT), position after the column)'''
+    colType = struct.unpack('>hh', data[pos:pos + 4])[1]
+    segments, pos = readSegments(data, pos + 4, rows)
+    byteCount = data[pos]
+    function = data[pos + 1]
+    pos += 2
+    dataSegments = [segment for segment in segments if not segment[2]]
+    total = sum(segment[1] for segment in dataSegments)
+    if colType == 301:
+        timestamp, step = struct.unpack('>qq', data[pos:pos + 16])
+        return 'timestamp', (timestamp, step), pos + 16 * len(dataSegments)
+    if function == 110:
+        values = np.frombuffer(data, dtype=_VALUE_FORMATS[byteCount], count=total, offset=pos).astype(np.float64)
+        pos += total * byteCount
+        runStarts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1)) if total > 0 else np.zeros(0, dtype=np.int64)
+        series = _streamRuns(runStarts, values[runStarts], segments, rows)
+    elif function == 111:
+        value, pos = getValueFromBin(data, pos, byteCount)
+        step, pos = getValueFromBin(data, pos, byteCount)
+        # every data segment starts again at value
+        series = _streamRuns(np.zeros(1, dtype=np.int64), [value], segments, rows)
+        series.steps[~np.isnan(series.values)] = step
+    elif function == 112:
+        runStarts = []
+        runValues = []
+        count = 0
+        while count < total:
+            groupCount = data[pos]
+            pos += 1
+            if groupCount == 0:
+                break
+            value, pos = getValueFromBin(data, pos, byteCount)
+            runStarts.append(count)
+            runValues.append(value)
+            count += groupCount
+        series = _streamRuns(np.array(runStarts, dtype=np.int64), runValues, segments, rows)
+    else:
+        # 109: no values, the data segments stay NaN, too
+        series = RLESeries([0] if rows > 0 else [], [rows] if rows > 0 else [], [np.nan] if rows > 0 else [])
+    return 'value', series.normalize(), pos
+
+
+def decodeRLE(raw, names=None):
+    '''decodes a LoadData answer into RLESeries without dense arrays
+    returns a list with one RLESeries per value column (names are set if given)'''
+    payload = readPayload(raw)
+    if payload is False:
+        return False
+    columns, rows, data = payload
+    pos = 0
+    timestamp, nCT = 0, 1000
+    result = []
+    for i in range(columns):
+        kind, column, pos = decodeRLEColumn(data, pos, rows)
+        if kind == 'timestamp':
+            timestamp, nCT = column
+            continue
+        result.append(column)
+    for i, series in enumerate(result):
+        series.timestamp = timestamp
+        series.nCT = nCT
+        if names is not None:
+            series.name = names[i]
+    return result
@@ -0,0 +1,281 @@
+"""Prefetching of recurring queries.
+
+Reports often run the same query at fixed times, e.g. the shift report at 06:00
+over the last 8 hours of 500 msts. The TebisScheduler knows these queries as
+templates and loads them in the background shortly before they are due::
+
+    scheduler = TebisScheduler(teb, maxConcurrent=2)
+    scheduler.register('shift', names, rate=1, window='8h', at=['06:00', '14:00', '22:00'], lead='10min')
+    scheduler.start()
+    ...
+    data = scheduler.getData('shift')  # at 06:00: only the last minutes are loaded
+
+At due - lead the whole window is loaded into the cache, until the due time the
+tail is refreshed every 'refresh'. getData() then only loads the rows after the
+cached end and drops the rows before the window. The last 'overlap' of the cache
+is loaded again, values the server didn't have yet (NaN) are filled in. The background loads share a
+budget of maxConcurrent queries and run with the priority 'bulk' (see 'limits'),
+interactive getData() calls are not limited.
+
+Times of day ('at') are local time, 'every' schedules are aligned to the epoch.
+The timestamps are handled as rows of the reduction, so the cache works with
+'localTimestamps', too.
+"""
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pytebis.aggregate import parseInterval
+from pytebis.timeutils import toTimestampMs
+
+
+class TebisQueryTemplate:
+    ''' a recurring query: msts, rate, relative window and the schedule '''
+
+    def __init__(self, name, names, rate=1, window='1h', at=None, every=None, lead='5min', refresh='1min',
+                 overlap='1min'):
+        if (at is None) == (every is None):
+            raise ValueError('Either at or every must be defined')
+        self.name = name
+        self.names = list(names)
+        self.rate = rate
+        self.nCT = int(rate * 1000.0)
+        self.window = parseInterval(window)
+        self.at = None if at is None else [_parseTimeOfDay(value) for value in ([at] if isinstance(at, str) else at)]
+        self.every = None if every is None else parseInterval(every)
+        self.lead = parseInterval(lead)
+        self.refresh = parseInterval(refresh)
+        self.overlap = parseInterval(overlap)
+
+    def nextDue(self, nowMs):
+        '''first due time (ms) after nowMs'''
+        if self.every is not None:
+            return (nowMs // self.every + 1) * self.every
+        now = datetime.datetime.fromtimestamp(nowMs / 1000.0)
+        candidates = []
+        for days in (0, 1):
+            day = now.date() + datetime.timedelta(days=days)
+            for hour, minute in self.at:
+                due = datetime.datetime.combine(day, datetime.time(hour, minute))
+                if due > now:
+                    candidates.append(due)
+        return int(min(candidates).timestamp() * 1000)
+
+    def __repr__(self):
+        return f"TebisQueryTemplate({self.name})"
+
+
+def _parseTimeOfDay(value):
+    hour, minute = str(value).split(':')
+    return int(hour), int(minute)
+
+
+class TebisCacheEntry:
+    ''' cached rows of a template, end is the timestamp (ms) of the last row '''
+
+    def __init__(self, data, end):
+        self.data = data
+        self.end = end
+
+
+class TebisScheduler:
+    ''' prefetches and refreshes registered query templates in the background '''
+
+    def __init__(self, tebis, maxConcurrent=2, clock=time.time):
+        self.tebis = tebis
+        self.maxConcurrent = maxConcurrent
+        self.clock = clock
+        self.templates = {}
+        self.cache = {}
+        self.due = {}
+        self.lastRefresh = {}
+        self.running = set()
+        self.lock = threading.Lock()
+        self.budget = threading.BoundedSemaphore(maxConcurrent)
+        self.stats = {'prefetches': 0, 'refreshes': 0, 'hits': 0, 'misses': 0, 'errors': 0}
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pool = None
+
+    def nowMs(self):
+        return int(self.clock() * 1000)
+
+    def register(self, name, names, rate=1, window='1h', at=None, every=None, lead='5min', refresh='1min',
+                 overlap='1min'):
+        template = TebisQueryTemplate(name, names, rate, window, at, every, lead, refresh, overlap)
+        with self.lock:
+            self.templates[name] = template
+            self.due[name] = template.nextDue(self.nowMs())
+            self.cache.pop(name, None)
+        self.wakeup.set()
+        return template
+
+    def unregister(self, name):
+        with self.lock:
+            self.templates.pop(name, None)
+            self.due.pop(name, None)
+            self.cache.pop(name, None)
+
+    def getStats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    # region loading
+
+    def __load(self, template, startMs, endMs):
+        '''rows (startMs, endMs], both aligned to the rate'''
+        if endMs <= startMs:
+            return None
+        return self.tebis.getDataAsNP(template.names, startMs, endMs, template.rate)
+
+    def __extend(self, template, entry, endMs):
+        '''cache entry with the rows up to endMs, the rows before the window are dropped'''
+        rows = template.window // template.nCT
+        if entry is None:
+            data = self.__load(template, endMs - rows * template.nCT, endMs)
+        elif endMs <= entry.end:
+            # an older end, the rows are already cached
+            last = len(entry.data) - (entry.end - endMs) // template.nCT
+            data = entry.data[max(0, last - rows):last]
+            return TebisCacheEntry(data, endMs)
+        else:
+            # the last rows are loaded again, the server may not have had all values yet
+            overlap = min(template.overlap // template.nCT, len(entry.data))
+            tail = self.__load(template, entry.end - overlap * template.nCT, endMs)
+            data = entry.data if tail is None else np.concatenate((entry.data[:len(entry.data) - overlap], tail))
+        if data is not None:
+            data = data[-rows:]
+        return TebisCacheEntry(data, endMs)
+
+    def __covers(self, template, entry, endMs):
+        if entry is None or entry.data is None:
+            return False
+        # the window must start inside the cached rows
+        firstMs = entry.end - (len(entry.data) - 1) * template.nCT
+        return endMs - template.window + template.nCT >= firstMs and endMs - entry.end <= template.window
+
+    """
+    liefert das Ergebnis eines Templates für das Fenster, das bei end (Standard: jetzt) endet
+    Aus dem Cache werden nur die fehlenden Zeilen am Ende nachgeladen.
+    """
+
+    def getData(self, name, end=None):
+        with self.lock:
+            template = self.templates[name]
+            entry = self.cache.get(name)
+        endMs = self.nowMs() if end is None else int(toTimestampMs(end))
+        endMs = endMs // template.nCT * template.nCT
+        hit = self.__covers(template, entry, endMs)
+        entry = self.__extend(template, entry if hit else None, endMs)
+        with self.lock:
+            self.stats['hits' if hit else 'misses'] += 1
+            current = self.cache.get(name)
+            if current is None or current.end <= entry.end:
+                self.cache[name] = entry
+        return entry.data
+
+    def prefetch(self, name, endMs=None):
+        '''loads or refreshes the cache of the template now'''
+        with self.lock:
+            template = self.templates[name]
+            entry = self.cache.get(name)
+        endMs = (self.nowMs() if endMs is None else endMs) // template.nCT * template.nCT
+        refresh = self.__covers(template, entry, endMs)
+        entry = self.__extend(template, entry if refresh else None, endMs)
+        with self.lock:
+            self.stats['refreshes' if refresh else 'prefetches'] += 1
+            current = self.cache.get(name)
+            if current is None or current.end <= entry.end:
+                self.cache[name] = entry
+            self.lastRefresh[name] = endMs
+
+    # endregion
+
+    # region background
+
+    def pendingJobs(self, nowMs=None):
+        '''names of the templates which have to be prefetched or refreshed at nowMs'''
+        nowMs = self.nowMs() if nowMs is None else nowMs
+        jobs = []
+        with self.lock:
+            for name, template in self.templates.items():
+                due = self.due[name]
+                if nowMs >= due:
+                    # due time passed, the next run starts with a prefetch again
+                    self.due[name] = template.nextDue(nowMs)
+                    continue
+                if nowMs < due - template.lead or name in self.running:
+                    continue
+                last = self.lastRefresh.get(name)
+                if last is None or last < due - template.lead or nowMs - last >= template.refresh:
+                    jobs.append(name)
+        return jobs
+
+    def runPending(self, nowMs=None):
+        '''runs the due jobs in the calling thread, returns their names'''
+        jobs = self.pendingJobs(nowMs)
+        for name in jobs:
+            self.__runJob(name, nowMs)
+        return jobs
+
+    def __runJob(self, name, nowMs=None):
+        with self.budget, self.tebis.requestPriority('bulk'):
+            try:
+                self.prefetch(name, nowMs)
+            except Exception:
+                with self.lock:
+                    self.stats['errors'] += 1
+                logging.getLogger('pytebis').warning(f"Prefetching {name} failed", exc_info=True)
+            finally:
+                with self.lock:
+                    self.running.discard(name)
+
+    def nextWakeup(self, nowMs=None):
+        '''seconds until the next job has to be checked'''
+        nowMs = self.nowMs() if nowMs is None else nowMs
+        times = []
+        with self.lock:
+            for name, template in self.templates.items():
+                start = self.due[name] - template.lead
+                times.append(start if nowMs < start else min(self.due[name], nowMs + template.refresh))
+        if len(times) == 0:
+            return 60.0
+        return max(0.01, (min(times) - nowMs) / 1000.0)
+
+    def start(self):
+        self.stopped.clear()
+        self.pool = ThreadPoolExecutor(max_workers=self.maxConcurrent, thread_name_prefix='pytebis-scheduler')
+        self.thread = threading.Thread(target=self.__loop, name='TebisScheduler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def __loop(self):
+        while not self.stopped.is_set():
+            for name in self.pendingJobs():
+                with self.lock:
+                    self.running.add(name)
+                self.pool.submit(self.__runJob, name)
+            self.wakeup.wait(self.nextWakeup())
+            self.wakeup.clear()
+
+    # endregion
@@ -0,0 +1,185 @@
+"""Builds valid Tebis server payloads from numpy data.
+
+Used by the benchmarks, the tests and the fake server. The layout follows what
+the decoders in tebis.py read:
+
+LoadData (binary)::
+
+    "1,<length>," | 9 x int32 header | column blocks (zlib compressed) | 4 x int32 footer
+
+    header: -1, 463453, 756543, -1, version 2, columns, rows, 0, compressed (-1 = no)
+    column: int16 0, int16 type (301 timestamp, 8 value)
+            segments: uint8 length (255 -> uint32 length follows), uint8 255 = NaN / 0 = data
+            uint8 byte width, uint8 function, values
+
+GetConfig (text)::
+
+    1,<length>,-1,463453,756543,-1,3,<columns>,<rows>,<type>,0,<values>...,-1,463453,756543,-1
+"""
+import struct
+import zlib
+import numpy as np
+
+MAGIC = (-1, 463453, 756543, -1)
+
+FUNCTION_NAN = 109
+FUNCTION_VALUES = 110
+FUNCTION_LINEAR = 111
+FUNCTION_GROUPS = 112
+
+COLTYPE_TIMESTAMP = 301
+COLTYPE_VALUE = 8
+
+_FORMATS = {8: '>f8', 4: '>i4', 2: '>i2', 1: '>i1'}
+
+
+def nanSegments(values):
+    '''splits values into [start, length, isNan] segments'''
+    isNan = np.isnan(values)
+    if len(values) == 0:
+        return []
+    changes = np.flatnonzero(isNan[1:] != isNan[:-1]) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [len(values)]))
+    return [(int(start), int(end - start), bool(isNan[start])) for start, end in zip(starts, ends)]
+
+
+def _encodeSegments(segments):
+    out = bytearray()
+    for start, length, isNan in segments:
+        if length >= 255:
+            out += struct.pack('>BI', 255, length)
+        else:
+            out += struct.pack('>B', length)
+        out += struct.pack('>B', 255 if isNan else 0)
+    return out
+
+
+def _encodeValues(values, byteCount):
+    if byteCount != 8:
+        values = np.round(values)
+    return np.asarray(values).astype(_FORMATS[byteCount]).tobytes()
+
+
+def _runs(values):
+    changes = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], changes))
+    lengths = np.diff(np.concatenate((starts, [len(values)])))
+    return values[starts], lengths
+
+
+def chooseFunction(values):
+    '''picks the function the server would most likely use for the values'''
+    segments = nanSegments(values)
+    dataSegments = [s for s in segments if not s[2]]
+    if len(dataSegments) == 0:
+        return FUNCTION_NAN
+    valid = values[~np.isnan(values)]
+    if np.all(valid == valid[0]):
+        return FUNCTION_LINEAR
+    if len(dataSegments) == 1 and len(valid) > 2 and np.allclose(np.diff(valid), valid[1] - valid[0]):
+        return FUNCTION_LINEAR
+    if len(_runs(valid)[0]) * 2 < len(valid):
+        return FUNCTION_GROUPS
+    return FUNCTION_VALUES
+
+
+def encodeValueColumn(values, function=None, byteCount=8):
+    '''encodes a float array (NaN = no value) as value column block'''
+    values = np.asarray(values, dtype=np.float64)
+    if function is None:
+        function = chooseFunction(values)
+    segments = nanSegments(values)
+    out = bytearray(struct.pack('>hh', 0, COLTYPE_VALUE))
+    out += _encodeSegments(segments)
+    out += struct.pack('>BB', byteCount, function)
+    valid = values[~np.isnan(values)]
+    if function == FUNCTION_VALUES:
+        out += _encodeValues(valid, byteCount)
+    elif function == FUNCTION_LINEAR:
+        # every data segment starts again at value
+        first = next(s for s in segments if not s[2])
+        step = valid[1] - valid[0] if first[1] > 1 else 0.0
+        out += _encodeValues(np.array([valid[0], step]), byteCount)
+    elif function == FUNCTION_GROUPS:
+        runValues, runLengths = _runs(valid)
+        for value, length in zip(runValues, runLengths):
+            while length > 0:
+                count = min(int(length), 255)
+                out += struct.pack('>B', count)
+                out += _encodeValues(np.array([value]), byteCount)
+                length -= count
+    elif function != FUNCTION_NAN:
+        raise ValueError(f'Unknown function {function}')
+    return bytes(out)
+
+
+def encodeTimestampColumn(start, step, rows):
+    out = bytearray(struct.pack('>hh', 0, COLTYPE_TIMESTAMP))
+    out += _encodeSegments([(0, rows, False)])
+    out += struct.pack('>BB', 8, 0)
+    out += struct.pack('>qq', int(start), int(step))
+    return bytes(out)
+
+
+def buildLoadDataPayload(columns, timeR, nCT, functions=None, byteCount=8, compress=True):
+    '''builds a LoadData answer for the value columns (list of float arrays with equal length)
+    the rows end at timeR with the step nCT (both ms)'''
+    rows = len(columns[0]) if len(columns) > 0 else 0
+    blocks = [encodeTimestampColumn(timeR - (rows - 1) * nCT, nCT, rows)]
+    for i, values in enumerate(columns):
+        function = None if functions is None else functions[i]
+        width = byteCount[i] if isinstance(byteCount, (list, tuple)) else byteCount
+        blocks.append(encodeValueColumn(values, function, width))
+    body = b''.join(blocks)
+    if compress:
+        body = zlib.compress(body)
+    header = struct.pack('>9i', *MAGIC, 2, len(columns) + 1, rows, 0, 0 if compress else -1)
+    content = header + body + struct.pack('>4i', *MAGIC)
+    return b'1,' + str(len(content)).encode('ascii') + b',' + content
+
+
+def _configValue(value):
+    if isinstance(value, (str, np.str_)):
+        return "'" + str(value).replace("'", "").replace(",", " ") + "'"
+    if isinstance(value, (float, np.floating)):
+        return 'i,1,' + repr(float(value))
+    return 'i,1,' + str(int(value))
+
+
+def buildConfigPayload(array):
+    '''builds a GetConfig answer for a structured array (e.g. ID, MSTName, ...)'''
+    tokens = [str(v) for v in MAGIC] + ['3', str(len(array.dtype.names)), str(len(array))]
+    for name in array.dtype.names:
+        column = array[name]
+        tokens += ['0', '0']
+        if np.issubdtype(column.dtype, np.integer) and len(column) > 1 and np.all(np.diff(column) == 1):
+            tokens += ['d', str(len(column)), str(int(column[0])), '1']
+        else:
+            tokens += [_configValue(value) for value in column]
+    tokens += [str(v) for v in MAGIC]
+    content = ','.join(tokens)
+    return ('1,' + str(len(content)) + ',' + content).encode('iso-8859-1')
+
+
+def makeSeries(rows, pattern='noise', nanRatio=0.0, seed=0):
+    '''synthetic test signals: noise, step, constant, linear or nan'''
+    rng = np.random.default_rng(seed)
+    if pattern == 'noise':
+        values = np.round(rng.normal(50.0, 10.0, rows), 3)
+    elif pattern == 'step':
+        values = np.repeat(rng.integers(0, 5, max(1, rows // 100) + 1).astype(np.float64), 100)[:rows]
+    elif pattern == 'constant':
+        values = np.full(rows, 42.0)
+    elif pattern == 'linear':
+        values = np.arange(rows, dtype=np.float64) * 0.5
+    elif pattern == 'nan':
+        values = np.full(rows, np.nan)
+    else:
+        raise ValueError(f'Unknown pattern {pattern}')
+    if nanRatio > 0 and pattern != 'nan':
+        # NaN in blocks like a missing signal
+        blockCount = max(1, int(rows * nanRatio) // 50)
+        for start in rng.integers(0, max(1, rows - 50), blockCount):
+            values[start:start + 50] = np.nan
+    return values
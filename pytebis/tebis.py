@@ -1,26 +1,61 @@
 import time
 import socket
+import hashlib
+import threading
+import random
 import struct
 import zlib
 import numpy as np
 import numbers
-import pandas as pd
 import json
 import datetime
+import contextlib
 from json import JSONEncoder
-import simplejson
 from io import StringIO
-import csv
 from pytebis.lazyloader import LazyLoader
+from pytebis.downsample import downsampleMinMax, downsampleLTTB
+from pytebis.aggregate import aggregateSeries, parseInterval
+from pytebis.instrumentation import Instrumentation
+from pytebis.decoder import decodeBinaryResult, decodeShared, releaseSharedMemory, ColumnCache
+from pytebis.csvexport import writeCSV
+from pytebis.rawframes import buildFrame, writeFrame
+from pytebis.rle import RLESeries, decodeRLE
+from pytebis.ratelimit import getLimiter, parsePriority
+from pytebis.timeutils import localizeTimestamps, toTimestampMs, toTimestampsMs, alignRange
 import logging
-from dateutil.parser import parse
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, as_completed
 logging.getLogger('pytebis').addHandler(logging.NullHandler())
 
+# loaded on first use, import pytebis.tebis stays fast for getDataAsNP
+pd = LazyLoader('pd', globals(), 'pandas')
+simplejson = LazyLoader('simplejson', globals(), 'simplejson')
+csv = LazyLoader('csv', globals(), 'csv')
+multiprocessing = LazyLoader('multiprocessing', globals(), 'multiprocessing')
+shared_memory = LazyLoader('shared_memory', globals(), 'multiprocessing.shared_memory')
+
+
+def registryProperty(name):
+    ''' attribute of the active TebisRegistry '''
+    return property(lambda self: getattr(self.activeRegistry(), name),
+                    lambda self, value: setattr(self.activeRegistry(), name, value))
+
 
 class Tebis():
     '''Tebis Communication class
     '''
 
+    msts = registryProperty('msts')
+    mstById = registryProperty('mstById')
+    mstByName = registryProperty('mstByName')
+    reductions = registryProperty('reductions')
+    tebisTree = registryProperty('tebisTree')
+    tebisGrps = registryProperty('tebisGrps')
+    tebisGrpsById = registryProperty('tebisGrpsById')
+    tebisMapTreeGroups = registryProperty('tebisMapTreeGroups')
+    tebisMapTreeGroupById = registryProperty('tebisMapTreeGroupById')
+    configHashes = registryProperty('configHashes')
+
     def __init__(self, configfile=None, sock=None, host=None, port=None, dbConn=None, configuration=None):
         default_conf = {
             'host': None,
@@ -39,6 +74,46 @@ class Tebis():
                 'enable': False,    # Use LiveValue Feature - This is used to compensate possible timedrifts between the Tebis Server and the Client.
                 'recalcTimeOffsetEvery': 600,  # When using LiveValues recalc TimeOffset every x Seconds
                 'offsetMstId': 100025,  # This is the Mst which is used to calculate the last available Timestamp. Use a always available mst.
+            },
+            'timezone': 'Europe/Berlin',  # Timezone of the local timestamps, None for UTC
+            'localTimestamps': False,  # Shift the timestamps of the NP and Json results to local time, too. Pandas is always local
+            'requests': {
+                'maxIdsPerRequest': 100,  # Max. number of msts in one LoadData request
+                'maxPointsPerRequest': 10000000,  # Max. number of values (msts * nNmbX) in one request. Longer timespans are split
+                'minPointsPerRequest': 100000,  # Lower bound for the adaptive sizing
+                'bytesPerValue': 8,  # Estimated width of one value on the wire
+                'adaptive': True,  # Size the requests by the measured latency and throughput of the server
+                'targetSeconds': 2.0,  # Adaptive: aimed duration of a single request
+                'maxParallel': 4,  # Number of requests which are sent in parallel
+                'decodeProcesses': 0,  # Decode the answers in x worker processes via shared memory, 0 decodes in the calling thread
+                'singleFlight': False,  # Concurrent queries for the same msts (or a subset), rate and timespan share the requests
+                'columnCache': 10000,  # Max. number of decoded columns kept by getDataWithChanges
+            },
+            'timeouts': {
+                'connect': 10.0,  # Seconds to establish a connection
+                'read': 60.0,  # Max. seconds to wait for data on the socket
+                'total': None,  # Deadline in seconds for a whole query incl. all requests and retries, None for no limit
+            },
+            'retry': {
+                'attempts': 3,  # Tries of a single request on errors, timeouts and broken connections
+                'backoff': 0.2,  # Wait in seconds before the first retry, doubled for every further retry
+                'maxBackoff': 5.0,  # Upper limit of the wait
+                'jitter': True,  # Wait a random time between 0 and the backoff
+            },
+            'limits': {
+                'enable': False,  # Limit the requests per server, shared by all Tebis instances of the process
+                'maxConcurrent': 8,  # Max. number of requests running on the server at the same time, None for no limit
+                'requestsPerSecond': None,  # Max. rate of the requests, None for no limit
+                'bytesPerSecond': None,  # Max. rate of the transferred bytes, None for no limit
+                'burst': 1.0,  # Seconds of the rates which can be used at once
+                'priority': 'interactive',  # Priority of the requests of this instance: 'interactive', 'normal' or 'bulk'
+            },
+            'instrumentation': {
+                'enable': False,  # Collect timings and byte counters of the requests. See teb.instrumentation / teb.getStats()
+            },
+            'autoRefresh': {
+                'enable': False,  # Reload the Msts, Groups and Tree in the background and only apply what has changed
+                'interval': 600,  # Check for changes every x Seconds
             }
         }
         self.config = selective_merge(default_conf, configuration)
@@ -53,64 +128,298 @@ class Tebis():
             self.config['host'] = host
         if port is not None:
             self.config['port'] = port
+        self.instrumentation = Instrumentation(enabled=self.config['instrumentation']['enable'])
+        parsePriority(self.config['limits']['priority'])
+        self.threadState = threading.local()
+        self.registry = TebisRegistry()
+        self.registryLock = threading.RLock()
+        self.liveValuesLock = threading.Lock()
+        self.requestStatsLock = threading.Lock()
+        self.requestStats = {'latency': None, 'throughput': None}
+        self.changeListeners = []
+        self.autoRefreshThread = None
+        self.autoRefreshStop = threading.Event()
+        self.decodePool = None
+        self.inFlight = {}
+        self.columnCache = ColumnCache(int(self.config['requests']['columnCache']))
+        self.inFlightLock = threading.Lock()
+        self.decodePoolLock = threading.Lock()
         self.refreshMsts()
         if self.config['liveValues']['enable'] == True:
             self.setupLiveValues()
-        
+        if self.config['autoRefresh']['enable'] == True:
+            self.startAutoRefresh()
 
     def getDataAsNP(self, names, start, end, rate=1):
-        ids = []
-        # find Mst with id as a number, id as MST name a str, id
-        for name in names:
-            id = None
-            if isinstance(name, numbers.Number):
-                id = self.getMst(id=name).id
-            elif isinstance(name, str):
-                id = self.getMst(name=name).id
-            elif isinstance(name, TebisMST):
-                id = name.id
-            elif isinstance(name, TebisGroupElement):
-                for member in name.members:
-                    ids.append(member.mst.id)
-            elif isinstance(name, TebisGroupMember):
-                id = name.mst.id
-            if id is not None:
-                ids.append(id)
-        if isinstance(start, datetime.datetime):
-            start = start.timestamp()*1000.0
-        elif isinstance(start, float):
-            start = start*1000.0
-        elif isinstance(start, int) and start < 100000000000: #and start > 100000000000 and start < 100000000000000:
-            start = start*1000.0
-        elif isinstance(start, str):
-            start = datetime.datetime.strptime(start, '%Y-%m-%d %H:%M:%S.%f').timestamp()*1000.0
-        if isinstance(end, datetime.datetime):
-            end = end.timestamp()*1000.0
-        elif isinstance(end, float):
-            end = end*1000.0
-        elif isinstance(end, int) and end < 100000000000: #and start > 100000000000 and start < 100000000000000:
-            end = end*1000.0
-        elif isinstance(end, str):
-            end = datetime.datetime.strptime(end, '%Y-%m-%d %H:%M:%S.%f').timestamp()*1000.0
-
+        ids = self.resolveIds(names)
+        nTimeR, nNmbX = alignRange(start, end, rate)
         nCT = rate*1000.0
-        nTimeR = end
-        nTimeR = (int(float(nTimeR)) / int(nCT)) * int(nCT)
+        return self.localizeResult(self.__getBinData(ids=ids, nNmbX=nNmbX, TimeR=nTimeR, nCT=nCT/1000.0))
+
+    def localizeResult(self, data):
+        if data is not None and self.config['localTimestamps'] and self.config['timezone'] is not None:
+            if data.base is not None:
+                # a shared result (singleFlight) must not be changed
+                data = data.copy()
+            data['timestamp'] = localizeTimestamps(data['timestamp'], self.config['timezone'])
+        return data
 
-        nTimeL = start
-        nTimeL = (int(float(nTimeL)) / int(nCT)) * int(nCT)
-        nNmbX = int(nTimeR - nTimeL) / int(nCT)
+
+    """
+    liefert die Messreihen lauflängenkodiert (pytebis.rle.RLESeries) ohne dichte Arrays anzulegen
+    Sinnvoll für sich langsam ändernde Signale (Sollwerte, Zustände) über lange Zeiträume.
+    Zurück kommt ein dict Name -> RLESeries, die Zeitstempel sind immer UTC.
+    """
+
+    def getDataAsRLE(self, names, start, end, rate=1):
+        ids = self.resolveIds(names)
+        nTimeR, nNmbX = alignRange(start, end, rate)
+        nCT, nNmbX, timeR = self.alignBinRange(rate, nNmbX, nTimeR)
+        names = [str(self.getMst(id=id).name) for id in ids]
         if nNmbX <= 0:
-            nNmbX = 1
-        
-        return self.__getBinData(ids=ids, nNmbX=nNmbX, TimeR=nTimeR, nCT=nCT/1000.0)
+            return dict((name, RLESeries([], [], [], timestamp=timeR, nCT=nCT, name=name)) for name in names)
+        pieces = dict((name, []) for name in names)
+        for (chunkIds, offset, chunkTimeR, nmbX, rowOffset), MSTSRaw in self.iterRawChunks(self.planLoadData(ids, nNmbX, timeR, nCT), nCT):
+            with self.instrumentation.span('decode', bytes=len(MSTSRaw), format='rle'):
+                columns = decodeRLE(MSTSRaw, names[offset:offset + len(chunkIds)])
+            if columns is False:
+                raise TebisException('Invalid LoadData answer')
+            for series in columns:
+                pieces[series.name].append((rowOffset, series))
+        return dict((name, RLESeries.concatenate([series for rowOffset, series in sorted(pieces[name], key=lambda p: p[0])], name))
+                    for name in names)
+
+    """
+    liefert die Zeitpunkte, an denen sich der Wert einer Messstelle ändert (z.B. Ventilstellungen, Rezept-Nummern)
+    Die Änderungen werden aus den Läufen der Server-Antwort bestimmt (siehe getDataAsRLE), der Aufwand richtet sich nach der Anzahl der Änderungen.
+    Zurück kommt ein dict Name -> structured Array (timestamp, value), der erste Wert ist immer enthalten.
+    """
+
+    def getChanges(self, names, start, end, rate=1):
+        result = {}
+        for name, series in self.getDataAsRLE(names, start, end, rate).items():
+            changes = series.changes()
+            if self.config['localTimestamps'] and self.config['timezone'] is not None:
+                changes['timestamp'] = localizeTimestamps(changes['timestamp'], self.config['timezone'])
+            result[name] = changes
+        return result
 
+    """
+    wie getDataAsNP für wiederholte Abfragen (Polling)
+    Spalten, deren kodierte Bytes sich seit der letzten Abfrage mit gleicher Messstelle, Reduktion, Anzahl und Position nicht geändert haben,
+    werden nicht erneut dekodiert, sondern aus dem columnCache übernommen.
+    Zurück kommt (Daten, Liste der Namen der geänderten Spalten)
+    """
+
+    def getDataWithChanges(self, names, start, end, rate=1):
+        ids = self.resolveIds(names)
+        nTimeR, nNmbX = alignRange(start, end, rate)
+        nCT, nNmbX, timeR = self.alignBinRange(rate, nNmbX, nTimeR)
+        if nNmbX <= 0:
+            return None, []
+        types = [('timestamp', (np.int64))]
+        for id in ids:
+            types.append((str(self.getMst(id=id).name), (np.float32)))
+        changed = set()
+        plan = self.planLoadData(ids, nNmbX, timeR, nCT)
+        try:
+            data = self.executeLoadPlan(plan, nCT, types, np.empty(nNmbX, dtype=types), changed=changed)
+        except TebisException:
+            # the columns cached by this query were never returned, the next query has to report them as changed
+            self.columnCache.discard((int(id), int(nCT), nmbX, rowOffset)
+                                     for chunk, offset, timeR, nmbX, rowOffset in plan for id in chunk)
+            raise
+        return self.localizeResult(data), [name for name, type in types[1:] if name in changed]
+
+    """
+    liefert eine für die Anzeige reduzierte Messreihe
+    points = Anzahl der gewünschten Punkte oder width = Breite in Pixel
+    Es wird die passende Reduktion des Servers gewählt und optional clientseitig mit 'minmax' oder 'lttb' weiter reduziert.
+    """
+
+    def getDataForDisplay(self, names, start, end, points=None, width=None, method='minmax'):
+        if points is None and width is None:
+            raise TebisException('points or width must be defined')
+        if points is None:
+            points = width * 2 if method == 'minmax' else width
+        start = int(toTimestampMs(start))
+        end = int(toTimestampMs(end))
+        nCT = self.selectReduction(end - start, points)
+        data = self.getDataAsNP(names, start, end, nCT / 1000.0)
+        if method == 'minmax':
+            return downsampleMinMax(data, max(1, points // 2))
+        elif method == 'lttb':
+            return downsampleLTTB(data, points)
+        elif method is None:
+            return data
+        raise TebisException(f'Unknown downsampling method {method}')
+
+    """
+    aggregiert die Messreihen je Zeitfenster every (Sekunden oder z.B. '15min', '1h')
+    funcs = mean, min, max, first, last, count, sum, integral
+    Die Daten werden in Zeitabschnitten von max. maxRows Zeilen geladen und aggregiert, damit der Speicherbedarf begrenzt bleibt.
+    """
+
+    def aggregate(self, names, start, end, rate=1, every='15min', funcs=('mean',), maxRows=1000000):
+        every = parseInterval(every)
+        nCT = int(rate * 1000.0)
+        start = int(toTimestampMs(start)) // nCT * nCT
+        end = int(toTimestampMs(end)) // nCT * nCT
+        windowMs = max(every, (maxRows * nCT) // every * every)
+        results = []
+        carry = None
+        windowStart = start
+        while windowStart < end:
+            windowEnd = min(end, (windowStart // every + 1) * every + windowMs - every)
+            data = self.getDataAsNP(names, windowStart, windowEnd, rate)
+            if carry is not None and data is not None:
+                data = np.concatenate((carry, data))
+            carry = None
+            if data is not None and len(data) > 0 and windowEnd < end:
+                # the last window may continue in the next request
+                lastBin = data['timestamp'][-1] // every
+                split = np.searchsorted(data['timestamp'] // every, lastBin)
+                carry = data[split:]
+                data = data[:split]
+            if data is not None and len(data) > 0:
+                results.append(aggregateSeries(data, every, funcs, nCT))
+            windowStart = windowEnd
+        if carry is not None and len(carry) > 0:
+            results.append(aggregateSeries(carry, every, funcs, nCT))
+        if len(results) == 0:
+            return None
+        return np.concatenate(results)
 
     def getDataAsJson(self, names, start, end, rate=1):
-        return getDataSeries_as_Json(self.getDataAsNP(names, start, end, rate))
+        data = self.getDataAsNP(names, start, end, rate)
+        with self.instrumentation.span('convert', format='json'):
+            return getDataSeries_as_Json(data)
+
+    """
+    liefert die Daten als CSV Text, ohne Umweg über einen pandas DataFrame
+    options: precision, floatFormat, naRep, timestampFormat ('iso', 'ms', 's' oder strftime), delimiter, header
+    """
+
+    def getDataAsCSV(self, names, start, end, rate=1, **options):
+        out = StringIO()
+        self.exportCSV(out, names, start, end, rate, **options)
+        return out.getvalue()
+
+    """
+    schreibt die Daten als CSV in eine Datei (Pfad) oder einen Text-Stream
+    Die Daten werden in Zeitabschnitten von max. maxRows Zeilen geladen und sofort geschrieben.
+    Zurück kommt die Anzahl der geschriebenen Zeilen.
+    """
+
+    def exportCSV(self, out, names, start, end, rate=1, maxRows=1000000, **options):
+        if isinstance(out, (str, bytes)) or hasattr(out, '__fspath__'):
+            with open(out, 'w', encoding='utf-8', newline='') as f:
+                return self.exportCSV(f, names, start, end, rate, maxRows, **options)
+        if not self.config['localTimestamps']:
+            options.setdefault('timezone', self.config['timezone'])
+        nCT = int(rate * 1000.0)
+        start = int(toTimestampMs(start))
+        end = int(toTimestampMs(end))
+        header = options.pop('header', True)
+        rows = 0
+        windowStart = start
+        while windowStart < end:
+            windowEnd = min(end, windowStart + maxRows * nCT)
+            data = self.getDataAsNP(names, windowStart, windowEnd, rate)
+            if data is not None:
+                with self.instrumentation.span('convert', format='csv'):
+                    rows += writeCSV(data, out, header=header, **options)
+                header = False
+            windowStart = windowEnd
+        return rows
 
     # returns RawData for Client based Converters like Javascript
     def getDataRAW(self,filepath, names, start, end, rate=1):
+        ids = self.resolveIds(names)
+        nTimeR, nNmbX = alignRange(start, end, rate)
+        nCT = rate*1000.0
+        return self.getBinDataRAW(filepath,ids=ids, nNmbX=nNmbX, TimeR=nTimeR, nCT=nCT/1000.0)
+
+    def getDataAsPD(self, names, start, end = None, rate=1):
+        if isinstance(start, list) and all(isinstance(elem, list) for elem in start):
+            data = self.getDataAsNPMulti(names, start, rate)
+        elif end is not None:
+            data = self.getDataAsNP(names, start, end, rate)
+        with self.instrumentation.span('convert', format='pandas'):
+            df = pd.DataFrame(data)
+            timestamps = df['timestamp'].to_numpy()
+            if not self.config['localTimestamps']:
+                timestamps = localizeTimestamps(timestamps, self.config['timezone'])
+            df = df.set_index(pd.DatetimeIndex(pd.to_datetime(timestamps, unit='ms'), name='timestamp'))
+            df = df.drop(columns=['timestamp'])
+        # df['timestamp'] = df.index
+        return df
+
+    """
+    lädt die Daten mehrerer Gruppen
+    Jede Messstelle wird nur einmal angefragt, auch wenn sie in mehreren Gruppen vorkommt.
+    Zurück kommt ein dict Gruppen-Id -> Sicht (View) auf das gemeinsame structured Array
+    """
+
+    def getDataForGroups(self, groups, start, end, rate=1):
+        ids = []
+        seen = set()
+        namesByGroup = {}
+        for group in groups:
+            if isinstance(group, numbers.Number):
+                id = group
+                group = self.tebisGrpsById.get(id)
+                if group is None:
+                    raise TebisException(f'Unknown group {id}')
+            names = ['timestamp']
+            for member in group.members:
+                if member.mst is None:
+                    continue
+                if member.mst.id not in seen:
+                    seen.add(member.mst.id)
+                    ids.append(member.mst.id)
+                if str(member.mst.name) not in names:
+                    names.append(str(member.mst.name))
+            namesByGroup[group.id] = names
+        if len(ids) == 0:
+            return dict((id, None) for id in namesByGroup)
+        data = self.getDataAsNP(ids, start, end, rate)
+        return dict((id, None if data is None else data[names]) for id, names in namesByGroup.items())
+
+    def getDataForTreeNode(self, treeId, start, end, rate=1, recursive=True):
+        if self.config['useOracle'] is not True:
+            raise TebisOracleDBException(
+                'no DbConnection specified - you need to specifiy a valid OracleDbConn in config')
+        node = self.tebisTree[0].findNodeByID(treeId)
+        if node is None:
+            raise TebisException(f'Tree node {treeId} not found')
+        nodes = [node]
+        if recursive:
+            i = 0
+            while i < len(nodes):
+                nodes.extend(nodes[i].childs)
+                i += 1
+        groups = []
+        for node in nodes:
+            treegroup = self.tebisMapTreeGroupById.get(node.id)
+            if treegroup is None:
+                continue
+            for group in treegroup.groups:
+                if group is not None and group not in groups:
+                    groups.append(group)
+        return self.getDataForGroups(groups, start, end, rate)
+
+    def getStats(self):
+        return self.instrumentation.stats.snapshot()
+
+    def getMapTreeGroupById(self, id):
+        if self.config['useOracle'] is True:
+            return self.tebisMapTreeGroupById.get(id)
+        else:
+            raise TebisOracleDBException(
+                'no DbConnection specified - you need to specifiy a valid OracleDbConn in config')
+
+    def resolveIds(self, names):
         ids = []
         # find Mst with id as a number, id as MST name a str, id
         for name in names:
@@ -128,58 +437,7 @@ class Tebis():
                 id = name.mst.id
             if id is not None:
                 ids.append(id)
-        if isinstance(start, datetime.datetime):
-            start = start.timestamp()*1000.0
-        elif isinstance(start, float):
-            start = start*1000.0
-        elif isinstance(start, int) and start < 100000000000: #and start > 100000000000 and start < 100000000000000:
-            start = start*1000.0
-        elif isinstance(start, str):
-            start = datetime.datetime.strptime(start, '%Y-%m-%d %H:%M:%S.%f').timestamp()*1000.0
-        if isinstance(end, datetime.datetime):
-            end = end.timestamp()*1000.0
-        elif isinstance(end, float):
-            end = end*1000.0
-        elif isinstance(end, int) and end < 100000000000: #and start > 100000000000 and start < 100000000000000:
-            end = end*1000.0
-        elif isinstance(end, str):
-            end = datetime.datetime.strptime(end, '%Y-%m-%d %H:%M:%S.%f').timestamp()*1000.0
-
-        nCT = rate*1000.0
-        nTimeR = end
-        nTimeR = (int(float(nTimeR)) / int(nCT)) * int(nCT)
-
-        nTimeL = start
-        nTimeL = (int(float(nTimeL)) / int(nCT)) * int(nCT)
-        nNmbX = int(nTimeR - nTimeL) / int(nCT)
-        if nNmbX <= 0:
-            nNmbX = 1
-        
-        return self.getBinDataRAW(filepath,ids=ids, nNmbX=nNmbX, TimeR=nTimeR, nCT=nCT/1000.0)
-
-    def getDataAsPD(self, names, start, end = None, rate=1):
-        if isinstance(start, list) and all(isinstance(elem, list) for elem in start):
-            dfs = []
-            for tuple in start:
-                dfs.append(pd.DataFrame(self.getDataAsNP(names, tuple[0], tuple[1], rate)))
-            df = pd.concat(dfs, ignore_index=True)
-            df = df.set_index(pd.DatetimeIndex(pd.to_datetime(df['timestamp'], unit='ms').dt.tz_localize('UTC').dt.tz_convert('Europe/Berlin').dt.tz_localize(None)))
-            df = df.drop(columns=['timestamp'])
-            # df['timestamp'] = df.index
-            df = df.sort_index()
-        elif end is not None:
-            df = pd.DataFrame(self.getDataAsNP(names, start, end, rate))
-            df = df.set_index(pd.DatetimeIndex(pd.to_datetime(df['timestamp'], unit='ms').dt.tz_localize('UTC').dt.tz_convert('Europe/Berlin').dt.tz_localize(None)))
-            df = df.drop(columns=['timestamp'])
-        # df['timestamp'] = df.index
-        return df
-
-    def getMapTreeGroupById(self, id):
-        if self.config['useOracle'] is True:
-            return self.tebisMapTreeGroupById.get(id)
-        else:
-            raise TebisOracleDBException(
-                'no DbConnection specified - you need to specifiy a valid OracleDbConn in config')
+        return ids
 
     def getMst(self, id=None, name=None):
         if id is not None:
@@ -204,12 +462,15 @@ class Tebis():
         return json.dumps(self.tebisTree, cls=tebisTreeEncoder, separators=(',', ':'))
 
     def getGroupsByTreeId(self, id):
-        return self.getGroupsByTreeId(int(id))
+        return self.getMapTreeGroupById(int(id))
 
     def getGroupsByTreeIdAsJson(self, id):
         return json.dumps(self.getGroupsByTreeId(int(id)), cls=tebisTreeEncoder, separators=(',', ':'))
 
     def refreshMsts(self):
+        self.updateRegistry(self.__loadConfig, TebisRegistry())
+
+    def __loadConfig(self):
         self.loadReductions()  # We load the reductions to double check if a valid nCT is asked
         if self.config['useOracle'] is True:
             self.loadTree()
@@ -217,9 +478,123 @@ class Tebis():
             self.loadMstsnVMstsFromSocket()
             self.loadGroupsFromSocket()
 
+    """
+    Die Messstellen, Reduktionen, Gruppen und der Baum liegen in einer TebisRegistry.
+    Beim Laden wird eine neue Registry aufgebaut (nur der ladende Thread sieht sie) und erst danach aktiviert,
+    andere Threads arbeiten bis dahin mit der bisherigen Registry weiter.
+    """
+
+    def activeRegistry(self):
+        registry = getattr(self.threadState, 'registry', None)
+        return self.registry if registry is None else registry
+
+    def updateRegistry(self, update, registry=None):
+        with self.registryLock:
+            registry = self.registry.copy() if registry is None else registry
+            self.threadState.registry = registry
+            try:
+                result = update()
+            finally:
+                self.threadState.registry = None
+            self.registry = registry
+        return result
+
+    """
+    lädt die Konfiguration erneut, übernimmt aber nur die Änderungen
+    Die Rohdaten werden gehasht, ist der Hash unverändert wird nichts neu aufgebaut.
+    Geänderte Messstellen werden in den bestehenden Objekten aktualisiert, damit Referenzen (z.B. in Gruppen) gültig bleiben.
+    """
+
+    def refreshMstsIncremental(self):
+        return self.updateRegistry(self.__refreshIncremental)
+
+    def __refreshIncremental(self):
+        change = TebisConfigChange()
+        hashes = dict(self.configHashes)
+        raw = self.getConfigRaw("RsRedCTs")
+        if hashes.get("RsRedCTs") != self.configHashes["RsRedCTs"]:
+            self.loadReductions(raw)
+            change.reductionsChanged = True
+        if self.config['useOracle'] is True:
+            rows = self.queryTree()
+            if any(hashes.get(table) != self.configHashes[table] for table in ('TB_MSTS', 'TB_VMSTS')):
+                self.applyMstChanges(self.buildMstsFromRows(rows), change)
+            if change.added or change.removed or any(hashes.get(table) != self.configHashes[table] for table in ('TB_HI', 'TB_GRPS', 'TB_GRP_ELEMS', 'TB_MAP_GRPS')):
+                self.buildTreeFromRows(rows)
+                change.treeChanged = True
+        else:
+            rawMsts = self.getConfigRaw("Msts")
+            rawVmsts = self.getConfigRaw("VMsts")
+            if hashes.get("Msts") != self.configHashes["Msts"] or hashes.get("VMsts") != self.configHashes["VMsts"]:
+                self.applyMstChanges(self.buildMstsFromSocket(rawMsts, rawVmsts), change)
+        if change.hasChanges():
+            logging.getLogger('pytebis').info(f"Tebis config changed: {change}")
+            for listener in list(self.changeListeners):
+                listener(change)
+            return change
+        return None
+
+    def applyMstChanges(self, msts, change):
+        newById = build_dict(msts, key="id")
+        for id, mst in newById.items():
+            existing = self.mstById.get(id)
+            if existing is None:
+                self.msts.append(mst)
+                self.mstById[id] = mst
+                self.mstByName[mst.name] = mst
+                change.added.append(mst)
+            elif type(existing) is not type(mst) or mst_signature(existing) != mst_signature(mst):
+                if existing.name != mst.name and self.mstByName.get(existing.name) is existing:
+                    del self.mstByName[existing.name]
+                # the attributes of the old type are dropped, the current value is kept
+                current = dict((k, v) for k, v in vars(existing).items() if k.startswith('curren'))
+                existing.__class__ = mst.__class__
+                existing.__dict__.clear()
+                existing.__dict__.update(mst_signature(mst), **current)
+                self.mstByName[existing.name] = existing
+                change.changed.append(existing)
+        for id in [id for id in self.mstById if id not in newById]:
+            mst = self.mstById.pop(id)
+            if self.mstByName.get(mst.name) is mst:
+                del self.mstByName[mst.name]
+            change.removed.append(mst)
+        if change.removed:
+            self.msts = [mst for mst in self.msts if mst.id in newById]
+
+    def addChangeListener(self, callback):
+        self.changeListeners.append(callback)
+
+    def removeChangeListener(self, callback):
+        self.changeListeners.remove(callback)
+
+    def startAutoRefresh(self, interval=None, callback=None):
+        if interval is not None:
+            self.config['autoRefresh']['interval'] = interval
+        if callback is not None:
+            self.addChangeListener(callback)
+        if self.autoRefreshThread is not None and self.autoRefreshThread.is_alive():
+            return
+        self.autoRefreshStop.clear()
+        self.autoRefreshThread = threading.Thread(target=self.__autoRefreshLoop, name='pytebis-autorefresh', daemon=True)
+        self.autoRefreshThread.start()
+
+    def stopAutoRefresh(self, timeout=None):
+        self.autoRefreshStop.set()
+        if self.autoRefreshThread is not None:
+            self.autoRefreshThread.join(timeout)
+            self.autoRefreshThread = None
+
+    def __autoRefreshLoop(self):
+        while not self.autoRefreshStop.wait(self.config['autoRefresh']['interval']):
+            try:
+                self.refreshMstsIncremental()
+            except Exception:
+                logging.getLogger('pytebis').exception("Tebis auto refresh failed")
+
     def setupLiveValues(self):
-        self.config['liveValues']['lastTimeOffsetCalculation'] = None
-        self.config['liveValues']['timeOffset'] = None
+        with self.liveValuesLock:
+            self.config['liveValues']['lastTimeOffsetCalculation'] = None
+            self.config['liveValues']['timeOffset'] = None
         self.getCurrentTime()
 
     """
@@ -242,9 +617,12 @@ class Tebis():
     """
 
     def getCurrentTime(self):
-        if self.config['liveValues']['timeOffset'] is None or self.config['liveValues']['lastTimeOffsetCalculation'] < (time.time() - self.config['liveValues']['recalcTimeOffsetEvery']):
-            self.calcTimeOffset()
-        return time.time() - int(self.config['liveValues']['timeOffset'])
+        # only one thread calculates the offset, the others wait for it
+        with self.liveValuesLock:
+            if self.config['liveValues']['timeOffset'] is None or self.config['liveValues']['lastTimeOffsetCalculation'] < (time.time() - self.config['liveValues']['recalcTimeOffsetEvery']):
+                self.calcTimeOffset()
+            timeOffset = self.config['liveValues']['timeOffset']
+        return time.time() - int(timeOffset)
 
     """
     Gitb den aktuellen Messwert der in msts genannten messtellen zurück
@@ -271,9 +649,9 @@ class Tebis():
         None
 
 # region Config Data
-    def loadReductions(self):
+    def loadReductions(self, raw=None):
         array = np.dtype([('ID', (np.int64)), ('Reduction', (np.int64))])
-        data = self.getConfigData("RsRedCTs", array)
+        data = self.getConfigData("RsRedCTs", array, raw)
         self.reductions = np.floor_divide((data)['Reduction'], 1).tolist()
         None
 
@@ -283,14 +661,34 @@ class Tebis():
         else:
             raise TebisException('Reduction not available')
 
+    """
+    wählt die gröbste verfügbare Reduktion, die für die Zeitspanne noch mindestens points Werte liefert
+    Ist die Zeitspanne dafür zu kurz wird die feinste Reduktion verwendet
+    """
+
+    def selectReduction(self, spanMs, points):
+        reductions = sorted(int(reduction) for reduction in self.reductions if reduction > 0)
+        if len(reductions) == 0:
+            raise TebisException('Reduction not available')
+        candidates = [reduction for reduction in reductions if spanMs / reduction >= points]
+        if len(candidates) == 0:
+            return reductions[0]
+        return candidates[-1]
+
 # region Config Data from DB
     """
     lädt den gesamten Tree inkl. Gruppen und Messstellen
-    #TODO: Events in der DB registrieren um bei Änderungen neu einzulesen
+    Änderungen werden mit refreshMstsIncremental / 'autoRefresh' nachgeladen
     """
 
     def loadTree(self):
-        msts = []
+        rows = self.queryTree()
+        self.msts = self.buildMstsFromRows(rows)
+        self.mstByName = build_dict(self.msts, key="name")
+        self.mstById = build_dict(self.msts, key="id")
+        self.buildTreeFromRows(rows)
+
+    def queryTree(self):
         CONN_STR = '{user}/{psw}@{host}:{port}/{service}'.format(
             **self.config['OracleDbConn'])
         if self.config['OracleDbConn']['schema'] is None:
@@ -307,42 +705,44 @@ class Tebis():
         except ModuleNotFoundError:
             raise TebisOracleDBException(
                 'No Module for OracleDB found. Do "pip install cx_oracle" and install Oracle instant-client! (https://www.oracle.com/database/technologies/instant-client/winx64-64-downloads.html)')
-        cursor = conn.cursor()
-        mstsQuery = cursor.execute(
-            f'SELECT * FROM {SCHEMA}.TB_MSTS order by MSTINDEX', {}).fetchall()
-        cursor.close()
-        for mst in mstsQuery:
+        queries = {
+            'TB_MSTS': f'SELECT * FROM {SCHEMA}.TB_MSTS order by MSTINDEX',
+            'TB_VMSTS': f'SELECT * FROM {SCHEMA}.TB_VMSTS order by MSTINDEX',
+            'TB_HI': f'SELECT * FROM {SCHEMA}.TB_HI order by HIINDEX, HIPARENT, HIPOS',
+            'TB_GRPS': f'SELECT * FROM {SCHEMA}.TB_GRPS ORDER BY GRPINDEX',
+            'TB_GRP_ELEMS': f'SELECT * FROM {SCHEMA}.TB_GRP_ELEMS ORDER BY GRPINDEX, GRPPOS',
+            'TB_MAP_GRPS': f'SELECT * FROM {SCHEMA}.TB_MAP_GRPS ORDER BY HIINDEX,HIPOS',
+        }
+        rows = {}
+        for table, query in queries.items():
+            cursor = conn.cursor()
+            rows[table] = cursor.execute(query, {}).fetchall()
+            cursor.close()
+            self.configHashes[table] = hashlib.sha1(repr(rows[table]).encode('utf-8')).hexdigest()
+        conn.close()
+        return rows
+
+    def buildMstsFromRows(self, rows):
+        msts = []
+        for mst in rows['TB_MSTS']:
             msts.append(TebisRMST(mst))
-        cursor = conn.cursor()
-        vmstsQuery = cursor.execute(
-            f'SELECT * FROM {SCHEMA}.TB_VMSTS order by MSTINDEX', {}).fetchall()
-        cursor.close()
-        for mst in vmstsQuery:
+        for mst in rows['TB_VMSTS']:
             msts.append(TebisVMST(mst))
-        self.msts = msts
-        self.mstByName = build_dict(self.msts, key="name")
-        self.mstById = build_dict(self.msts, key="id")
-        cursor = conn.cursor()
-        treeQuery = cursor.execute(
-            f'SELECT * FROM {SCHEMA}.TB_HI order by HIINDEX, HIPARENT, HIPOS', {}).fetchall()
-        cursor.close()
+        return msts
+
+    def buildTreeFromRows(self, rows):
+        treeQuery = rows['TB_HI']
         self.tebisTree = []
         self.tebisTree.append(TebisTreeElement(treeQuery[0]))
         for result in treeQuery[1:]:
             actElem = TebisTreeElement(result)
             self.tebisTree[0].findNodeByID(
                 actElem.parent).childs.append(actElem)
-        cursor = conn.cursor()
-        groupQuery = cursor.execute(
-            f'SELECT * FROM {SCHEMA}.TB_GRPS ORDER BY GRPINDEX', {}).fetchall()
-        cursor.close()
+        groupQuery = rows['TB_GRPS']
         self.tebisGrps = []
         for group in groupQuery:
             self.tebisGrps.append(TebisGroupElement(group))
-        cursor = conn.cursor()
-        groupMembersQuery = cursor.execute(
-            f'SELECT * FROM {SCHEMA}.TB_GRP_ELEMS ORDER BY GRPINDEX, GRPPOS', {}).fetchall()
-        cursor.close()
+        groupMembersQuery = rows['TB_GRP_ELEMS']
         i = 0
         for grp in self.tebisGrps:
             for member in groupMembersQuery[i:]:
@@ -355,10 +755,7 @@ class Tebis():
                     break
         self.tebisGrpsById = build_dict(self.tebisGrps, key="id")
 
-        cursor = conn.cursor()
-        groupQuery = cursor.execute(
-            f'SELECT * FROM {SCHEMA}.TB_MAP_GRPS ORDER BY HIINDEX,HIPOS', {}).fetchall()
-        cursor.close()
+        groupQuery = rows['TB_MAP_GRPS']
         self.tebisMapTreeGroups = []
         id = -1
         for group in groupQuery:
@@ -370,8 +767,6 @@ class Tebis():
 
         self.tebisMapTreeGroupById = build_dict(
             self.tebisMapTreeGroups, key="treeId")
-        None
-        conn.close()
 
 # endregion
 
@@ -390,26 +785,30 @@ class Tebis():
         data = self.getConfigData("Grps", array)
 
     def loadMstsnVMstsFromSocket(self):
-        self.msts = []
-        msts = self.loadMstsFromSocket()
-        for i in range(0, len(msts)):
-            self.msts.append(TebisRMST().setValuesFromSocketInterface(msts[i]))
-        vmsts = self.loadVmstsFromSocket()
-        for i in range(0, len(vmsts)):
-            self.msts.append(TebisVMST().setValuesFromSocketInterface(vmsts[i]))
+        self.msts = self.buildMstsFromSocket()
         self.mstByName = build_dict(self.msts, key="name")
         self.mstById = build_dict(self.msts, key="id")
 
-    def loadMstsFromSocket(self):
+    def buildMstsFromSocket(self, rawMsts=None, rawVmsts=None):
+        result = []
+        msts = self.loadMstsFromSocket(rawMsts)
+        for i in range(0, len(msts)):
+            result.append(TebisRMST().setValuesFromSocketInterface(msts[i]))
+        vmsts = self.loadVmstsFromSocket(rawVmsts)
+        for i in range(0, len(vmsts)):
+            result.append(TebisVMST().setValuesFromSocketInterface(vmsts[i]))
+        return result
+
+    def loadMstsFromSocket(self, raw=None):
         array = np.dtype([('ID', (np.int64)), ('MSTName', np.str_, 100), ('UNIT', np.str_, 10), ('MSTDesc', np.str_, 255), (
             'Val1', (np.float32)), ('Val2', (np.float32)), ('Val3', (np.float32)), ('Val4', (np.float32)), ('Val5', (np.float32))])
-        data = self.getConfigData("Msts", array)
+        data = self.getConfigData("Msts", array, raw)
         return data
 
-    def loadVmstsFromSocket(self):
+    def loadVmstsFromSocket(self, raw=None):
         array = np.dtype([('ID', (np.int64)), ('MSTName', np.str_, 100), ('UNIT', 'U10'), (
             'MSTDesc', np.str_, 255), ('Rate', (np.int64)), ('Formula', np.str_, 255), ('refresh', (np.int64))])
-        data = self.getConfigData("VMsts", array)
+        data = self.getConfigData("VMsts", array, raw)
         return data
 
     """
@@ -418,19 +817,9 @@ class Tebis():
     Der Tree und die Gruppen kommen hier allerdings nicht zurück
     """
 
-    def getConfigData(self, type, npArray):
-        strRequest = "<tebis>\n"
-        strRequest += "<szConfigFile>" + \
-            self.config['configfile'] + "</szConfigFile>\n"
-        strRequest += "<szProcedure>GetConfig</szProcedure>\n"
-        strRequest += "<szTebObjType>" + type + "</szTebObjType>\n"
-        strRequest += "<tebis>"
-        self.socketConnect()
-        # Send Request
-        self.sendOnSocket(strRequest)
-        # Recieve MSTS Packet
-        raw = self.receiveOnSocket()
-        self.socketClose()
+    def getConfigData(self, type, npArray, raw=None):
+        if raw is None:
+            raw = self.getConfigRaw(type)
         f = StringIO(str(raw, encoding='iso-8859-1'))
         reader = csv.reader(f, delimiter=',', quotechar="'")
         rawSplit = []
@@ -439,6 +828,17 @@ class Tebis():
                 rawSplit.append(item.replace("'", ""))
         return self.__checkResultHeader(rawSplit, npArray)
 
+    def getConfigRaw(self, type):
+        strRequest = "<tebis>\n"
+        strRequest += "<szConfigFile>" + \
+            self.config['configfile'] + "</szConfigFile>\n"
+        strRequest += "<szProcedure>GetConfig</szProcedure>\n"
+        strRequest += "<szTebObjType>" + type + "</szTebObjType>\n"
+        strRequest += "<tebis>"
+        raw = self.requestOnSocket(strRequest, self.getDeadline())
+        self.configHashes[type] = hashlib.sha1(raw).hexdigest()
+        return raw
+
 # endregion
 # endregion
 
@@ -586,176 +986,9 @@ class Tebis():
 # endregion
 
 # region binary result handling
-    def __checkBinaryResultHeader(self, raw, dtype, resultarr=None, offset=0):
-        m_intPos = 0
-        m_intNmbResultSet = int(raw[m_intPos])
-        m_intPos += 2
-        nextComma = m_intPos + raw[m_intPos:].find(b',')
-        m_intLengthResultSet = int(raw[m_intPos:nextComma])
-        m_intPos = nextComma + 1
-        intHeader = struct.unpack('>iiiiiiiii', raw[m_intPos:m_intPos + 36])
-        m_intPos += 36
-        intFooter = struct.unpack('>iiii', raw[-16:])
-        if(intHeader[0] != -1 or intHeader[1] != 463453 or intHeader[2] != 756543 or intHeader[3] != -1 or intFooter[0] != -1 or intFooter[1] != 463453 or intFooter[2] != 756543 or intFooter[3] != -1):
-            return False
-        if intHeader[4] != 2:
-            return False
-        m_intNmbCols = intHeader[5]
-        m_intNmbRows = intHeader[6]
-        m_int1 = intHeader[7]
-        m_int2 = intHeader[8]
-        if m_int2 != -1:
-            data = zlib.decompress(raw[m_intPos:-16])
-            datalen = len(data)
-        else:
-            data = raw[m_intPos:-16]
-        if(m_intNmbCols < 0 or m_intNmbRows < 0):
-            return False
-        m_intPos = 0
-        if resultarr is None:
-            resultarr = np.empty(m_intNmbRows, dtype=dtype)
-        for x in range(0 + offset, m_intNmbCols + offset):
-            column_name = resultarr.dtype.names[x]
-            col = struct.unpack('>hh', data[m_intPos:m_intPos + 4])
-            m_intPos += 4
-            intZero = col[0]  # ?
-            intColType = col[1]  # ?  301 == Timestamp?  | 8 = WertSpalte
-            precount = 0
-            segments = []
-            while precount < m_intNmbRows:  # Schauen ob die Spalte in mehrere Blöcke aufgeteilt ist
-                Length = struct.unpack('>B', data[m_intPos:m_intPos + 1])[0]
-                m_intPos += 1
-                # Die Anzahl ist größer als ein Byte dann kommt die Anzahl als Int (4Byte)
-                if Length == 255:
-                    m_intLength = struct.unpack(
-                        '>I', data[m_intPos:m_intPos + 4])[0]
-                    m_intPos += 4
-                else:
-                    m_intLength = Length
-                m_isNAN = struct.unpack('>B', data[m_intPos:m_intPos + 1])[0]
-                m_intPos += 1
-                if m_isNAN == 0:
-                    segments.append([precount, m_intLength])
-                elif m_isNAN == 255:
-                    resultarr[column_name][precount:precount +
-                                           m_intLength] = np.nan
-                else:
-                    None
-                precount += m_intLength
-            # Die Breite des Datentyps in Bytes
-            m_intByteCount = struct.unpack(
-                '>B', data[m_intPos:m_intPos + 1])[0]
-            m_intPos += 1
-            # Die Funktion 111 = Ein Wert in allen Zeilen |
-            m_intFunction = struct.unpack('>B', data[m_intPos:m_intPos + 1])[0]
-            m_intPos += 1
-            if intColType == 301:  # TimeStamp Col
-                for segment in segments:
-                    y = segment[0]
-                    m_intLength = segment[1]
-                    value = struct.unpack('>qq', data[m_intPos:m_intPos + 16])
-                    m_intStepSize = value[1]
-                    if offset != 0:
-                        x -= 1
-                    else:
-                        resultarr[column_name][y:y + m_intLength] = np.linspace(value[0], value[0] + (
-                            m_intLength * m_intStepSize) - m_intStepSize, num=m_intLength)
-                    m_intPos += 16
-            elif intColType == 8:  # Wert Col
-                if m_intFunction == 109:  # ?  alle Werte nan?
-                    for segment in segments:
-                        y = segment[0]
-                        m_intLength = segment[1]
-                        if m_isNAN == 255:
-                            resultarr[column_name][y:y + m_intLength] = np.nan
-                        else:
-                            None
-                elif m_intFunction == 110:  # alle Werte sind unterschiedlich
-                    for segment in segments:
-                        y = segment[0]
-                        m_intLength = segment[1]
-                        values = self.__getValueFromBinArray(
-                            data, m_intPos, m_intByteCount, arraycount=m_intLength)
-                        resultarr[column_name][y:y + m_intLength] = values[0]
-                        m_intPos = int(values[1])
-                elif m_intFunction == 111:  # Alle Werte gleich
-                    value = self.__getValueFromBin(
-                        data, m_intPos, m_intByteCount)
-                    m_intPos = int(value[1])
-                    step = self.__getValueFromBin(
-                        data, m_intPos, m_intByteCount)
-                    m_intPos = int(step[1])
-                    for segment in segments:
-                        y = segment[0]
-                        m_intLength = segment[1]
-                        resultarr[column_name][y:y + m_intLength] = np.linspace(
-                            value[0], value[0] + (m_intLength * step[0]) - step[0], num=m_intLength)
-                    None
-                elif m_intFunction == 112:  # Gruppen gleicher Werte
-                    m_intGroupCount = 0
-                    for segment in segments:
-                        y = segment[0]
-                        m_intSegmentLength = segment[1]
-                        valcount = 0
-                        while valcount < m_intSegmentLength:
-                            if m_intGroupCount == 0:
-                                m_intGroupCount = struct.unpack(
-                                    '>B', data[m_intPos:m_intPos + 1])[0]
-                                m_intPos += 1
-                                if m_intGroupCount == 0:
-                                    break
-                                value = self.__getValueFromBin(
-                                    data, m_intPos, m_intByteCount)
-                                m_intPos = int(value[1])
-                            length = m_intGroupCount
-                            if valcount + length > m_intSegmentLength:
-                                length = m_intSegmentLength - valcount
-                            m_intGroupCount -= length
-
-                            resultarr[column_name][y + valcount:y +
-                                                   valcount + length] = value[0]
-                            valcount += length
-                else:
-                    None
-            None
-        None
-        return resultarr
-
-    def __getValueFromBin(self, data, pos, bytecount, type=None):
-        result = [0.0, pos]
-        if bytecount == 8:
-            result[0] = struct.unpack('>d', data[pos:pos + bytecount])[0]
-            result[1] += bytecount
-        elif bytecount == 4:
-            result[0] = struct.unpack('>i', data[pos:pos + (bytecount)])[0]
-            result[1] += bytecount
-        elif bytecount == 2:
-            result[0] = struct.unpack('>h', data[pos:pos + (bytecount)])[0]
-            result[1] += bytecount
-        elif bytecount == 1:
-            result[0] = struct.unpack('>b', data[pos:pos + (bytecount)])[0]
-            result[1] += bytecount
-        return result
-
-    def __getValueFromBinArray(self, data, pos, bytecount, arraycount=1, type=None):
-        result = [0.0, pos]
-        if bytecount == 8:
-            result[0] = struct.unpack(
-                f'>{arraycount}d', data[pos:pos + (bytecount * arraycount)])
-            result[1] += bytecount * arraycount
-        elif bytecount == 4:
-            result[0] = struct.unpack(
-                f'>{arraycount}i', data[pos:pos + (bytecount * arraycount)])
-            result[1] += bytecount * arraycount
-        elif bytecount == 2:
-            result[0] = struct.unpack(
-                f'>{arraycount}h', data[pos:pos + (bytecount * arraycount)])
-            result[1] += bytecount * arraycount
-        elif bytecount == 1:
-            result[0] = struct.unpack(
-                f'>{arraycount}b', data[pos:pos + (bytecount * arraycount)])
-            result[1] += bytecount * arraycount
-        return result
+    def __checkBinaryResultHeader(self, raw, dtype, resultarr=None, offset=0, cacheKeys=None, changed=None):
+        return decodeBinaryResult(raw, dtype, resultarr, offset, self.instrumentation,
+                                  self.columnCache if cacheKeys is not None else None, cacheKeys, changed)
 
 # endregion
 
@@ -763,48 +996,288 @@ class Tebis():
 
 # region Socket handling
 
-    def socketConnect(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((self.config['host'], self.config['port']))
-        logging.debug(f"Connect to Tebis-Socket {self.config['host']}:{self.config['port']}")
+    # the socket of the last socketConnect() is stored per thread
+    @property
+    def sock(self):
+        return getattr(self.threadState, 'sock', None)
 
-    def socketClose(self):
-        self.sock.shutdown(1)
-        self.sock.close()
+    @sock.setter
+    def sock(self, sock):
+        self.threadState.sock = sock
 
-    def sendOnSocket(self, msg):
+    def socketConnect(self, endpoint=None, deadline=None):
+        host, port = (self.config['host'], self.config['port']) if endpoint is None else endpoint
+        timeout = self.remainingTime(deadline, self.config['timeouts']['connect'])
+        with self.instrumentation.span('connect', host=host):
+            try:
+                sock = socket.create_connection((host, port), timeout=timeout)
+            except socket.timeout as e:
+                raise TebisTimeoutException(f"Connect to Tebis-Socket {host}:{port} timed out") from e
+            except OSError as e:
+                raise TebisConnectionException(f"Connect to Tebis-Socket {host}:{port} failed: {e}") from e
+        sock.settimeout(self.config['timeouts']['read'])
+        logging.debug(f"Connect to Tebis-Socket {host}:{port}")
+        self.sock = sock
+        return sock
+
+    def socketClose(self, sock=None):
+        sock = self.sock if sock is None else sock
+        try:
+            sock.shutdown(1)
+        except OSError:
+            None  # already closed by the server
+        sock.close()
+
+    def sendOnSocket(self, msg, sock=None, deadline=None):
+        sock = self.sock if sock is None else sock
+        msg = msg.encode('latin-1')
         totalsent = 0
-        while totalsent < len(msg):
-            sent = self.sock.send((msg[totalsent:]).encode('latin-1'))
-            if sent == 0:
-                raise RuntimeError("socket connection broken")
-            totalsent = totalsent + sent
-
-    def receiveOnSocket(self):
+        with self.instrumentation.span('send'):
+            while totalsent < len(msg):
+                self.__setSocketTimeout(sock, deadline)
+                try:
+                    sent = sock.send(msg[totalsent:])
+                except socket.timeout as e:
+                    raise TebisTimeoutException("Sending the request timed out") from e
+                except OSError as e:
+                    raise TebisConnectionException(f"socket connection broken: {e}") from e
+                if sent == 0:
+                    raise TebisConnectionException("socket connection broken")
+                totalsent = totalsent + sent
+        self.instrumentation.count('requestBytes', totalsent)
+
+    def receiveOnSocket(self, sock=None, deadline=None, timing=None):
+        '''reads an answer, timing (dict) gets the perf_counter() of the arrival of the header as 'header' '''
+        sock = self.sock if sock is None else sock
         chunks = []
         bytes_recd = 0
-        header = self.sock.recv(16)
-        if header == '':
-            raise RuntimeError("socket connection broken")
+        header = b''
+        with self.instrumentation.span('wait'):
+            while len(header) < 16:
+                header += self.__recv(sock, 16 - len(header), deadline)
+        if timing is not None:
+            timing['header'] = time.perf_counter()
         header = header.rstrip(b'\x00').split(b' ')
         version = int(header[0])
         error = int(header[1])
         size = int(header[2])
         if error == 1:
             raise TebisException
-        while bytes_recd < size:
-            chunk = self.sock.recv(min(size - bytes_recd, 4096))
-            if chunk == '':
-                raise RuntimeError("socket connection broken")
-            chunks.append(chunk)
-            bytes_recd = bytes_recd + len(chunk)
+        with self.instrumentation.span('receive', bytes=size):
+            while bytes_recd < size:
+                chunk = self.__recv(sock, min(size - bytes_recd, 4096), deadline)
+                chunks.append(chunk)
+                bytes_recd = bytes_recd + len(chunk)
+        self.instrumentation.count('payloadBytes', bytes_recd)
         return b''.join(chunks)
 
+    def __recv(self, sock, size, deadline):
+        self.__setSocketTimeout(sock, deadline)
+        try:
+            chunk = sock.recv(size)
+        except socket.timeout as e:
+            raise TebisTimeoutException("Waiting for the answer of the Tebis-Socket timed out") from e
+        except OSError as e:
+            raise TebisConnectionException(f"socket connection broken: {e}") from e
+        if not chunk:
+            raise TebisConnectionException("socket connection broken")
+        return chunk
+
+    def __setSocketTimeout(self, sock, deadline):
+        if deadline is not None:
+            sock.settimeout(self.remainingTime(deadline, self.config['timeouts']['read']))
+
+    """
+    Deadline einer Abfrage als time.monotonic() Zeitpunkt, None ohne Limit
+    """
+
+    def getDeadline(self, timeout=None):
+        timeout = self.config['timeouts']['total'] if timeout is None else timeout
+        if timeout is None:
+            return None
+        return time.monotonic() + timeout
+
+    def remainingTime(self, deadline, limit=None):
+        '''seconds until the deadline, at most limit. Raises TebisTimeoutException if the deadline has passed'''
+        if deadline is None:
+            return limit
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TebisTimeoutException("Deadline of the Tebis query exceeded")
+        return remaining if limit is None else min(remaining, limit)
+
+    """
+    der gemeinsame Limiter des Servers ('limits'), None wenn die Limits nicht aktiv sind
+    """
+
+    def getLimiter(self, endpoint=None):
+        limits = self.config['limits']
+        if not limits['enable']:
+            return None
+        host, port = (self.config['host'], self.config['port']) if endpoint is None else endpoint
+        return getLimiter(host, port, limits['maxConcurrent'], limits['requestsPerSecond'], limits['bytesPerSecond'],
+                          limits['burst'])
+
+    """
+    Priorität der Requests des aufrufenden Threads, z.B. für Exporte im Hintergrund:
+    with teb.requestPriority('bulk'):
+        teb.getDataAsNP(...)
+    """
+
+    @contextlib.contextmanager
+    def requestPriority(self, priority):
+        parsePriority(priority)
+        previous = getattr(self.threadState, 'priority', None)
+        self.threadState.priority = priority
+        try:
+            yield
+        finally:
+            self.threadState.priority = previous
+
+    def currentPriority(self, priority=None):
+        '''priority if given, else the one of the thread (requestPriority) or the configured one'''
+        if priority is None:
+            priority = getattr(self.threadState, 'priority', None)
+        return self.config['limits']['priority'] if priority is None else priority
+
+    """
+    sendet einen Request und liefert die Antwort
+    Bei Fehlern, Timeouts und abgebrochenen Verbindungen wird der Request mit exponentiellem Backoff wiederholt ('retry'),
+    solange die Deadline nicht überschritten ist.
+    Mit points werden Latenz und Durchsatz für die adaptive Größe der LoadData Requests gemessen.
+    """
+
+    def requestOnSocket(self, strRequest, deadline=None, points=None, priority=None):
+        retry = self.config['retry']
+        attempts = max(1, int(retry['attempts']))
+        for attempt in range(attempts):
+            try:
+                return self.requestOnce(strRequest, deadline, points, priority=priority)
+            except TebisException as e:
+                if attempt + 1 >= attempts:
+                    raise
+                wait = min(retry['maxBackoff'], retry['backoff'] * 2 ** attempt)
+                if retry['jitter']:
+                    wait = random.uniform(0, wait)
+                if deadline is not None and time.monotonic() + wait >= deadline:
+                    raise TebisTimeoutException("Deadline of the Tebis query exceeded") from e
+                logging.getLogger('pytebis').warning(f"Tebis request failed ({e!r}), retry {attempt + 1} in {wait:.2f}s")
+                self.instrumentation.count('retries')
+                time.sleep(wait)
+
+    def requestOnce(self, strRequest, deadline=None, points=None, endpoint=None, priority=None):
+        limiter = self.getLimiter(endpoint)
+        if limiter is not None:
+            with self.instrumentation.span('queue'):
+                if not limiter.acquire(self.currentPriority(priority), self.remainingTime(deadline)):
+                    raise TebisTimeoutException("Deadline of the Tebis query exceeded while waiting for a request slot")
+        requestStart = time.perf_counter()
+        transferred = 0
+        timing = {}
+        try:
+            sock = self.socketConnect(endpoint, deadline)
+            try:
+                # Send Request
+                self.sendOnSocket(strRequest, sock, deadline)
+                transferred = len(strRequest)
+                # Recieve Packet
+                raw = self.receiveOnSocket(sock, deadline, timing)
+                transferred += len(raw)
+            finally:
+                self.socketClose(sock)
+        finally:
+            if limiter is not None:
+                limiter.release(transferred)
+        if points is not None:
+            # time to the first byte of the answer incl. the think time of the server, the rest is the transfer
+            self.updateRequestStats(points, timing['header'] - requestStart, time.perf_counter() - requestStart)
+        return raw
+
 # endregion
     def getBinDataRAW(self, filepath, ids=None, nCT=1, nNmbX=1, TimeR=time.time()):
-        
+        nCT, nNmbX, timeR = self.alignBinRange(nCT, nNmbX, TimeR)
+        # the raw frames are consumed by clients which expect the full timespan per frame
+        plan = self.planLoadData(ids, nNmbX, timeR, nCT, allowTimeSplit=False)
+        frames = []
+        with open(filepath, 'ab') as fpout:
+            for (ids, offset, timeR, nmbX, rowOffset), MSTSRaw in self.iterRawChunks(plan, nCT):
+                rawdata = bytearray(struct.pack(f'>q{len(ids)}q', len(ids), *[int(id) for id in ids]))
+                if MSTSRaw is not None:
+                    rawdata.extend(len(MSTSRaw).to_bytes(8, 'big'))
+                    rawdata.extend(MSTSRaw)
+                fpout.write(rawdata)
+                frames.append(rawdata)
+        return b''.join(frames)
+
+    """
+    liefert die unverarbeiteten Antworten des Servers als Frames (siehe pytebis.rawframes), ein memoryview je LoadData Request
+    Die Requests laufen parallel ('maxParallel'), die Frames kommen in der Reihenfolge des Plans.
+    """
+
+    def iterDataRAW(self, names, start, end, rate=1):
+        ids = self.resolveIds(names)
+        nTimeR, nNmbX = alignRange(start, end, rate)
+        nCT, nNmbX, timeR = self.alignBinRange(rate, nNmbX, nTimeR)
+        if nNmbX <= 0:
+            return
+        plan = self.planLoadData(ids, nNmbX, timeR, nCT)
+        for index, ((chunkIds, offset, timeR, nmbX, rowOffset), MSTSRaw) in enumerate(self.iterRawChunks(plan, nCT)):
+            yield memoryview(buildFrame(index, len(plan), chunkIds, offset, rowOffset, nmbX, nCT, timeR, MSTSRaw))
+
+    """
+    schreibt die Frames von iterDataRAW in eine Datei (Pfad), einen binären Stream oder einen Socket
+    Zurück kommt die Anzahl der geschriebenen Bytes.
+    """
+
+    def streamDataRAW(self, out, names, start, end, rate=1):
+        if isinstance(out, (str, bytes)) or hasattr(out, '__fspath__'):
+            with open(out, 'wb') as f:
+                return self.streamDataRAW(f, names, start, end, rate)
+        size = 0
+        for frame in self.iterDataRAW(names, start, end, rate):
+            writeFrame(out, frame)
+            size += len(frame)
+        return size
+
+    """
+    führt die Requests eines Plans parallel aus und liefert (Plan-Eintrag, Antwort) in der Reihenfolge des Plans
+    Es laufen max. 'maxParallel' Requests gleichzeitig, damit bleiben auch nur so viele Antworten im Speicher.
+    Einträge ohne Zeilen (nNmbX <= 0) werden nicht abgefragt, die Antwort ist dann None.
+    """
+
+    def iterRawChunks(self, plan, nCT, deadline=None):
+        if deadline is None:
+            deadline = self.getDeadline()
+        workers = max(1, min(int(self.config['requests']['maxParallel']), len(plan)))
+        self.instrumentation.count('chunks', len(plan))
+        # the worker threads use the priority of the caller
+        priority = self.currentPriority()
+
+        def load(ids, offset, timeR, nmbX, rowOffset):
+            if nmbX <= 0:
+                return None
+            return self.requestLoadData(ids, nCT, nmbX, timeR, deadline, priority)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pytebis') as pool:
+            futures = []
+            try:
+                for i, entry in enumerate(plan):
+                    futures.append(pool.submit(load, *entry))
+                    if len(futures) >= workers:
+                        yield plan[i - len(futures) + 1], futures.pop(0).result()
+                for j, future in enumerate(futures):
+                    yield plan[len(plan) - len(futures) + j], future.result()
+            finally:
+                # a failed request or a closed iterator stops the remaining requests
+                for future in futures:
+                    future.cancel()
+
+    """
+    rechnet Auflösung (Sekunden), Anzahl und rechten Rand wie __getBinData auf den Server um
+    Zurück kommt (nCT in ms, nNmbX, TimeR)
+    """
+
+    def alignBinRange(self, nCT, nNmbX, TimeR):
         start = round(time.time() * 1000)
-        #TimeR = TimeR * 1000.0
         nCT = int(nCT*1000.0)
         nCT = self.checkIfReductionAvailable(nCT)
         if TimeR > start:
@@ -814,60 +1287,8 @@ class Tebis():
         timeR_new = int(int(int(int(TimeR) / int(nCT)) * int(nCT)))
         dif = int(int(int(TimeR) - timeR_new) / int(nCT))
         nNmbX = int(nNmbX - dif)
-        n = 50
-        data = None
-        types = [('timestamp', (np.int64))]
-        for id in ids:
-            mst = self.getMst(id=id)
-            types.append((str(mst.name), (np.float32)))
-        x = [ids[i:i + n] for i in range(0, len(ids), n)]
-        offset = 0
-        
-        for ids in x:
-            rawdata = bytearray()
-            arrMsts = ""
-            rawdata.extend(len(ids).to_bytes(8,'big'))
-            for id in ids:
-                arrMsts += str(id) + ', '
-                rawdata.extend(id.item().to_bytes(8,'big'))
-            arrMsts = arrMsts[:-2]
-            #print(arrMsts)
-            if nNmbX > 0:
-                strRequest = "<tebis>\n"
-                strRequest += "<szConfigFile>" + \
-                    self.config['configfile'] + "</szConfigFile>\n"
-                strRequest += "<szProcedure>LoadData</szProcedure>\n"
-                strRequest += "<arrMsts>" + arrMsts + "</arrMsts>\n"
-                strRequest += "<nNmbX>" + str(nNmbX) + "</nNmbX>\n"
-                strRequest += "<nCT>" + str(int(nCT)) + "</nCT>\n"
-                strRequest += "<nTimeR>" + \
-                    str(timeR_new) + "</nTimeR>\n"
-                strRequest += "<tebis>"
-                try:
-                    self.socketConnect()
-                    # Send Request
-                    self.sendOnSocket(strRequest)
-                    # Recieve MSTS Packet
-                    MSTSRaw = self.receiveOnSocket()
-                except TebisException:
-                    self.socketConnect()
-                    # Send Request
-                    self.sendOnSocket(strRequest)
-                    # Recieve MSTS Packet
-                    MSTSRaw = self.receiveOnSocket()  
-                rawdata.extend(len(MSTSRaw).to_bytes(8,'big'))
-                rawdata.extend(MSTSRaw)
-                #print(len(ids)) 
-                #print(MSTSRaw)
-                #data = self.__checkBinaryResultHeader(
-                #    MSTSRaw, types, data, offset)
-                #offset += len(ids)
-            #data['timestamp'] = data['timestamp'] / 1000.0
-            with open(filepath, 'ab') as fpout:
-                fpout.write(rawdata)
-            #print(os.path.getsize(filepath))
-        return rawdata
-    
+        return nCT, nNmbX, timeR_new
+
     """
     schnelles Lesen von Messreihen
     ids= Array mit den Messtellen-Namen
@@ -877,59 +1298,291 @@ class Tebis():
     """
 
     def __getBinData(self, ids=None, nCT=1, nNmbX=1, TimeR=time.time()):
-        start = round(time.time() * 1000)
-        #TimeR = TimeR * 1000.0
-        nCT = int(nCT*1000.0)
-        nCT = self.checkIfReductionAvailable(nCT)
-        if TimeR > start:
-            dif = int(TimeR - start) / int(nCT)
-            TimeR = int(start)
-            nNmbX = int(nNmbX - dif)
-        timeR_new = int(int(int(int(TimeR) / int(nCT)) * int(nCT)))
-        dif = int(int(int(TimeR) - timeR_new) / int(nCT))
-        nNmbX = int(nNmbX - dif)
-        n = 100
+        nCT, nNmbX, timeR_new = self.alignBinRange(nCT, nNmbX, TimeR)
         data = None
         types = [('timestamp', (np.int64))]
         for id in ids:
             mst = self.getMst(id=id)
             types.append((str(mst.name), (np.float32)))
-        x = [ids[i:i + n] for i in range(0, len(ids), n)]
-        offset = 0
-        for ids in x:
-            arrMsts = ""
-            for id in ids:
-                arrMsts += str(id) + ', '
-            arrMsts = arrMsts[:-2]
-            if nNmbX > 0:
-                strRequest = "<tebis>\n"
-                strRequest += "<szConfigFile>" + \
-                    self.config['configfile'] + "</szConfigFile>\n"
-                strRequest += "<szProcedure>LoadData</szProcedure>\n"
-                strRequest += "<arrMsts>" + arrMsts + "</arrMsts>\n"
-                strRequest += "<nNmbX>" + str(nNmbX) + "</nNmbX>\n"
-                strRequest += "<nCT>" + str(int(nCT)) + "</nCT>\n"
-                strRequest += "<nTimeR>" + \
-                    str(timeR_new) + "</nTimeR>\n"
-                strRequest += "<tebis>"
+        if nNmbX <= 0:
+            return data
+        if self.config['requests']['singleFlight']:
+            return self.__getBinDataSingleFlight(ids, nCT, nNmbX, timeR_new, types)
+        return self.__loadBinData(ids, nCT, nNmbX, timeR_new, types)
+
+    def __loadBinData(self, ids, nCT, nNmbX, timeR, types):
+        data = None
+        plan = self.planLoadData(ids, nNmbX, timeR, nCT)
+        if any(rowOffset != 0 for ids, offset, timeR, nmbX, rowOffset in plan):
+            data = np.empty(nNmbX, dtype=types)
+        return self.executeLoadPlan(plan, nCT, types, data)
+
+    """
+    gleiche Abfragen, die gleichzeitig laufen, teilen sich die Requests ('singleFlight')
+    Läuft bereits eine Abfrage mit gleicher Reduktion und gleichem Zeitfenster, die alle ids enthält, wird auf deren Ergebnis gewartet.
+    Jeder Aufrufer bekommt eine View mit seinen Spalten auf das gemeinsame Ergebnis.
+    """
+
+    def __getBinDataSingleFlight(self, ids, nCT, nNmbX, timeR, types):
+        key = (nCT, timeR, nNmbX)
+        names = [name for name, type in types]
+        with self.inFlightLock:
+            flight = next((f for f in self.inFlight.get(key, []) if f.ids.issuperset(ids)), None)
+            leader = flight is None
+            if leader:
+                flight = TebisFlight(ids)
+                self.inFlight.setdefault(key, []).append(flight)
+        if leader:
+            try:
+                flight.result = self.__loadBinData(ids, nCT, nNmbX, timeR, types)
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self.inFlightLock:
+                    self.inFlight[key].remove(flight)
+                    if len(self.inFlight[key]) == 0:
+                        del self.inFlight[key]
+                flight.done.set()
+        else:
+            self.instrumentation.count('coalesced')
+            if not flight.done.wait(self.remainingTime(self.getDeadline())):
+                raise TebisTimeoutException("Deadline of the Tebis query exceeded")
+            if flight.error is not None:
+                raise flight.error
+        if flight.result is None:
+            return None
+        return flight.result[names]
+
+    """
+    führt die Requests eines Plans aus und dekodiert sie in das Ergebnis
+    Mit 'maxParallel' > 1 werden die Requests parallel abgefragt, das Dekodieren erfolgt im aufrufenden Thread.
+    Ist data None wird das Ergebnis anhand des ersten Requests angelegt (nur bei einem Zeitabschnitt möglich)
+    Mit changed (set) werden unveränderte Spalten aus dem columnCache übernommen und die Namen der geänderten Spalten gesammelt.
+    """
+
+    def executeLoadPlan(self, plan, nCT, types, data=None, deadline=None, changed=None):
+        if deadline is None:
+            deadline = self.getDeadline()
+        if int(self.config['requests']['decodeProcesses']) > 0 and len(plan) > 0 and changed is None:
+            result = self.executeLoadPlanShared(plan, nCT, types, deadline)
+            if data is None:
+                return result
+            data[:] = result
+            return data
+        def decode(MSTSRaw, ids, offset, nmbX, rowOffset):
+            nonlocal data
+            cacheKeys = None
+            if changed is not None:
+                cacheKeys = [(int(id), int(nCT), nmbX, rowOffset) for id in ids]
+            with self.instrumentation.span('decode', bytes=len(MSTSRaw)):
+                if data is None:
+                    result = self.__checkBinaryResultHeader(
+                        MSTSRaw, types, data, offset, cacheKeys, changed)
+                else:
+                    result = self.__checkBinaryResultHeader(
+                        MSTSRaw, types, data[rowOffset:rowOffset + nmbX], offset, cacheKeys, changed)
+            # a preallocated result would be returned with uninitialized rows
+            if result is False:
+                raise TebisException('Invalid LoadData answer')
+            if data is None:
+                data = result
+        workers = min(int(self.config['requests']['maxParallel']), len(plan))
+        self.instrumentation.count('chunks', len(plan))
+        if workers <= 1:
+            for ids, offset, timeR, nmbX, rowOffset in plan:
+                decode(self.requestLoadData(ids, nCT, nmbX, timeR, deadline), ids, offset, nmbX, rowOffset)
+        else:
+            # the worker threads use the priority of the caller
+            priority = self.currentPriority()
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pytebis') as pool:
+                futures = dict((pool.submit(self.requestLoadData, ids, nCT, nmbX, timeR, deadline, priority), (ids, offset, nmbX, rowOffset))
+                               for ids, offset, timeR, nmbX, rowOffset in plan)
                 try:
-                    self.socketConnect()
-                    # Send Request
-                    self.sendOnSocket(strRequest)
-                    # Recieve MSTS Packet
-                    MSTSRaw = self.receiveOnSocket()
-                except TebisException:
-                    self.socketConnect()
-                    # Send Request
-                    self.sendOnSocket(strRequest)
-                    # Recieve MSTS Packet
-                    MSTSRaw = self.receiveOnSocket()
-                data = self.__checkBinaryResultHeader(
-                    MSTSRaw, types, data, offset)
-                offset += len(ids)
-            #data['timestamp'] = data['timestamp'] / 1000.0
+                    for future in as_completed(futures):
+                        decode(future.result(), *futures[future])
+                except BaseException:
+                    # don't start the remaining requests of a failed query
+                    for future in futures:
+                        future.cancel()
+                    raise
+        if isinstance(data, np.ndarray):
+            self.instrumentation.count('rows', len(data))
+            self.instrumentation.count('columns', len(types) - 1)
         return data
 
+    """
+    wie executeLoadPlan, das Dekodieren erfolgt aber in 'decodeProcesses' Worker-Prozessen
+    Die Antworten werden über Shared Memory übergeben und direkt in ein gemeinsames Ergebnis-Array (ebenfalls Shared Memory) dekodiert,
+    es wird nichts gepickelt. Die Größe des Ergebnisses ergibt sich aus dem Plan.
+    """
+
+    def executeLoadPlanShared(self, plan, nCT, types, deadline=None):
+        dtype = np.dtype(types)
+        rows = max(rowOffset + nmbX for ids, offset, timeR, nmbX, rowOffset in plan)
+        pool = self.getDecodePool()
+        output = shared_memory.SharedMemory(create=True, size=max(1, rows * dtype.itemsize))
+        inputs = []
+        try:
+            decodes = []
+            workers = max(1, min(int(self.config['requests']['maxParallel']), len(plan)))
+            self.instrumentation.count('chunks', len(plan))
+            priority = self.currentPriority()
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pytebis') as fetchPool:
+                futures = dict((fetchPool.submit(self.requestLoadData, ids, nCT, nmbX, timeR, deadline, priority), (offset, nmbX, rowOffset))
+                               for ids, offset, timeR, nmbX, rowOffset in plan)
+                try:
+                    for future in as_completed(futures):
+                        offset, nmbX, rowOffset = futures[future]
+                        raw = future.result()
+                        source = shared_memory.SharedMemory(create=True, size=max(1, len(raw)))
+                        source.buf[:len(raw)] = raw
+                        inputs.append(source)
+                        decode = pool.submit(decodeShared, source.name, len(raw), output.name, dtype, rows, rowOffset, nmbX, offset)
+                        decodes.append(decode)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            with self.instrumentation.span('decode', chunks=len(decodes)):
+                for decode in decodes:
+                    if decode.result() is False:
+                        raise TebisException('Invalid LoadData answer')
+            data = np.ndarray(rows, dtype=dtype, buffer=output.buf).copy()
+        finally:
+            for source in inputs:
+                releaseSharedMemory(source)
+            output.close()
+            output.unlink()
+        self.instrumentation.count('rows', len(data))
+        self.instrumentation.count('columns', len(types) - 1)
+        return data
+
+    def getDecodePool(self):
+        with self.decodePoolLock:
+            if self.decodePool is None:
+                # spawn: forking a process with running threads is not safe
+                self.decodePool = concurrent.futures.ProcessPoolExecutor(max_workers=int(self.config['requests']['decodeProcesses']),
+                                                      mp_context=multiprocessing.get_context('spawn'))
+            return self.decodePool
+
+    def closeDecodePool(self):
+        with self.decodePoolLock:
+            if self.decodePool is not None:
+                self.decodePool.shutdown()
+                self.decodePool = None
+
+    """
+    lädt mehrere Zeitabschnitte in ein gemeinsames structured Array
+    Überlappende und aneinander grenzende Abschnitte werden zusammengefasst, alle Requests laufen über einen gemeinsamen Plan.
+    Das Ergebnis ist nach der Zeit sortiert.
+    """
+
+    def getDataAsNPMulti(self, names, ranges, rate=1):
+        ids = self.resolveIds(names)
+        nCT = self.checkIfReductionAvailable(int(rate * 1000.0))
+        intervals = []
+        ranges = list(ranges)
+        starts = toTimestampsMs([r[0] for r in ranges])
+        ends = toTimestampsMs([r[1] for r in ranges])
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            # aligned like getDataAsNP
+            nTimeR, nNmbX = alignRange(start, end, rate)
+            nCT, nNmbX, timeR = self.alignBinRange(rate, nNmbX, nTimeR)
+            if nNmbX > 0:
+                intervals.append([timeR - nNmbX * nCT, timeR])
+        intervals.sort()
+        merged = []
+        for left, right in intervals:
+            if len(merged) > 0 and left <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], right)
+            else:
+                merged.append([left, right])
+        types = [('timestamp', (np.int64))]
+        for id in ids:
+            types.append((str(self.getMst(id=id).name), (np.float32)))
+        plan = []
+        rowBase = 0
+        for left, right in merged:
+            nNmbX = (right - left) // nCT
+            for chunkIds, offset, timeR, nmbX, rowOffset in self.planLoadData(ids, nNmbX, right, nCT):
+                plan.append((chunkIds, offset, timeR, nmbX, rowBase + rowOffset))
+            rowBase += nNmbX
+        data = np.empty(rowBase, dtype=types)
+        if len(plan) == 0:
+            return data
+        return self.localizeResult(self.executeLoadPlan(plan, nCT, types, data))
+
+    """
+    teilt eine Anfrage in mehrere LoadData Requests auf
+    Die Anzahl der Messstellen pro Request und die Aufteilung der Zeitspanne richtet sich nach der erwarteten Datenmenge (ids * nNmbX).
+    Mit 'adaptive' wird die Datenmenge anhand der gemessenen Latenz und des Durchsatzes so gewählt, dass ein Request ca. 'targetSeconds' dauert.
+    Zurück kommt eine Liste mit (ids, Spalten-Offset, TimeR, nNmbX, Zeilen-Offset)
+    """
+
+    def planLoadData(self, ids, nNmbX, TimeR, nCT, allowTimeSplit=True):
+        maxPoints = self.getMaxPointsPerRequest()
+        maxIds = max(1, int(self.config['requests']['maxIdsPerRequest']))
+        if nNmbX > maxPoints and allowTimeSplit:
+            rowsPerRequest = maxPoints
+            idsPerRequest = 1
+        else:
+            rowsPerRequest = max(nNmbX, 1)
+            idsPerRequest = min(maxIds, max(1, maxPoints // rowsPerRequest))
+        windows = []
+        remaining = nNmbX
+        timeR = TimeR
+        while remaining > 0 or len(windows) == 0:
+            nmbX = min(rowsPerRequest, remaining) if remaining > 0 else nNmbX
+            windows.append((timeR, nmbX, remaining - nmbX))
+            timeR -= nmbX * int(nCT)
+            remaining -= nmbX
+        plan = []
+        for timeR, nmbX, rowOffset in reversed(windows):
+            for i in range(0, len(ids), idsPerRequest):
+                plan.append((ids[i:i + idsPerRequest], i, timeR, nmbX, rowOffset))
+        return plan
+
+    def getMaxPointsPerRequest(self):
+        conf = self.config['requests']
+        maxPoints = int(conf['maxPointsPerRequest'])
+        if conf['adaptive'] and self.requestStats['throughput'] is not None:
+            seconds = max(conf['targetSeconds'] - self.requestStats['latency'], conf['targetSeconds'] / 10.0)
+            adaptive = int(self.requestStats['throughput'] * seconds / conf['bytesPerValue'])
+            maxPoints = min(maxPoints, max(int(conf['minPointsPerRequest']), adaptive))
+        return max(1, maxPoints)
+
+    def updateRequestStats(self, points, latency, duration):
+        alpha = 0.3
+        stats = self.requestStats
+        throughput = points * self.config['requests']['bytesPerValue'] / max(duration - latency, 1e-6)
+        with self.requestStatsLock:
+            if stats['throughput'] is None:
+                stats['latency'] = latency
+                stats['throughput'] = throughput
+            else:
+                stats['latency'] = (1 - alpha) * stats['latency'] + alpha * latency
+                stats['throughput'] = (1 - alpha) * stats['throughput'] + alpha * throughput
+
+    """
+    ein einzelner LoadData Request, liefert die unverarbeiteten Binärdaten
+    """
+
+    def requestLoadData(self, ids, nCT, nNmbX, TimeR, deadline=None, priority=None):
+        arrMsts = ", ".join(str(id) for id in ids)
+        strRequest = "<tebis>\n"
+        strRequest += "<szConfigFile>" + \
+            self.config['configfile'] + "</szConfigFile>\n"
+        strRequest += "<szProcedure>LoadData</szProcedure>\n"
+        strRequest += "<arrMsts>" + arrMsts + "</arrMsts>\n"
+        strRequest += "<nNmbX>" + str(nNmbX) + "</nNmbX>\n"
+        strRequest += "<nCT>" + str(int(nCT)) + "</nCT>\n"
+        strRequest += "<nTimeR>" + \
+            str(TimeR) + "</nTimeR>\n"
+        strRequest += "<tebis>"
+        with self.instrumentation.span('request', msts=len(ids), nNmbX=nNmbX):
+            return self.requestOnSocket(strRequest, deadline, len(ids) * nNmbX, priority)
+
     """
     lädt die Daten als Zeichenkette
     Die Funktion ist wesentlich langsamer als getBinData und sollte nicht verwendet werden...
@@ -953,12 +1606,7 @@ class Tebis():
         strRequest += "<nTimeR>" + \
             str((int(TimeR) / int(nCT)) * int(nCT) * 1000) + "</nTimeR>\n"
         strRequest += "<tebis>"
-        self.socketConnect()
-        # Send Request
-        self.sendOnSocket(strRequest)
-        # Recieve MSTS Packet
-        MSTSRaw = self.receiveOnSocket()
-        self.socketClose()
+        MSTSRaw = self.requestOnSocket(strRequest, self.getDeadline())
         MSTSRawSplit = str(
             MSTSRaw, encoding='iso-8859-1').replace("'", "").split(',')
         temp = self.__checkResultHeader(MSTSRawSplit, types)
@@ -1063,6 +1711,56 @@ class TebisTreeElement:
         return None
 
 
+class TebisConfigChange:
+    ''' describes the result of an incremental refresh '''
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.changed = []
+        self.reductionsChanged = False
+        self.treeChanged = False
+
+    def hasChanges(self):
+        return bool(self.added or self.removed or self.changed or self.reductionsChanged or self.treeChanged)
+
+    def __repr__(self):
+        return f"TebisConfigChange(added={len(self.added)}, removed={len(self.removed)}, changed={len(self.changed)}, reductionsChanged={self.reductionsChanged}, treeChanged={self.treeChanged})"
+
+
+class TebisRegistry:
+    ''' the loaded configuration: msts, reductions, groups and tree '''
+
+    def __init__(self):
+        self.msts = []
+        self.mstById = {}
+        self.mstByName = {}
+        self.reductions = []
+        self.tebisTree = []
+        self.tebisGrps = []
+        self.tebisGrpsById = {}
+        self.tebisMapTreeGroups = []
+        self.tebisMapTreeGroupById = {}
+        self.configHashes = {}
+
+    def copy(self):
+        ''' copy of the containers, the msts, groups and tree elements are shared '''
+        registry = TebisRegistry()
+        for name, value in self.__dict__.items():
+            setattr(registry, name, value.copy() if isinstance(value, (list, dict)) else value)
+        return registry
+
+
+class TebisFlight:
+    ''' a running query other callers can wait for (singleFlight) '''
+
+    def __init__(self, ids):
+        self.ids = set(ids)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
 class TebisOracleDBException(Exception):
     ''' raise if try to get DB-Information without a DB Connection specifeied '''
 
@@ -1071,6 +1769,14 @@ class TebisException(Exception):
     pass
 
 
+class TebisTimeoutException(TebisException, TimeoutError):
+    ''' raise if the connect, a read or the deadline of a query timed out '''
+
+
+class TebisConnectionException(TebisException, ConnectionError):
+    ''' raise if the connection to the Tebis-Socket failed or broke '''
+
+
 # BUG: UnicodeDecodeError on Numpy...
 def testUnicodeError(elem, id):
     res = ''
@@ -1086,6 +1792,11 @@ def build_dict(seq, key):
     return dict((getattr(d, key), d) for (index, d) in enumerate(seq))
 
 
+# the attributes describing a mst without the current values
+def mst_signature(mst):
+    return dict((k, v) for k, v in vars(mst).items() if not k.startswith('curren'))
+
+
 # Json Converter
 # TODO: die FLOAT_REPR geht in Python >3.6 nicht mehr. Siehe https://stackoverflow.com/questions/32521823/json-encoder-float-repr-changed-but-no-effect
 def getDataSeries_as_Json(data):
@@ -0,0 +1,147 @@
+"""Helpers for the time arguments and the timestamps of the Tebis results.
+
+All time arguments (datetime, pandas Timestamp, numpy datetime64, seconds as int
+or float, ms as int, strings) are normalized to unix timestamps in ms. Scalars are
+cached, arrays are converted vectorized. Naive datetime and strings are local
+time, naive pandas Timestamps and numpy datetime64 are UTC, for scalars, lists
+and arrays alike.
+
+The server delivers UTC timestamps in ms. To show them in local time the UTC
+offset of the timezone is looked up in a transition table for the queried range,
+so the whole timestamp column is shifted with one vectorized add.
+"""
+import datetime
+from functools import lru_cache
+import numpy as np
+
+try:
+    from zoneinfo import ZoneInfo as _getZone
+except ImportError:  # Python 3.8
+    from dateutil.tz import gettz as _getZone
+
+DAY_MS = 86400000
+# int values below are seconds, above ms
+MS_THRESHOLD = 100000000000
+STRING_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def toTimestampMs(value):
+    '''converts a single time argument to a unix timestamp in ms
+    naive datetime and strings are local time, naive pandas Timestamp and numpy datetime64 are UTC'''
+    try:
+        hash(value)
+    except TypeError:
+        return _convert(value)
+    return _toTimestampMs(value)
+
+
+@lru_cache(maxsize=4096, typed=True)
+def _toTimestampMs(value):
+    return _convert(value)
+
+
+def _convert(value):
+    if isinstance(value, datetime.datetime) and value.tzinfo is None and hasattr(value, 'to_datetime64'):
+        # naive pandas Timestamp: UTC like datetime64 columns, pandas itself is not consistent over the versions
+        return float(value.to_datetime64().astype('datetime64[ms]').astype(np.int64))
+    elif isinstance(value, datetime.datetime):
+        return value.timestamp()*1000.0
+    elif isinstance(value, np.datetime64):
+        return float(value.astype('datetime64[ms]').astype(np.int64))
+    elif isinstance(value, (float, np.floating)):
+        return float(value)*1000.0
+    elif isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return value*1000.0 if value < MS_THRESHOLD else value
+    elif isinstance(value, str):
+        try:
+            return datetime.datetime.strptime(value, STRING_FORMAT).timestamp()*1000.0
+        except ValueError:
+            return datetime.datetime.fromisoformat(value).timestamp()*1000.0
+    raise TypeError(f'Unsupported time argument {value!r}')
+
+
+def toTimestampsMs(values):
+    '''converts an array (list, numpy array, pandas Series/Index) of time arguments to int64 unix timestamps in ms'''
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ms]').astype(np.int64)
+    if np.issubdtype(values.dtype, np.floating):
+        return (values * 1000.0).astype(np.int64)
+    if np.issubdtype(values.dtype, np.integer):
+        return np.where(values < MS_THRESHOLD, values * 1000, values).astype(np.int64)
+    if values.dtype != object:
+        # strings: each distinct value is converted once
+        unique, inverse = np.unique(values, return_inverse=True)
+        converted = np.array([toTimestampMs(str(value)) for value in unique], dtype=np.float64)
+        return converted[inverse.reshape(values.shape)].astype(np.int64)
+    # mixed objects like datetime or pandas Timestamp
+    return np.array([toTimestampMs(value) for value in values.ravel()], dtype=np.float64).astype(np.int64).reshape(values.shape)
+
+
+def alignRange(start, end, rate):
+    '''returns (nTimeR, nNmbX) for the Tebis request of the time span with the reduction rate in seconds'''
+    nCT = int(rate * 1000.0)
+    nTimeR = int(float(toTimestampMs(end)))
+    nTimeL = int(float(toTimestampMs(start)))
+    nNmbX = (nTimeR - nTimeL) / nCT
+    if nNmbX <= 0:
+        nNmbX = 1
+    return nTimeR, nNmbX
+
+
+def alignRanges(starts, ends, rate):
+    '''vectorized alignRange for many time spans, returns (nTimeR, nNmbX) arrays'''
+    nCT = int(rate * 1000.0)
+    nTimeR = toTimestampsMs(ends)
+    nNmbX = (nTimeR - toTimestampsMs(starts)) / nCT
+    nNmbX[nNmbX <= 0] = 1
+    return nTimeR, nNmbX
+
+
+def getTimezone(tz):
+    if isinstance(tz, str):
+        zone = _getZone(tz)
+        if zone is None:
+            raise ValueError(f'Unknown timezone {tz}')
+        return zone
+    return tz
+
+
+def _offsetMs(tz, ms):
+    return int(datetime.datetime.fromtimestamp(ms / 1000.0, tz).utcoffset().total_seconds() * 1000)
+
+
+@lru_cache(maxsize=128)
+def _transitionTable(tz, firstDay, lastDay):
+    transitions = []
+    offsets = [_offsetMs(tz, firstDay * DAY_MS)]
+    for day in range(firstDay + 1, lastDay + 1):
+        offset = _offsetMs(tz, day * DAY_MS)
+        if offset != offsets[-1]:
+            # the change happened during the last day, search the exact second
+            low, high = (day - 1) * DAY_MS // 1000, day * DAY_MS // 1000
+            while high - low > 1:
+                mid = (low + high) // 2
+                if _offsetMs(tz, mid * 1000) == offsets[-1]:
+                    low = mid
+                else:
+                    high = mid
+            transitions.append(high * 1000)
+            offsets.append(offset)
+    return np.array(transitions, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def utcOffsetTable(tz, startMs, endMs):
+    '''returns (transitions, offsets) for the range. offsets[i] is valid before transitions[i], offsets[-1] after the last transition'''
+    return _transitionTable(getTimezone(tz), int(startMs) // DAY_MS, int(endMs) // DAY_MS + 1)
+
+
+def localizeTimestamps(timestamps, tz):
+    '''shifts UTC timestamps in ms to the local wall clock time of tz'''
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if tz is None or len(timestamps) == 0:
+        return timestamps
+    transitions, offsets = utcOffsetTable(tz, timestamps.min(), timestamps.max())
+    if len(transitions) == 0:
+        return timestamps + offsets[0]
+    return timestamps + offsets[np.searchsorted(transitions, timestamps, side='right')]
@@ -0,0 +1,85 @@
+"""
+Unit tests for the client side aggregation
+"""
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from pytebis.tebis import Tebis
+from pytebis.aggregate import aggregateSeries, parseInterval
+
+
+def make_series(start, end, rate=1000):
+    timestamps = np.arange(start + rate, end + rate, rate, dtype=np.int64)
+    data = np.empty(len(timestamps), dtype=[('timestamp', np.int64), ('a', np.float32), ('b', np.float32)])
+    data['timestamp'] = timestamps
+    data['a'] = (timestamps // rate) % 97
+    data['b'] = np.where((timestamps // 60000) % 3 == 0, np.nan, (timestamps // rate) % 13)
+    return data
+
+
+class TestParseInterval(unittest.TestCase):
+    """Test the interval parser"""
+
+    def test_units(self):
+        self.assertEqual(parseInterval('15min'), 900000)
+        self.assertEqual(parseInterval('1h'), 3600000)
+        self.assertEqual(parseInterval('30s'), 30000)
+        self.assertEqual(parseInterval('500ms'), 500)
+        self.assertEqual(parseInterval(1.5), 1500)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parseInterval('15 parsecs')
+
+
+class TestAggregateSeries(unittest.TestCase):
+    """Test the aggregation against pandas resample"""
+
+    def test_matches_pandas_resample(self):
+        """Test that all functions match the pandas equivalent"""
+        data = make_series(1700000000000, 1700007200000)
+        funcs = ('mean', 'min', 'max', 'first', 'last', 'count')
+
+        result = aggregateSeries(data, 300000, funcs, 1000)
+
+        df = pd.DataFrame({'a': data['a'], 'b': data['b']},
+                          index=pd.to_datetime(data['timestamp'], unit='ms'))
+        expected = df.resample('5min').agg(list(funcs))
+        self.assertEqual(len(result), len(expected))
+        np.testing.assert_array_equal(result['timestamp'], expected.index.values.astype('datetime64[ms]').astype(np.int64))
+        for name in ('a', 'b'):
+            for func in funcs:
+                np.testing.assert_allclose(result[f'{name}_{func}'], expected[(name, func)].values.astype(np.float64), rtol=1e-6)
+
+    def test_all_nan_window(self):
+        """Test that a window without values is NaN with count 0"""
+        data = make_series(0, 10000)
+        data['a'][:5] = np.nan
+
+        result = aggregateSeries(data, 5000, ('mean', 'count', 'integral'), 1000)
+
+        self.assertTrue(np.isnan(result['a_mean'][0]))
+        self.assertEqual(result['a_count'][0], 0)
+        self.assertEqual(result['a_integral'][1], np.nansum(data['a'][4:9]) * 1.0)
+
+
+class TestTebisAggregate(unittest.TestCase):
+    """Test the windowed aggregation on the Tebis class"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': '192.168.1.10'})
+        self.teb.getDataAsNP = lambda names, start, end, rate: make_series(start, end, int(rate * 1000))
+
+    def test_windows_equal_single_pass(self):
+        """Test that the bounded memory windows give the same result as one pass"""
+        start, end = 1700000000000, 1700086400000
+        funcs = ('mean', 'min', 'max', 'first', 'last', 'count', 'integral')
+
+        windowed = self.teb.aggregate(['a', 'b'], start, end, 1, every='15min', funcs=funcs, maxRows=5000)
+        single = aggregateSeries(make_series(start, end), 900000, funcs, 1000)
+
+        self.assertEqual(len(windowed), len(single))
+        for name in single.dtype.names:
+            np.testing.assert_array_equal(windowed[name], single[name])
@@ -0,0 +1,130 @@
+"""
+Tests for the pytebis command line tool
+"""
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock
+import pandas as pd
+from pytebis import cli
+from pytebis.fakeserver import FakeTebisServer
+from pytebis.tebis import Tebis
+
+END = 1700000000
+
+
+class TestCliExport(unittest.TestCase):
+    """Test the export command against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=10, seed=1).start()
+        self.output = tempfile.mkdtemp()
+        self.args = ['export', '--host', self.server.host, '--port', str(self.server.port),
+                     '--start', str(END - 7200), '--end', str(END), '--window', '1h',
+                     '--chunk-size', '2', '--workers', '3', '--output', self.output]
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.output, ignore_errors=True)
+
+    def parts(self):
+        return sorted(os.listdir(self.output))
+
+    def test_plan(self):
+        """Test the split into time windows and mst chunks"""
+        parts = cli.planExport(['a', 'b', 'c'], 0, 2500, 1000, 2)
+        self.assertEqual(len(parts), 6)
+        self.assertEqual(parts[0], (0, 0, 0, 1000, ['a', 'b']))
+        self.assertEqual(parts[1], (0, 1, 0, 1000, ['c']))
+        self.assertEqual(parts[-1], (2, 1, 2000, 2500, ['c']))
+
+    def test_read_names(self):
+        """Test the names file with comments, empty lines and ids"""
+        path = os.path.join(self.output, 'names.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('# pumps\nmst1\n\n  mst2  \n7\n')
+        self.assertEqual(cli.readNames(path), ['mst1', 'mst2', 7])
+
+    def test_export_csv(self):
+        """Test that every part is written and contains the values of the server"""
+        result = cli.main(self.args + ['--names', 'mst1,mst2,mst3'])
+        self.assertEqual(result, 0)
+        self.assertEqual(self.parts(), ['part-00000-0000.csv', 'part-00000-0001.csv',
+                                        'part-00001-0000.csv', 'part-00001-0001.csv'])
+        teb = Tebis(configuration=self.server.configuration())
+        expected = teb.getDataAsPD(['mst1', 'mst2'], END - 7200, END - 3600, 1)
+        df = pd.read_csv(os.path.join(self.output, 'part-00000-0000.csv'), index_col='timestamp', parse_dates=True)
+        self.assertEqual(list(df.columns), ['mst1', 'mst2'])
+        self.assertEqual(len(df), len(expected))
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False, check_freq=False, check_index_type=False)
+
+    def test_csv_without_pandas(self):
+        """Test that the csv parts are written by the CSV writer of pytebis, not by pandas"""
+        teb = Tebis(configuration=self.server.configuration())
+        teb.getDataAsPD = Mock(side_effect=AssertionError('pandas is used'))
+        args = cli.buildParser().parse_args(self.args + ['--names', 'mst1,mst2'])
+        self.assertEqual(cli.export(teb, ['mst1', 'mst2'], args, out=io.StringIO()), 0)
+        with open(os.path.join(self.output, 'part-00000-0000.csv'), encoding='utf-8') as f:
+            self.assertEqual(f.readline().strip(), 'timestamp,mst1,mst2')
+
+    def test_resume(self):
+        """Test that existing parts are skipped"""
+        self.assertEqual(cli.main(self.args + ['--names', 'mst1,mst2,mst3']), 0)
+        os.remove(os.path.join(self.output, 'part-00001-0001.csv'))
+        loads = self.server.getStats()['LoadData']
+        self.assertEqual(cli.main(self.args + ['--names', 'mst1,mst2,mst3']), 0)
+        self.assertEqual(self.server.getStats()['LoadData'], loads + 1)
+        self.assertEqual(len(self.parts()), 4)
+
+    def test_failed_part(self):
+        """Test that a failed part returns 1 and is exported on the next run"""
+        args = self.args + ['--names', 'mst1,mst2', '--workers', '1']
+        teb = Tebis(configuration=self.server.configuration(retry={'backoff': 0.01}))
+        self.server.injectFault('error', 3)
+        self.assertEqual(cli.export(teb, ['mst1', 'mst2'], cli.buildParser().parse_args(args), out=io.StringIO()), 1)
+        self.assertEqual(len(self.parts()), 1)
+        self.assertFalse(any(name.endswith('.tmp') for name in self.parts()))
+        self.assertEqual(cli.main(args), 0)
+        self.assertEqual(len(self.parts()), 2)
+
+    def test_failed_write(self):
+        """Test that a failed parquet write leaves no temporary file"""
+        def toParquet(tmp):
+            with open(tmp, 'wb') as f:
+                f.write(b'PAR1')
+            raise OSError('disk full')
+        df = Mock(to_parquet=Mock(side_effect=toParquet))
+        path = os.path.join(self.output, 'part-00000-0000.parquet')
+        with self.assertRaises(OSError):
+            cli.writePart(df, path, 'parquet')
+        self.assertEqual(self.parts(), [])
+
+    def test_progress(self):
+        """Test the progress output"""
+        out = io.StringIO()
+        teb = Tebis(configuration=self.server.configuration())
+        args = cli.buildParser().parse_args(self.args + ['--names', 'mst1'])
+        self.assertEqual(cli.export(teb, ['mst1'], args, out=out), 0)
+        self.assertIn('[2/2]', out.getvalue())
+        self.assertIn('values/s', out.getvalue())
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+    def test_export_parquet(self):
+        """Test the parquet format"""
+        self.assertEqual(cli.main(self.args + ['--names', 'mst1', '--format', 'parquet']), 0)
+        df = pd.read_parquet(os.path.join(self.output, 'part-00000-0000.parquet'))
+        self.assertEqual(list(df.columns), ['mst1'])
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is not None, 'pyarrow is installed')
+    def test_parquet_without_pyarrow(self):
+        """Test the error message without pyarrow"""
+        with self.assertRaises(SystemExit) as cm:
+            cli.main(self.args + ['--names', 'mst1', '--format', 'parquet'])
+        self.assertIn('pyarrow', str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Tests for the multi server client
+"""
+import time
+import unittest
+from unittest.mock import Mock, patch
+from pytebis.tebis import TebisConnectionException
+from pytebis.cluster import TebisCluster, TebisEndpoint, parseEndpoint
+from pytebis.fakeserver import FakeTebisServer
+
+END = 1700000000
+
+
+class TestParseEndpoint(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(parseEndpoint('10.0.0.1:4713'), ('10.0.0.1', 4713))
+        self.assertEqual(parseEndpoint('10.0.0.1'), ('10.0.0.1', 4712))
+        self.assertEqual(parseEndpoint(('host', '4714')), ('host', 4714))
+
+
+class TestTebisCluster(unittest.TestCase):
+    """Test the balancing and failover against local servers"""
+
+    def setUp(self):
+        self.servers = [FakeTebisServer(msts=10).start() for _ in range(3)]
+        self.endpoints = [server.address for server in self.servers]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def cluster(self, maxParallel=6, **cluster):
+        return TebisCluster(self.endpoints, configuration={
+            'cluster': cluster, 'retry': {'backoff': 0.01},
+            'requests': {'maxIdsPerRequest': 1, 'maxParallel': maxParallel}})
+
+    def loadDataCounts(self):
+        return [server.getStats()['LoadData'] for server in self.servers]
+
+    def test_registry_loaded_once(self):
+        """Test that the config is loaded from one endpoint only"""
+        teb = self.cluster()
+        self.assertEqual(len(teb.msts), 10)
+        self.assertEqual(sum(server.getStats()['GetConfig'] for server in self.servers), 4)
+
+    def test_spreads_load(self):
+        """Test that the requests are spread over all endpoints"""
+        teb = self.cluster(balancing='leastOutstanding')
+        for server in self.servers:
+            server.latency = 0.05
+        data = teb.getDataAsNP(list(range(1, 10)), END - 60, END, 1)
+        self.assertEqual(len(data.dtype.names), 10)
+        self.assertTrue(all(count > 0 for count in self.loadDataCounts()))
+
+    def test_failover(self):
+        """Test that a failed request is retried on another endpoint"""
+        teb = self.cluster()
+        self.servers[0].injectFault('error', 100)
+        self.servers[1].injectFault('drop', 100)
+        data = teb.getDataAsNP(list(range(1, 10)), END - 60, END, 1)
+        self.assertEqual(len(data), 60)
+
+    def test_circuit_breaker(self):
+        """Test that a dead endpoint is skipped after failureThreshold failures"""
+        # sequential requests, parallel ones could fail on the endpoint before the breaker opens.
+        # leastOutstanding picks randomly, 'latency' might never try the dead endpoint
+        teb = self.cluster(maxParallel=1, balancing='leastOutstanding', failureThreshold=2, resetTimeout=60)
+        self.servers[0].stop()
+        for _ in range(5):
+            teb.getDataAsNP(list(range(1, 10)), END - 60, END, 1)
+        status = teb.getEndpointStatus()
+        self.assertTrue(status[0]['open'])
+        self.assertEqual(status[0]['failures'], 2)
+        self.assertFalse(status[1]['open'])
+        for _ in range(3):
+            teb.getDataAsNP(list(range(1, 10)), END - 60, END, 1)
+        self.assertEqual(teb.getEndpointStatus()[0]['requests'], status[0]['requests'])
+
+    def test_half_open_trial(self):
+        """Test that an endpoint is used again after a successful trial request"""
+        teb = self.cluster(failureThreshold=1, resetTimeout=0.05)
+        endpoint = teb.endpoints[0]
+        teb.releaseEndpoint(teb.acquireEndpoint([e for e in teb.endpoints if e is not endpoint]), failed=True)
+        self.assertTrue(endpoint.status()['open'])
+        time.sleep(0.06)
+        for _ in range(5):
+            teb.getDataAsNP([1], END - 60, END, 1)
+        self.assertFalse(endpoint.status()['open'])
+
+    def test_interrupt_is_no_failure(self):
+        """Test that an interrupted request doesn't count as failure of the endpoint"""
+        teb = self.cluster(failureThreshold=1, resetTimeout=60)
+        teb.requestOnce = Mock(side_effect=KeyboardInterrupt)
+        with self.assertRaises(KeyboardInterrupt):
+            teb.requestOnSocket('<tebis>')
+        status = teb.getEndpointStatus()
+        self.assertEqual([s['failures'] for s in status], [0, 0, 0])
+        self.assertEqual([s['outstanding'] for s in status], [0, 0, 0])
+        self.assertFalse(any(s['open'] for s in status))
+
+    def test_slow_endpoint_gets_less_work(self):
+        """Test that the latency balancing avoids a slow endpoint"""
+        teb = self.cluster(balancing='latency')
+        self.servers[0].latency = 0.3
+        for _ in range(3):
+            teb.getDataAsNP(list(range(1, 10)), END - 60, END, 1)
+        counts = self.loadDataCounts()
+        self.assertLess(counts[0], counts[1] + counts[2])
+        self.assertLess(counts[0], 9)
+
+    def test_all_endpoints_down(self):
+        teb = self.cluster(failureThreshold=1, resetTimeout=60)
+        for server in self.servers:
+            server.stop()
+        with self.assertRaises(TebisConnectionException):
+            teb.getDataAsNP([1], END - 60, END, 1)
+
+
+class TestTebisClusterConfig(unittest.TestCase):
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def test_defaults(self, mock_refresh):
+        teb = TebisCluster(['a:1', 'b:2'])
+        self.assertEqual(teb.config['host'], 'a')
+        self.assertEqual(teb.config['requests']['maxParallel'], 8)
+        self.assertEqual([e.address for e in teb.endpoints], [('a', 1), ('b', 2)])
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def test_invalid_balancing(self, mock_refresh):
+        with self.assertRaises(ValueError):
+            TebisCluster(['a:1'], configuration={'cluster': {'balancing': 'random'}})
+
+    def test_endpoint_repr(self):
+        self.assertEqual(repr(TebisEndpoint('a', 1)), 'TebisEndpoint(a:1)')
+
+
+if __name__ == '__main__':
+    unittest.main()
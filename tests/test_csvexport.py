@@ -0,0 +1,112 @@
+"""
+Tests for the vectorized CSV export
+"""
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from pytebis.csvexport import writeCSV, formatTimestamps, getDataAsCSVString
+from pytebis.fakeserver import FakeTebisServer
+from pytebis.tebis import Tebis
+
+END = 1700000000
+
+
+def make_data():
+    data = np.zeros(3, dtype=[('timestamp', np.int64), ('a', np.float32), ('b', np.float64)])
+    data['timestamp'] = [1700000000000, 1700000001000, 1700000002500]
+    data['a'] = [1.23456, np.nan, -3]
+    data['b'] = [np.nan, 2.5, np.nan]
+    return data
+
+
+class TestCSVFormat(unittest.TestCase):
+    """Test the formatting of the columns"""
+
+    def test_default(self):
+        """Test precision, empty NaN cells and the iso timestamps"""
+        text = getDataAsCSVString(make_data())
+        self.assertEqual(text.splitlines(), [
+            'timestamp,a,b',
+            '2023-11-14 22:13:20.000,1.235,',
+            '2023-11-14 22:13:21.000,,2.500',
+            '2023-11-14 22:13:22.500,-3.000,',
+        ])
+
+    def test_options(self):
+        """Test floatFormat, naRep, delimiter and ms timestamps"""
+        text = getDataAsCSVString(make_data(), floatFormat='%.1e', naRep='NA', delimiter=';', timestampFormat='ms')
+        self.assertEqual(text.splitlines()[1:], [
+            '1700000000000;1.2e+00;NA',
+            '1700000001000;NA;2.5e+00',
+            '1700000002500;-3.0e+00;NA',
+        ])
+
+    def test_shortest_repr(self):
+        """Test that precision None writes the shortest float32 representation"""
+        text = getDataAsCSVString(make_data(), precision=None, header=False, timestampFormat='s')
+        self.assertEqual(text.splitlines()[0], '1700000000.0,1.23456,')
+
+    def test_timestamps(self):
+        """Test the timestamp formats and the timezone"""
+        timestamps = np.array([1700000000000, 1700003600000])
+        self.assertEqual(formatTimestamps(timestamps, 'iso').tolist(), ['2023-11-14 22:13:20', '2023-11-14 23:13:20'])
+        self.assertEqual(formatTimestamps(timestamps, 'iso', 'Europe/Berlin')[0], '2023-11-14 23:13:20')
+        self.assertEqual(formatTimestamps(timestamps, 's').tolist(), ['1700000000', '1700003600'])
+        self.assertEqual(formatTimestamps(timestamps, '%d.%m.%Y %H:%M')[1], '14.11.2023 23:13')
+
+    def test_chunks(self):
+        """Test that the chunked output equals the single write"""
+        data = np.zeros(1000, dtype=[('timestamp', np.int64), ('a', np.float32)])
+        data['timestamp'] = 1700000000000 + np.arange(1000) * 1000
+        data['a'] = np.sin(np.arange(1000))
+        data['a'][::7] = np.nan
+        out = io.StringIO()
+        self.assertEqual(writeCSV(data, out, chunkRows=64), 1000)
+        self.assertEqual(out.getvalue(), getDataAsCSVString(data))
+
+    def test_matches_pandas(self):
+        """Test that pandas reads the values back"""
+        data = make_data()
+        df = pd.read_csv(io.StringIO(getDataAsCSVString(data, precision=6)))
+        np.testing.assert_allclose(df['a'].to_numpy(), data['a'], atol=1e-6)
+        np.testing.assert_allclose(df['b'].to_numpy(), data['b'])
+
+
+class TestTebisCSV(unittest.TestCase):
+    """Test getDataAsCSV and exportCSV against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=4, seed=1).start()
+        self.teb = Tebis(configuration=self.server.configuration())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get_data_as_csv(self):
+        """Test that the CSV matches getDataAsPD"""
+        text = self.teb.getDataAsCSV(['mst1', 'mst3'], END - 600, END, 1, precision=2)
+        df = pd.read_csv(io.StringIO(text), index_col='timestamp', parse_dates=True)
+        expected = self.teb.getDataAsPD(['mst1', 'mst3'], END - 600, END, 1)
+        self.assertEqual(len(df), 600)
+        self.assertTrue((df.index == expected.index).all())
+        for name in ('mst1', 'mst3'):
+            np.testing.assert_allclose(df[name].to_numpy(), expected[name].to_numpy(), atol=0.006)
+
+    def test_export_windows(self):
+        """Test that the windows of exportCSV are written without gaps or duplicates"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.csv')
+            rows = self.teb.exportCSV(path, ['mst1', 'mst2'], END - 1000, END, 1, maxRows=300)
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(rows, 1000)
+        self.assertEqual(len(lines), 1001)
+        self.assertEqual(lines[0], 'timestamp,mst1,mst2')
+        self.assertEqual(lines[1:], self.teb.getDataAsCSV(['mst1', 'mst2'], END - 1000, END, 1).splitlines()[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
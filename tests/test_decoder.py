@@ -0,0 +1,176 @@
+"""
+Tests for the decoder of the binary LoadData answers and the process decode
+"""
+import unittest
+from multiprocessing import shared_memory
+import numpy as np
+from pytebis.tebis import Tebis, TebisException
+from pytebis.decoder import decodeBinaryResult, decodeShared, ColumnCache
+from pytebis.fakeserver import FakeTebisServer
+from pytebis.synthetic import buildLoadDataPayload, makeSeries
+
+END = 1700000000
+
+
+def assert_equal_fields(actual, expected):
+    for name in expected.dtype.names:
+        np.testing.assert_array_equal(actual[name], expected[name])
+
+
+def make_payload(compress=True):
+    columns = [makeSeries(1000, pattern, 0.1, seed=i) for i, pattern in enumerate(('noise', 'step', 'constant'))]
+    types = [('timestamp', np.int64)] + [(f'c{i}', np.float32) for i in range(3)]
+    return columns, types, buildLoadDataPayload(columns, END * 1000, 1000, compress=compress)
+
+
+class TestDecoder(unittest.TestCase):
+
+    def test_memoryview(self):
+        """Test that a memoryview decodes like bytes"""
+        for compress in (True, False):
+            columns, types, raw = make_payload(compress)
+            expected = decodeBinaryResult(raw, types)
+            result = decodeBinaryResult(memoryview(raw), types)
+            assert_equal_fields(result, expected)
+            np.testing.assert_array_equal(result['c1'], columns[1].astype(np.float32))
+
+    def test_decode_shared(self):
+        """Test decoding from shared memory into a shared result array"""
+        columns, types, raw = make_payload()
+        dtype = np.dtype(types)
+        source = shared_memory.SharedMemory(create=True, size=len(raw))
+        target = shared_memory.SharedMemory(create=True, size=2000 * dtype.itemsize)
+        try:
+            source.buf[:len(raw)] = raw
+            self.assertTrue(decodeShared(source.name, len(raw), target.name, dtype, 2000, 1000, 1000, 0))
+            result = np.ndarray(2000, dtype=dtype, buffer=target.buf)
+            assert_equal_fields(result[1000:], decodeBinaryResult(raw, types))
+            del result
+        finally:
+            for shm in (source, target):
+                shm.close()
+                shm.unlink()
+
+    def test_decode_shared_error(self):
+        """Test that a broken payload raises and releases the shared memory"""
+        columns, types, raw = make_payload()
+        raw = raw[:60] + raw[-16:]
+        dtype = np.dtype(types)
+        source = shared_memory.SharedMemory(create=True, size=len(raw))
+        target = shared_memory.SharedMemory(create=True, size=1000 * dtype.itemsize)
+        try:
+            source.buf[:len(raw)] = raw
+            with self.assertRaises(ValueError):
+                decodeShared(source.name, len(raw), target.name, dtype, 1000, 0, 1000, 0)
+        finally:
+            for shm in (source, target):
+                shm.close()
+                shm.unlink()
+
+
+class TestColumnCache(unittest.TestCase):
+    """Test the reuse of unchanged columns"""
+
+    PATTERNS = ('noise', 'step', 'constant', 'linear', 'nan')
+
+    def make_payload(self, seeds, compress=True):
+        columns = [makeSeries(500, pattern, 0.1, seed=seed) for pattern, seed in zip(self.PATTERNS, seeds)]
+        return buildLoadDataPayload(columns, END * 1000, 1000, compress=compress)
+
+    def decode(self, cache, raw, changed):
+        types = [('timestamp', np.int64)] + [(pattern, np.float32) for pattern in self.PATTERNS]
+        keys = [(i, 1000, 500, 0) for i in range(len(self.PATTERNS))]
+        return decodeBinaryResult(raw, types, cache=cache, cacheKeys=keys, changed=changed)
+
+    def test_unchanged_columns(self):
+        """Test that a repeated payload is taken from the cache and equals the full decode"""
+        for compress in (True, False):
+            cache = ColumnCache()
+            raw = self.make_payload([1, 2, 3, 4, 5], compress)
+            changed = set()
+            first = self.decode(cache, raw, changed)
+            self.assertEqual(changed, set(self.PATTERNS))
+            changed = set()
+            second = self.decode(cache, raw, changed)
+            self.assertEqual(changed, set())
+            assert_equal_fields(second, first)
+            assert_equal_fields(second, decodeBinaryResult(raw, first.dtype))
+
+    def test_changed_column(self):
+        """Test that only the changed column is decoded, the following columns stay aligned"""
+        cache = ColumnCache()
+        self.decode(cache, self.make_payload([1, 2, 3, 4, 5]), set())
+        raw = self.make_payload([1, 7, 3, 4, 5])
+        changed = set()
+        result = self.decode(cache, raw, changed)
+        self.assertEqual(changed, {'step'})
+        assert_equal_fields(result, decodeBinaryResult(raw, result.dtype))
+
+    def test_lru(self):
+        """Test that the cache keeps maxEntries columns"""
+        cache = ColumnCache(maxEntries=3)
+        self.decode(cache, self.make_payload([1, 2, 3, 4, 5]), set())
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get((0, 1000, 500, 0), b''))
+
+
+class TestDataWithChanges(unittest.TestCase):
+    """Test getDataWithChanges against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=8, seed=1).start()
+        self.teb = Tebis(configuration=self.server.configuration())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_polling(self):
+        """Test that only the changed msts are reported"""
+        names = ['mst2', 'mst3', 'mst4', 'mst6']
+        data, changed = self.teb.getDataWithChanges(names, END - 3600, END, 1)
+        self.assertEqual(changed, names)
+        data, changed = self.teb.getDataWithChanges(names, END - 3600, END, 1)
+        self.assertEqual(changed, [])
+        data, changed = self.teb.getDataWithChanges(names, END - 3540, END + 60, 1)
+        # mst2 and mst6 are constant
+        self.assertEqual(changed, ['mst3', 'mst4'])
+        assert_equal_fields(data, self.teb.getDataAsNP(names, END - 3540, END + 60, 1))
+
+    def test_invalid_answer(self):
+        """Test that an invalid answer raises and the next query reports all msts as changed"""
+        names = ['mst2', 'mst3', 'mst4', 'mst6']
+        self.teb.config['requests']['maxIdsPerRequest'] = 2
+        requestLoadData = self.teb.requestLoadData
+
+        def corruptSecond(*args, **kwargs):
+            raw = requestLoadData(*args, **kwargs)
+            return raw[:-4] + b'\x00\x00\x00\x00' if list(args[0]) == [4, 6] else raw
+        self.teb.requestLoadData = corruptSecond
+        with self.assertRaises(TebisException):
+            self.teb.getDataWithChanges(names, END - 3600, END, 1)
+        self.teb.requestLoadData = requestLoadData
+        data, changed = self.teb.getDataWithChanges(names, END - 3600, END, 1)
+        self.assertEqual(changed, names)
+
+
+class TestProcessDecode(unittest.TestCase):
+    """Test the decode in worker processes against the local server"""
+
+    def test_matches_thread_decode(self):
+        with FakeTebisServer(msts=12) as server:
+            conf = {'requests': {'maxIdsPerRequest': 4, 'maxPointsPerRequest': 20000}}
+            teb = Tebis(configuration=server.configuration(**conf))
+            conf['requests']['decodeProcesses'] = 2
+            tebProcesses = Tebis(configuration=server.configuration(**conf))
+            try:
+                ids = list(range(1, 13))
+                expected = teb.getDataAsNP(ids, END - 7200, END, 1)
+                result = tebProcesses.getDataAsNP(ids, END - 7200, END, 1)
+                self.assertEqual(result.dtype, expected.dtype)
+                assert_equal_fields(result, expected)
+            finally:
+                tebProcesses.closeDecodePool()
+
+
+if __name__ == '__main__':
+    unittest.main()
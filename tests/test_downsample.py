@@ -0,0 +1,89 @@
+"""
+Unit tests for the client side downsampling and the reduction selection
+"""
+import unittest
+from unittest.mock import Mock, patch
+import numpy as np
+from pytebis.tebis import Tebis
+from pytebis.downsample import downsampleMinMax, downsampleLTTB, lttbIndices
+
+
+def make_data(n):
+    data = np.zeros(n, dtype=[('timestamp', np.int64), ('a', np.float32), ('b', np.float32)])
+    data['timestamp'] = np.arange(n) * 1000
+    data['a'] = np.sin(np.arange(n) / 50.0)
+    data['b'] = np.nan
+    return data
+
+
+class TestDownsampleMinMax(unittest.TestCase):
+    """Test the min/max downsampling"""
+
+    def test_keeps_extremes(self):
+        """Test that the min and max of every bucket is kept"""
+        data = make_data(1000)
+        data['a'][123] = 10.0
+        data['a'][456] = -10.0
+        data['b'][700] = 3.0
+
+        result = downsampleMinMax(data, 50)
+
+        self.assertLessEqual(len(result), 200)
+        self.assertIn(10.0, result['a'])
+        self.assertIn(-10.0, result['a'])
+        self.assertIn(3.0, result['b'])
+        self.assertTrue(np.all(np.diff(result['timestamp']) > 0))
+
+    def test_small_input_unchanged(self):
+        """Test that short series are returned as they are"""
+        data = make_data(10)
+        self.assertIs(downsampleMinMax(data, 50), data)
+
+
+class TestDownsampleLTTB(unittest.TestCase):
+    """Test the Largest-Triangle-Three-Buckets downsampling"""
+
+    def test_indices(self):
+        """Test that first and last point are always selected"""
+        x = np.arange(1000, dtype=np.float64)
+        y = np.sin(x / 30.0)
+        idx = lttbIndices(x, y, 100)
+
+        self.assertEqual(len(idx), 100)
+        self.assertEqual(idx[0], 0)
+        self.assertEqual(idx[-1], 999)
+        self.assertTrue(np.all(np.diff(idx) > 0))
+
+    def test_peak_is_selected(self):
+        """Test that a single spike survives the downsampling"""
+        data = make_data(1000)
+        data['a'][500] = 50.0
+
+        result = downsampleLTTB(data, 100)
+
+        self.assertIn(50.0, result['a'])
+        self.assertLessEqual(len(result), 100)
+
+
+class TestTebisDisplayQuery(unittest.TestCase):
+    """Test the reduction selection for display queries"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': '192.168.1.10'})
+        self.teb.reductions = [1000, 10000, 60000, 3600000]
+
+    def test_select_reduction(self):
+        """Test that the coarsest reduction with enough points is chosen"""
+        self.assertEqual(self.teb.selectReduction(2 * 365 * 86400000, 2000), 3600000)
+        self.assertEqual(self.teb.selectReduction(86400000, 1000), 60000)
+        self.assertEqual(self.teb.selectReduction(60000, 1000), 1000)
+
+    def test_display_query(self):
+        """Test that the display query reads with the selected reduction"""
+        self.teb.getDataAsNP = Mock(return_value=make_data(1440))
+
+        result = self.teb.getDataForDisplay(['a'], 1700000000, 1700086400, width=100)
+
+        self.assertEqual(self.teb.getDataAsNP.call_args[0][3], 60.0)
+        self.assertLessEqual(len(result), 200)
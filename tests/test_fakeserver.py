@@ -0,0 +1,229 @@
+"""
+Tests for the local Tebis server and the socket handling against it
+"""
+import threading
+import time
+import unittest
+import numpy as np
+from pytebis.tebis import Tebis, TebisException, TebisTimeoutException, TebisConnectionException
+from pytebis.fakeserver import FakeTebisServer, syntheticValues, makeMsts
+
+END = 1700000000
+
+
+class TestFakeServer(unittest.TestCase):
+    """Test a Tebis client against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=20, seed=1).start()
+        self.teb = Tebis(configuration=self.server.configuration(retry={'backoff': 0.01}))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_config(self):
+        """Test that the msts and reductions are loaded from the server"""
+        self.assertEqual(len(self.teb.msts), 20)
+        self.assertEqual(self.teb.getMst(name='mst5').id, 5)
+        self.assertEqual(self.teb.reductions, [1000, 10000, 60000, 600000])
+
+    def test_load_data(self):
+        """Test that the values match the synthetic series"""
+        data = self.teb.getDataAsNP(['mst1', 'mst2', 'mst3', 'mst4'], END - 3600, END, 1)
+        self.assertEqual(len(data), 3600)
+        self.assertEqual(data['timestamp'][-1], END * 1000)
+        for id in (1, 2, 3, 4):
+            expected = syntheticValues(id, data['timestamp']).astype(np.float32)
+            np.testing.assert_array_equal(data[f'mst{id}'], expected)
+
+    def test_repeated_requests_are_equal(self):
+        """Test that overlapping requests deliver the same values"""
+        first = self.teb.getDataAsNP([3], END - 600, END, 1)
+        second = self.teb.getDataAsNP([3], END - 1200, END - 300, 1)
+        np.testing.assert_array_equal(first['mst3'][:300], second['mst3'][-300:])
+
+    def test_error_fault(self):
+        """Test that an error answer raises TebisException after the retries"""
+        self.server.injectFault('error', 3)
+        with self.assertRaises(TebisException):
+            self.teb.getDataAsNP([1], END - 60, END, 1)
+        self.server.injectFault('error')
+        self.assertEqual(len(self.teb.getDataAsNP([1], END - 60, END, 1)), 60)
+
+    def test_unknown_mst(self):
+        """Test that an unknown mst is answered with an error"""
+        with self.assertRaises(TebisException):
+            self.teb.requestLoadData([999], 1000, 10, END * 1000)
+
+    def test_latency(self):
+        """Test the injected latency"""
+        self.server.latency = 0.2
+        start = time.perf_counter()
+        self.teb.getDataAsNP([1], END - 60, END, 1)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+
+    def test_latency_is_time_to_first_byte(self):
+        """Test that the measured latency includes the think time of the server"""
+        self.server.latency = 0.2
+        updateRequestStats = self.teb.updateRequestStats
+        measured = []
+
+        def record(points, latency, duration):
+            measured.append((latency, duration))
+            updateRequestStats(points, latency, duration)
+        self.teb.updateRequestStats = record
+        self.teb.getDataAsNP([1], END - 60, END, 1)
+        latency, duration = measured[0]
+        self.assertGreaterEqual(latency, 0.2)
+        self.assertLessEqual(latency, duration)
+
+    def test_concurrent_clients(self):
+        """Test that concurrent clients are served in parallel"""
+        self.server.latency = 0.2
+        errors = []
+
+        def run():
+            try:
+                self.teb.getDataAsNP([1, 2], END - 60, END, 1)
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(10)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLess(time.perf_counter() - start, 1.5)
+        self.assertGreater(self.server.getStats()['maxActive'], 1)
+
+    def test_shared_instance_in_thread_pool(self):
+        """Test that one instance serves many threads"""
+        from concurrent.futures import ThreadPoolExecutor
+        self.teb.config['requests']['maxIdsPerRequest'] = 2
+
+        def query(i):
+            ids = [1 + i % 20, 1 + (i * 7) % 20, 1 + (i * 3) % 20]
+            ids = list(dict.fromkeys(ids))
+            data = self.teb.getDataAsNP(ids, END - 60 - i, END - i, 1)
+            for id in ids:
+                np.testing.assert_array_equal(data[f'mst{id}'], syntheticValues(id, data['timestamp']).astype(np.float32))
+            return len(data)
+
+        with ThreadPoolExecutor(16) as pool:
+            self.assertEqual(list(pool.map(query, range(64))), [60] * 64)
+
+    def test_invalid_fault(self):
+        with self.assertRaises(ValueError):
+            self.server.injectFault('explode')
+
+
+class TestTimeoutsAndRetry(unittest.TestCase):
+    """Test the timeouts, deadlines and retries against faults of the server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=5).start()
+        self.teb = Tebis(configuration=self.server.configuration(
+            timeouts={'read': 0.2}, retry={'attempts': 3, 'backoff': 0.01, 'maxBackoff': 0.05}))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_dropped_connection_is_retried(self):
+        """Test that a connection broken during the answer is retried"""
+        self.server.injectFault('drop', 2)
+        self.assertEqual(len(self.teb.getDataAsNP([1], END - 600, END, 1)), 600)
+
+    def test_stall_times_out(self):
+        """Test that a server which never answers raises TebisTimeoutException"""
+        self.server.injectFault('stall', 3)
+        start = time.perf_counter()
+        with self.assertRaises(TebisTimeoutException):
+            self.teb.getDataAsNP([1], END - 60, END, 1)
+        self.assertLess(time.perf_counter() - start, 1.5)
+
+    def test_stall_is_retried(self):
+        """Test that a single stalled request is retried"""
+        self.server.injectFault('stall')
+        self.assertEqual(len(self.teb.getDataAsNP([1], END - 60, END, 1)), 60)
+
+    def test_total_deadline(self):
+        """Test that the query fails once the total deadline has passed"""
+        self.teb.config['timeouts'] = {'connect': 1.0, 'read': 10.0, 'total': 0.3}
+        self.server.latency = 0.2
+        self.teb.config['requests']['maxParallel'] = 1
+        self.teb.config['requests']['maxIdsPerRequest'] = 1
+        start = time.perf_counter()
+        with self.assertRaises(TebisTimeoutException):
+            self.teb.getDataAsNP([1, 2, 3, 4], END - 60, END, 1)
+        self.assertLess(time.perf_counter() - start, 0.6)
+
+    def test_backoff_beyond_deadline_fails_fast(self):
+        """Test that no retry is started if the backoff ends after the deadline"""
+        self.teb.config['timeouts']['total'] = 0.5
+        self.teb.config['retry'] = {'attempts': 5, 'backoff': 10.0, 'maxBackoff': 10.0, 'jitter': False}
+        self.server.injectFault('error')
+        start = time.perf_counter()
+        with self.assertRaises(TebisTimeoutException):
+            self.teb.getDataAsNP([1], END - 60, END, 1)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_connection_refused(self):
+        """Test that a closed port raises TebisConnectionException"""
+        self.server.stop()
+        with self.assertRaises(TebisConnectionException):
+            self.teb.getDataAsNP([1], END - 60, END, 1)
+
+
+class TestInvalidAnswers(unittest.TestCase):
+    """Test that invalid LoadData answers raise instead of returning undecoded rows"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=5, seed=1).start()
+        self.teb = Tebis(configuration=self.server.configuration(requests={'maxPointsPerRequest': 100}))
+        requestLoadData = self.teb.requestLoadData
+
+        def corrupt(*args, **kwargs):
+            # a broken footer
+            return requestLoadData(*args, **kwargs)[:-4] + b'\x00\x00\x00\x00'
+        self.corrupt = corrupt
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_time_split(self):
+        """Test a query split into several time windows"""
+        self.teb.requestLoadData = self.corrupt
+        with self.assertRaises(TebisException):
+            self.teb.getDataAsNP(['mst1', 'mst2'], END - 600, END, 1)
+
+    def test_decode_processes(self):
+        """Test decoding in worker processes"""
+        self.teb.config['requests']['decodeProcesses'] = 1
+        self.teb.requestLoadData = self.corrupt
+        try:
+            with self.assertRaises(TebisException):
+                self.teb.getDataAsNP(['mst1', 'mst2'], END - 600, END, 1)
+        finally:
+            self.teb.closeDecodePool()
+
+    def test_single_request(self):
+        """Test a single request with the instrumentation enabled"""
+        self.teb.config['requests']['maxPointsPerRequest'] = 10000000
+        self.teb.instrumentation.enabled = True
+        self.teb.requestLoadData = self.corrupt
+        with self.assertRaises(TebisException):
+            self.teb.getDataAsNP(['mst1', 'mst2'], END - 600, END, 1)
+
+
+class TestMakeMsts(unittest.TestCase):
+
+    def test_names(self):
+        msts = makeMsts(3, start=10)
+        self.assertEqual(list(msts['ID']), [10, 11, 12])
+        self.assertEqual(list(msts['MSTName']), ['mst10', 'mst11', 'mst12'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Import time regression tests
+
+The heavy dependencies are loaded on first use only. The checks run in a new
+interpreter, the test process itself has already imported everything.
+"""
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LAZY_MODULES = ('pandas', 'simplejson', 'csv', 'dateutil', 'multiprocessing.shared_memory', 'concurrent.futures.process', 'asyncio')
+
+
+def run_python(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, cwd=ROOT)
+    if result.returncode != 0:
+        raise AssertionError(result.stderr)
+    return result.stdout.split()
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_import_does_not_load_heavy_modules(self):
+        """Test that import pytebis doesn't import pandas and the optional backends"""
+        loaded = run_python(
+            "import sys, pytebis, pytebis.tebis, pytebis.aggregate, pytebis.downsample, pytebis.cluster\n"
+            f"print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+        self.assertEqual(loaded, [])
+
+    def test_pandas_is_loaded_on_use(self):
+        """Test that the lazy modules work when the feature is used"""
+        loaded = run_python(
+            "import sys, numpy as np\n"
+            "from pytebis.tebis import getDataSeries_as_Json, pd\n"
+            "data = np.zeros(2, dtype=[('timestamp', np.int64), ('a', np.float32)])\n"
+            "getDataSeries_as_Json(data)\n"
+            "pd.DataFrame(data)\n"
+            "print('pandas' in sys.modules, 'simplejson' in sys.modules)")
+        self.assertEqual(loaded, ['True', 'True'])
+
+
+if __name__ == '__main__':
+    unittest.main()
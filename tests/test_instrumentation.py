@@ -0,0 +1,77 @@
+"""
+Unit tests for the request instrumentation
+"""
+import unittest
+from unittest.mock import Mock, MagicMock, patch
+from pytebis.tebis import Tebis
+from pytebis.instrumentation import Instrumentation, TebisStats
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Test spans, counters and hooks"""
+
+    def test_disabled_is_noop(self):
+        """Test that nothing is recorded when disabled"""
+        registry = TebisStats()
+        instrumentation = Instrumentation(enabled=False, registry=registry)
+        hook = Mock()
+        instrumentation.addHook(hook)
+
+        with instrumentation.span('decode'):
+            None
+        instrumentation.count('rows', 10)
+
+        self.assertEqual(registry.snapshot(), {'counters': {}, 'timers': {}})
+        hook.assert_not_called()
+
+    def test_enabled_records(self):
+        """Test that spans and counters end up in the registry and the hooks"""
+        registry = TebisStats()
+        instrumentation = Instrumentation(enabled=True, registry=registry)
+        hook = Mock()
+        instrumentation.addHook(hook)
+
+        with instrumentation.span('decode', bytes=10):
+            None
+        with instrumentation.span('decode'):
+            None
+        instrumentation.count('rows', 10)
+        instrumentation.count('rows', 5)
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['counters'], {'rows': 15})
+        self.assertEqual(snapshot['timers']['decode']['count'], 2)
+        self.assertEqual(hook.call_args_list[0][0][0:2], ('span', 'decode'))
+        self.assertEqual(hook.call_args_list[0][0][3], {'bytes': 10})
+        self.assertEqual(hook.call_args_list[-1][0], ('count', 'rows', 5, {}))
+
+    def test_tracer(self):
+        """Test that an OpenTelemetry like tracer receives the spans"""
+        tracer = MagicMock()
+        instrumentation = Instrumentation(enabled=True, registry=TebisStats(), tracer=tracer)
+
+        with instrumentation.span('request', msts=3) as span:
+            span.setAttribute('rows', 100)
+
+        tracer.start_as_current_span.assert_called_once_with('request', attributes={'msts': 3, 'rows': 100})
+        otelSpan = tracer.start_as_current_span.return_value.__enter__.return_value
+        otelSpan.set_attribute.assert_called_once_with('rows', 100)
+
+
+class TestTebisInstrumentation(unittest.TestCase):
+    """Test the instrumentation of the socket handling"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def test_socket_counters(self, mock_refresh):
+        teb = Tebis(configuration={'host': '192.168.1.10', 'instrumentation': {'enable': True}})
+        teb.instrumentation.stats = TebisStats()
+        sock = Mock()
+        sock.send.side_effect = lambda data: len(data)
+        sock.recv.side_effect = [b'1 0 5'.ljust(16, b'\x00'), b'hello']
+
+        teb.sendOnSocket('<tebis>', sock)
+        self.assertEqual(teb.receiveOnSocket(sock), b'hello')
+
+        snapshot = teb.getStats()
+        self.assertEqual(snapshot['counters'], {'requestBytes': 7, 'payloadBytes': 5})
+        self.assertEqual(sorted(snapshot['timers']), ['receive', 'send', 'wait'])
@@ -0,0 +1,242 @@
+"""
+Tests for the concurrency budget and rate limits per server (pytebis.ratelimit)
+"""
+import asyncio
+import threading
+import time
+import unittest
+from pytebis.fakeserver import FakeTebisServer
+from pytebis.ratelimit import HostLimiter, getLimiter, removeLimiter, parsePriority
+from pytebis.tebis import Tebis, TebisTimeoutException
+
+END = 1700000000
+NAMES = ['mst1', 'mst2', 'mst3', 'mst4', 'mst5', 'mst6']
+
+
+def waitFor(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class TestHostLimiter(unittest.TestCase):
+    """Test slots, priorities and token buckets"""
+
+    def test_concurrency(self):
+        """Test that at most maxConcurrent slots are used"""
+        limiter = HostLimiter(maxConcurrent=2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with limiter.slot():
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.02)
+                with lock:
+                    active.pop()
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(peak), 2)
+        status = limiter.status()
+        self.assertEqual((status['requests'], status['active'], status['waiting']), (8, 0, 0))
+
+    def test_priority(self):
+        """Test that interactive waiters get the slot before bulk waiters"""
+        limiter = HostLimiter(maxConcurrent=1)
+        self.assertTrue(limiter.acquire())
+        order = []
+
+        def work(name, priority):
+            with limiter.slot(priority):
+                order.append(name)
+        threads = []
+        for name, priority in (('bulk1', 'bulk'), ('bulk2', 'bulk'), ('normal', 'normal'), ('interactive', 'interactive')):
+            thread = threading.Thread(target=work, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            self.assertTrue(waitFor(lambda: limiter.status()['waiting'] == len(threads)))
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ['interactive', 'normal', 'bulk1', 'bulk2'])
+
+    def test_timeout(self):
+        """Test that a timed out waiter gives up and leaves the slot to others"""
+        limiter = HostLimiter(maxConcurrent=1)
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.02))
+        with self.assertRaises(TimeoutError):
+            with limiter.slot(timeout=0.01):
+                pass
+        self.assertEqual(limiter.status()['timeouts'], 2)
+        limiter.release()
+        self.assertTrue(limiter.acquire(timeout=0.1))
+
+    def test_requests_per_second(self):
+        """Test that the request bucket spaces the requests"""
+        limiter = HostLimiter(requestsPerSecond=50, burst=0.01)
+        started = time.monotonic()
+        for i in range(6):
+            with limiter.slot():
+                pass
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_bytes_per_second(self):
+        """Test that the booked bytes delay the next request"""
+        limiter = HostLimiter(bytesPerSecond=1000, burst=0.1)
+        with limiter.slot() as slot:
+            slot['bytes'] = 250
+        started = time.monotonic()
+        with limiter.slot():
+            pass
+        self.assertGreaterEqual(time.monotonic() - started, 0.12)
+        self.assertEqual(limiter.status()['bytes'], 250)
+
+    def test_slot_and_bucket(self):
+        """Test that waiters without timeout are woken when the slot is free but the bucket is empty"""
+        for limits in ({'requestsPerSecond': 20, 'burst': 0.01}, {'bytesPerSecond': 5000, 'burst': 0.01}):
+            limiter = HostLimiter(maxConcurrent=1, **limits)
+            self.assertTrue(limiter.acquire())
+            granted = []
+
+            def work(name):
+                with limiter.slot():
+                    granted.append(name)
+            threads = []
+            for name in ('first', 'second'):
+                thread = threading.Thread(target=work, args=(name,), daemon=True)
+                thread.start()
+                threads.append(thread)
+                self.assertTrue(waitFor(lambda: limiter.status()['waiting'] == len(threads)))
+            limiter.release(100)
+            for thread in threads:
+                thread.join(2.0)
+            self.assertEqual(granted, ['first', 'second'], limits)
+            self.assertEqual(limiter.status()['active'], 0)
+
+    def test_slot_and_bucket_async(self):
+        """Test the wakeup of waiting tasks when the slot is free but the bucket is empty"""
+        limiter = HostLimiter(maxConcurrent=1, requestsPerSecond=20, burst=0.01)
+        self.assertTrue(limiter.acquire())
+        threading.Timer(0.02, limiter.release).start()
+
+        async def main():
+            granted = []
+
+            async def task(name):
+                async with limiter.slotAsync():
+                    granted.append(name)
+            await asyncio.wait_for(asyncio.gather(task('first'), task('second')), 2.0)
+            return granted
+        self.assertEqual(asyncio.run(main()), ['first', 'second'])
+
+    def test_async(self):
+        """Test that asyncio tasks and threads share the slots"""
+        limiter = HostLimiter(maxConcurrent=1)
+        self.assertTrue(limiter.acquire())
+        threading.Timer(0.05, limiter.release).start()
+
+        async def main():
+            order = []
+
+            async def task(name, priority):
+                async with limiter.slotAsync(priority):
+                    order.append(name)
+                    await asyncio.sleep(0.001)
+            await asyncio.gather(task('bulk', 'bulk'), task('interactive', 'interactive'))
+            self.assertTrue(await limiter.acquireAsync(timeout=0))
+            limiter.release()
+            return order
+        self.assertEqual(asyncio.run(main()), ['interactive', 'bulk'])
+        self.assertEqual(limiter.status()['active'], 0)
+
+    def test_priorities(self):
+        """Test the priority names"""
+        self.assertLess(parsePriority('interactive'), parsePriority('bulk'))
+        self.assertEqual(parsePriority(3), 3)
+        with self.assertRaises(ValueError):
+            parsePriority('urgent')
+
+
+class TestTebisLimits(unittest.TestCase):
+    """Test the limiter of Tebis against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=10, seed=1, latency=0.01).start()
+        self.teb = Tebis(configuration=self.server.configuration(
+            requests={'maxParallel': 4, 'maxIdsPerRequest': 1}, limits={'enable': True, 'maxConcurrent': 2}))
+
+    def tearDown(self):
+        removeLimiter(self.server.host, self.server.port)
+        self.server.stop()
+
+    def test_shared_budget(self):
+        """Test that two instances share the budget of the server"""
+        other = Tebis(configuration=self.server.configuration(
+            requests={'maxParallel': 4, 'maxIdsPerRequest': 1}, limits={'enable': True}))
+        self.assertIs(other.getLimiter(), self.teb.getLimiter())
+        loads = self.server.getStats()['LoadData']
+        threads = [threading.Thread(target=teb.getDataAsNP, args=(NAMES, END - 600, END, 1)) for teb in (self.teb, other)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.getStats()['LoadData'] - loads, 12)
+        self.assertLessEqual(self.server.getStats()['maxActive'], 2)
+        status = self.teb.getLimiter().status()
+        self.assertGreater(status['bytes'], 0)
+        self.assertEqual(status['active'], 0)
+
+    def test_bytes_limit(self):
+        """Test concurrent queries with one slot and a byte limit"""
+        self.teb.getLimiter().configure(maxConcurrent=1, bytesPerSecond=20000, burst=0.01)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.teb.getDataAsNP(NAMES, END - 60, END, 1)),
+                                    daemon=True) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10.0)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.teb.getLimiter().status()['active'], 0)
+
+    def test_deadline(self):
+        """Test that waiting for a slot counts against the deadline"""
+        limiter = self.teb.getLimiter()
+        limiter.acquire()
+        limiter.acquire()
+        self.teb.config['timeouts']['total'] = 0.1
+        try:
+            with self.assertRaises(TebisTimeoutException):
+                self.teb.getDataAsNP(NAMES, END - 600, END, 1)
+        finally:
+            limiter.release()
+            limiter.release()
+
+    def test_request_priority(self):
+        """Test the priority of the calling thread and the worker threads"""
+        self.assertEqual(self.teb.currentPriority(), 'interactive')
+        with self.teb.requestPriority('bulk'):
+            self.assertEqual(self.teb.currentPriority(), 'bulk')
+            self.assertEqual(self.teb.currentPriority('normal'), 'normal')
+        self.assertEqual(self.teb.currentPriority(), 'interactive')
+        with self.assertRaises(ValueError):
+            with self.teb.requestPriority('urgent'):
+                pass
+
+    def test_disabled(self):
+        """Test that no limiter is used by default"""
+        teb = Tebis(configuration=self.server.configuration())
+        self.assertIsNone(teb.getLimiter())
+        self.assertIs(getLimiter(self.server.host, self.server.port), self.teb.getLimiter())
+
+
+if __name__ == '__main__':
+    unittest.main()
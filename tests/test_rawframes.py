@@ -0,0 +1,143 @@
+"""
+Tests for the raw payload passthrough (pytebis.rawframes, iterDataRAW, streamDataRAW)
+"""
+import io
+import os
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+import numpy as np
+from pytebis.decoder import decodeBinaryResult
+from pytebis.fakeserver import FakeTebisServer
+from pytebis.rawframes import buildFrame, parseFrame, iterFrames, FRAME_HEADER, MAGIC
+from pytebis.tebis import Tebis, TebisException
+
+END = 1700000000
+NAMES = ['mst1', 'mst2', 'mst3', 'mst4', 'mst5']
+
+
+def decodeFrames(buffer, names):
+    '''decodes a framed stream like a client would'''
+    frames = list(iterFrames(buffer))
+    rows = max(header['rowOffset'] + header['nNmbX'] for header, payload in frames)
+    data = np.empty(rows, dtype=[('timestamp', np.int64)] + [(name, np.float32) for name in names])
+    for header, payload in frames:
+        decodeBinaryResult(payload, data.dtype, data[header['rowOffset']:header['rowOffset'] + header['nNmbX']],
+                           header['columnOffset'])
+    return frames, data
+
+
+class TestRawFrames(unittest.TestCase):
+    """Test the frame format"""
+
+    def test_round_trip(self):
+        """Test that the header fields, ids and payload are read back"""
+        frame = buildFrame(1, 2, [7, 9], 3, 100, 50, 1000, 1700000000000, b'payload')
+        self.assertEqual(frame[:4], MAGIC)
+        self.assertEqual(len(frame), FRAME_HEADER.size + 16 + 7)
+        header, payload, end = parseFrame(frame)
+        self.assertEqual(header['ids'], [7, 9])
+        self.assertEqual((header['index'], header['count'], header['last']), (1, 2, True))
+        self.assertEqual((header['columnOffset'], header['rowOffset'], header['nNmbX']), (3, 100, 50))
+        self.assertEqual((header['nCT'], header['timeR']), (1000, 1700000000000))
+        self.assertEqual(bytes(payload), b'payload')
+        self.assertEqual(end, len(frame))
+
+    def test_invalid(self):
+        """Test that broken frames are rejected"""
+        frame = buildFrame(0, 1, [1], 0, 0, 1, 1000, 0, b'abc')
+        with self.assertRaises(ValueError):
+            parseFrame(b'XXXX' + frame[4:])
+        with self.assertRaises(ValueError):
+            parseFrame(frame[:-1])
+        with self.assertRaises(ValueError):
+            parseFrame(frame[:10])
+
+
+class TestRawPassthrough(unittest.TestCase):
+    """Test the passthrough against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=10, seed=1).start()
+        self.teb = Tebis(configuration=self.server.configuration(
+            requests={'maxParallel': 3, 'maxIdsPerRequest': 2, 'maxPointsPerRequest': 1000}))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_stream(self):
+        """Test that the decoded frames equal getDataAsNP"""
+        out = io.BytesIO()
+        size = self.teb.streamDataRAW(out, NAMES, END - 3600, END, 1)
+        self.assertEqual(size, len(out.getvalue()))
+        frames, data = decodeFrames(out.getvalue(), NAMES)
+        self.assertEqual([header['index'] for header, payload in frames], list(range(len(frames))))
+        self.assertTrue(frames[-1][0]['last'])
+        self.assertGreater(len(frames), 3)
+        expected = self.teb.getDataAsNP(NAMES, END - 3600, END, 1)
+        np.testing.assert_array_equal(data['timestamp'], expected['timestamp'])
+        for name in NAMES:
+            np.testing.assert_array_equal(data[name], expected[name])
+
+    def test_iterator(self):
+        """Test that the iterator yields one memoryview per request"""
+        loads = self.server.getStats()['LoadData']
+        frames = list(self.teb.iterDataRAW(NAMES, END - 600, END, 1))
+        self.assertTrue(all(isinstance(frame, memoryview) for frame in frames))
+        self.assertEqual(len(frames), self.server.getStats()['LoadData'] - loads)
+        self.assertEqual(set(id for frame in frames for id in parseFrame(frame)[0]['ids']), {1, 2, 3, 4, 5})
+
+    def test_file_and_socket(self):
+        """Test streaming to a path and to a socket"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'raw.bin')
+            size = self.teb.streamDataRAW(path, NAMES, END - 600, END, 1)
+            with open(path, 'rb') as f:
+                fileContent = f.read()
+        self.assertEqual(len(fileContent), size)
+        left, right = socket.socketpair()
+        received = bytearray()
+
+        def receive():
+            while True:
+                chunk = right.recv(65536)
+                if not chunk:
+                    break
+                received.extend(chunk)
+        reader = threading.Thread(target=receive)
+        reader.start()
+        self.teb.streamDataRAW(left, NAMES, END - 600, END, 1)
+        left.close()
+        reader.join()
+        right.close()
+        self.assertEqual(bytes(received), fileContent)
+
+    def test_failure(self):
+        """Test that a failed request stops the stream"""
+        self.teb.config['retry']['attempts'] = 1
+        self.server.injectFault('error')
+        with self.assertRaises(TebisException):
+            list(self.teb.iterDataRAW(NAMES, END - 3600, END, 1))
+
+    def test_get_data_raw(self):
+        """Test that getDataRAW writes and returns every chunk in one file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'raw.bin')
+            result = self.teb.getDataRAW(path, NAMES, END - 600, END, 1)
+            with open(path, 'rb') as f:
+                content = f.read()
+        self.assertEqual(result, content)
+        ids = []
+        offset = 0
+        while offset < len(content):
+            count = struct.unpack_from('>q', content, offset)[0]
+            ids += struct.unpack_from(f'>{count}q', content, offset + 8)
+            offset += 8 + count * 8
+            offset += 8 + struct.unpack_from('>q', content, offset)[0]
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+Tests for the run length encoded results (pytebis.rle)
+"""
+import unittest
+import numpy as np
+from pytebis.aggregate import aggregateSeries
+from pytebis.decoder import decodeBinaryResult
+from pytebis.fakeserver import FakeTebisServer
+from pytebis.rle import RLESeries, decodeRLE
+from pytebis.synthetic import buildLoadDataPayload, makeSeries, FUNCTION_LINEAR, FUNCTION_GROUPS
+from pytebis.tebis import Tebis
+
+END = 1700000000
+PATTERNS = ('noise', 'step', 'constant', 'linear', 'nan')
+
+
+def make_payload(byteCount=8, compress=True, rows=2000):
+    columns = [makeSeries(rows, pattern, 0.1, seed=i) for i, pattern in enumerate(PATTERNS)]
+    raw = buildLoadDataPayload(columns, END * 1000, 1000, byteCount=byteCount, compress=compress)
+    types = [('timestamp', np.int64)] + [(pattern, np.float32) for pattern in PATTERNS]
+    return raw, types
+
+
+class TestRLEDecode(unittest.TestCase):
+    """Test that the runs match the dense decoder"""
+
+    def test_functions(self):
+        """Test all functions, byte widths and compression"""
+        for byteCount in (8, 4, 2, 1):
+            for compress in (True, False):
+                raw, types = make_payload(byteCount, compress)
+                dense = decodeBinaryResult(raw, types)
+                series = decodeRLE(raw, PATTERNS)
+                self.assertEqual([s.name for s in series], list(PATTERNS))
+                for s in series:
+                    np.testing.assert_array_equal(s.toDense(), dense[s.name])
+                    np.testing.assert_array_equal(s.timestamps(), dense['timestamp'])
+
+    def test_runs(self):
+        """Test that groups and linear segments are kept as runs"""
+        step = np.repeat([1.0, 2.0, 1.0], 1000)
+        linear = np.arange(3000, dtype=np.float64) * 0.5
+        linear[1000:1100] = np.nan
+        raw = buildLoadDataPayload([step, linear], END * 1000, 1000, functions=[FUNCTION_GROUPS, FUNCTION_LINEAR])
+        steps, lines = decodeRLE(raw)
+        self.assertEqual(steps.runs, 3)
+        self.assertEqual(lines.runs, 3)
+        self.assertEqual(lines.steps.tolist(), [0.5, 0.0, 0.5])
+        np.testing.assert_array_equal(steps.toDense(np.float64), step)
+
+    def test_invalid(self):
+        """Test that a broken answer returns False"""
+        raw, types = make_payload()
+        self.assertFalse(decodeRLE(raw[:-4] + b'\x00\x00\x00\x00'))
+
+
+class TestRLESeries(unittest.TestCase):
+    """Test slicing and the aggregations on the runs"""
+
+    def setUp(self):
+        values = np.concatenate((np.repeat([3.0, np.nan, 5.0], 100), np.arange(100) * 0.25, np.full(50, 7.0)))
+        self.dense = values
+        self.series = RLESeries([0, 100, 200, 300, 400], [100, 100, 100, 100, 50], [3.0, np.nan, 5.0, 0.0, 7.0],
+                                [0, 0, 0, 0.25, 0], timestamp=END * 1000, nCT=1000, name='x')
+
+    def test_from_dense(self):
+        """Test the runs of a dense array"""
+        series = RLESeries.fromDense(self.dense[:300])
+        self.assertEqual(series.runs, 3)
+        np.testing.assert_array_equal(series.toDense(np.float64), self.dense[:300])
+
+    def test_slicing(self):
+        """Test slices and single values"""
+        for start, stop in ((0, 450), (50, 250), (320, 330), (399, 401), (10, 10), (-60, None)):
+            part = self.series[start:stop]
+            np.testing.assert_array_equal(part.toDense(np.float64), self.dense[start:stop])
+            self.assertEqual(part.timestamp, END * 1000 + (start % 450) * 1000)
+        self.assertEqual(self.series[310], 2.5)
+        self.assertEqual(self.series[-1], 7.0)
+        self.assertTrue(np.isnan(self.series[150]))
+        with self.assertRaises(IndexError):
+            self.series[450]
+
+    def test_aggregations(self):
+        """Test the aggregations against the dense values"""
+        valid = self.dense[~np.isnan(self.dense)]
+        self.assertEqual(self.series.count(), len(valid))
+        self.assertAlmostEqual(self.series.sum(), valid.sum())
+        self.assertAlmostEqual(self.series.mean(), valid.mean())
+        self.assertEqual(self.series.min(), valid.min())
+        self.assertEqual(self.series.max(), valid.max())
+        self.assertEqual(self.series.first(), 3.0)
+        self.assertEqual(self.series.last(), 7.0)
+        self.assertAlmostEqual(self.series.integral(), valid.sum())
+
+    def test_aggregate(self):
+        """Test aggregate against aggregateSeries on the dense data"""
+        funcs = ('mean', 'min', 'max', 'first', 'last', 'count', 'sum', 'integral')
+        data = np.empty(len(self.dense), dtype=[('timestamp', np.int64), ('x', np.float64)])
+        data['timestamp'] = self.series.timestamps()
+        data['x'] = self.dense
+        for every in (60000, 45000, 3600000):
+            expected = aggregateSeries(data, every, funcs, 1000)
+            result = self.series.aggregate(every, funcs)
+            np.testing.assert_array_equal(result['timestamp'], expected['timestamp'])
+            for name in expected.dtype.names[1:]:
+                np.testing.assert_allclose(result[name], expected[name], err_msg=f'{every} {name}')
+
+
+def dense_changes(timestamps, values):
+    isNan = np.isnan(values)
+    changed = np.concatenate(([True], (values[1:] != values[:-1]) & ~(isNan[1:] & isNan[:-1])))
+    return timestamps[changed], values[changed]
+
+
+class TestChanges(unittest.TestCase):
+    """Test the change points of a series"""
+
+    def test_changes(self):
+        """Test steps, NaN gaps and linear runs against the dense diff"""
+        values = np.concatenate((np.repeat([3.0, np.nan, 3.0, 5.0], 100), np.arange(10) * 0.5, np.full(50, 5.0)))
+        series = RLESeries.fromDense(values[:400], timestamp=END * 1000, nCT=1000)
+        series = RLESeries.concatenate([series, RLESeries([0, 10], [10, 50], [0.0, 5.0], [0.5, 0.0], END * 1000, 1000)])
+        np.testing.assert_array_equal(series.toDense(np.float64), values)
+        changes = series.changes()
+        timestamps, expected = dense_changes(series.timestamps(), values)
+        np.testing.assert_array_equal(changes['timestamp'], timestamps)
+        np.testing.assert_array_equal(changes['value'], expected)
+
+    def test_constant(self):
+        """Test that a constant series has a single change point"""
+        changes = RLESeries([0], [1000000], [1.0], timestamp=END * 1000).changes()
+        self.assertEqual(changes.tolist(), [(END * 1000, 1.0)])
+
+
+class TestTebisRLE(unittest.TestCase):
+    """Test getDataAsRLE against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=8, seed=1).start()
+        self.teb = Tebis(configuration=self.server.configuration(
+            requests={'maxPointsPerRequest': 5000, 'maxIdsPerRequest': 2}))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_matches_dense(self):
+        """Test that the chunked RLE result equals getDataAsNP"""
+        names = ['mst1', 'mst2', 'mst3', 'mst4', 'mst5']
+        result = self.teb.getDataAsRLE(names, END - 36000, END, 1)
+        data = self.teb.getDataAsNP(names, END - 36000, END, 1)
+        self.assertEqual(list(result), names)
+        for name, series in result.items():
+            np.testing.assert_array_equal(series.toDense(), data[name])
+            np.testing.assert_array_equal(series.timestamps(), data['timestamp'])
+        # the constant mst is a single run
+        self.assertEqual(result['mst2'].runs, 1)
+
+    def test_get_changes(self):
+        """Test that getChanges matches the diff of getDataAsNP"""
+        names = ['mst1', 'mst2', 'mst3']
+        changes = self.teb.getChanges(names, END - 36000, END, 1)
+        data = self.teb.getDataAsNP(names, END - 36000, END, 1)
+        for name in names:
+            timestamps, values = dense_changes(data['timestamp'], data[name])
+            np.testing.assert_array_equal(changes[name]['timestamp'], timestamps)
+            np.testing.assert_array_equal(changes[name]['value'].astype(np.float32), values)
+        self.assertEqual(len(changes['mst2']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
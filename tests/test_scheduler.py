@@ -0,0 +1,145 @@
+"""
+Tests for the prefetching of recurring queries (pytebis.scheduler)
+"""
+import datetime
+import time
+import unittest
+import numpy as np
+from pytebis.fakeserver import FakeTebisServer
+from pytebis.scheduler import TebisScheduler, TebisQueryTemplate
+from pytebis.tebis import Tebis
+
+END = 1700000000
+NAMES = ['mst1', 'mst2', 'mst3']
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestQueryTemplate(unittest.TestCase):
+    """Test the due times of the templates"""
+
+    def test_every(self):
+        """Test that every is aligned to the epoch"""
+        template = TebisQueryTemplate('t', NAMES, every='1h')
+        self.assertEqual(template.nextDue(END * 1000), (END // 3600 + 1) * 3600000)
+        self.assertEqual(template.nextDue(END // 3600 * 3600000), (END // 3600 + 1) * 3600000)
+
+    def test_at(self):
+        """Test the next local time of day"""
+        template = TebisQueryTemplate('t', NAMES, at=['06:00', '14:00'])
+        now = datetime.datetime(2024, 3, 1, 10, 30)
+        due = datetime.datetime.fromtimestamp(template.nextDue(int(now.timestamp() * 1000)) / 1000)
+        self.assertEqual(due, datetime.datetime(2024, 3, 1, 14, 0))
+        now = datetime.datetime(2024, 3, 1, 14, 0)
+        due = datetime.datetime.fromtimestamp(template.nextDue(int(now.timestamp() * 1000)) / 1000)
+        self.assertEqual(due, datetime.datetime(2024, 3, 2, 6, 0))
+
+    def test_invalid(self):
+        """Test that exactly one schedule is required"""
+        with self.assertRaises(ValueError):
+            TebisQueryTemplate('t', NAMES)
+        with self.assertRaises(ValueError):
+            TebisQueryTemplate('t', NAMES, at='06:00', every='1h')
+
+
+class TestScheduler(unittest.TestCase):
+    """Test prefetching and the cache against the fake server"""
+
+    def setUp(self):
+        self.server = FakeTebisServer(msts=5, seed=1).start()
+        self.teb = Tebis(configuration=self.server.configuration())
+        self.due = (END // 3600 + 1) * 3600
+        self.clock = FakeClock(self.due - 1200)
+        self.scheduler = TebisScheduler(self.teb, maxConcurrent=1, clock=self.clock)
+        self.scheduler.register('report', NAMES, rate=1, window='2h', every='1h', lead='10min', refresh='1min')
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.server.stop()
+
+    def loads(self):
+        return self.server.getStats()['LoadData']
+
+    def test_prefetch_and_refresh(self):
+        """Test that the window is loaded before the due time and refreshed"""
+        self.assertEqual(self.scheduler.runPending(), [])
+        self.clock.now = self.due - 600
+        self.assertEqual(self.scheduler.runPending(), ['report'])
+        self.assertEqual(self.scheduler.runPending(), [])
+        self.clock.now = self.due - 540
+        self.assertEqual(self.scheduler.runPending(), ['report'])
+        stats = self.scheduler.getStats()
+        self.assertEqual((stats['prefetches'], stats['refreshes']), (1, 1))
+        # after the due time the next run starts with a new prefetch window
+        self.clock.now = self.due
+        self.assertEqual(self.scheduler.runPending(), [])
+        self.assertEqual(self.scheduler.due['report'], (self.due + 3600) * 1000)
+
+    def test_get_data(self):
+        """Test that a prefetched query only loads the tail and equals a cold load"""
+        self.clock.now = self.due - 600
+        self.scheduler.runPending()
+        self.clock.now = self.due + 5
+        loads = self.loads()
+        data = self.scheduler.getData('report')
+        self.assertEqual(self.loads() - loads, 1)
+        expected = self.teb.getDataAsNP(NAMES, self.due + 5 - 7200, self.due + 5, 1)
+        self.assertEqual(len(data), 7200)
+        np.testing.assert_array_equal(data['timestamp'], expected['timestamp'])
+        for name in NAMES:
+            np.testing.assert_array_equal(data[name], expected[name])
+        self.assertEqual(self.scheduler.getStats()['hits'], 1)
+        # same end again: no request at all
+        loads = self.loads()
+        again = self.scheduler.getData('report')
+        for name in data.dtype.names:
+            np.testing.assert_array_equal(again[name], data[name])
+        self.assertEqual(self.loads(), loads)
+
+    def test_overlap(self):
+        """Test that the last rows of the cache are loaded again"""
+        self.clock.now = self.due - 600
+        self.scheduler.runPending()
+        cached = self.scheduler.cache['report'].data
+        # values the server didn't have yet
+        for name in NAMES:
+            cached[name][-30:] = np.nan
+        data = self.scheduler.getData('report', end=self.due - 590)
+        expected = self.teb.getDataAsNP(NAMES, self.due - 590 - 7200, self.due - 590, 1)
+        for name in NAMES:
+            np.testing.assert_array_equal(data[name], expected[name])
+
+    def test_cold(self):
+        """Test that an uncached query is loaded completely"""
+        data = self.scheduler.getData('report', end=self.due)
+        self.assertEqual(len(data), 7200)
+        self.assertEqual(data['timestamp'][-1], self.due * 1000)
+        self.assertEqual(self.scheduler.getStats()['misses'], 1)
+
+    def test_end_types(self):
+        """Test that end takes the same time arguments as Tebis"""
+        expected = self.scheduler.getData('report', end=self.due)['timestamp']
+        for end in (self.due * 1000, float(self.due), datetime.datetime.fromtimestamp(self.due),
+                    np.datetime64(self.due, 's')):
+            np.testing.assert_array_equal(self.scheduler.getData('report', end=end)['timestamp'], expected)
+
+    def test_background(self):
+        """Test that the background thread prefetches the template"""
+        self.clock.now = self.due - 600
+        self.scheduler.start()
+        deadline = time.time() + 10
+        while self.scheduler.getStats()['prefetches'] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.scheduler.stop()
+        self.assertEqual(self.scheduler.getStats()['prefetches'], 1)
+        self.assertEqual(self.scheduler.cache['report'].end, (self.due - 600) * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Round trip tests for the synthetic server payloads
+"""
+import unittest
+from unittest.mock import patch
+import numpy as np
+from pytebis.tebis import Tebis
+from pytebis.synthetic import (buildLoadDataPayload, buildConfigPayload, makeSeries,
+                               FUNCTION_NAN, FUNCTION_VALUES, FUNCTION_LINEAR, FUNCTION_GROUPS)
+
+
+class TestSyntheticLoadData(unittest.TestCase):
+    """Test that the decoder reads the generated LoadData payloads"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': 'localhost'})
+
+    def decode(self, columns, **kwargs):
+        types = [('timestamp', np.int64)] + [(f'c{i}', np.float64) for i in range(len(columns))]
+        raw = buildLoadDataPayload(columns, 1700000000000, 1000, **kwargs)
+        return self.teb._Tebis__checkBinaryResultHeader(raw, types)
+
+    def test_round_trip_all_functions(self):
+        """Test every function, byte width and compression"""
+        series = {FUNCTION_NAN: makeSeries(1000, 'nan'), FUNCTION_VALUES: makeSeries(1000, 'step', 0.1),
+                  FUNCTION_LINEAR: makeSeries(1000, 'constant', 0.1), FUNCTION_GROUPS: makeSeries(1000, 'step', 0.1, seed=1)}
+        for function, values in series.items():
+            for byteCount in (8, 4, 2, 1):
+                for compress in (True, False):
+                    with self.subTest(function=function, byteCount=byteCount, compress=compress):
+                        data = self.decode([values], functions=[function], byteCount=byteCount, compress=compress)
+                        np.testing.assert_array_equal(data['c0'], values)
+
+    def test_timestamps_end_at_time_r(self):
+        """Test that the rows end at timeR"""
+        data = self.decode([makeSeries(300, 'noise')])
+        self.assertEqual(data['timestamp'][-1], 1700000000000)
+        self.assertTrue(np.all(np.diff(data['timestamp']) == 1000))
+
+    def test_long_segments(self):
+        """Test segments longer than 255 values and automatic function choice"""
+        columns = [makeSeries(5000, pattern, 0.05, seed=i) for i, pattern in enumerate(('noise', 'step', 'constant', 'linear'))]
+        data = self.decode(columns)
+        for i, values in enumerate(columns):
+            np.testing.assert_array_almost_equal(data[f'c{i}'], values)
+
+
+class TestSyntheticConfig(unittest.TestCase):
+    """Test that the config decoder reads the generated GetConfig payloads"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': 'localhost'})
+
+    def test_round_trip(self):
+        array = np.zeros(3, dtype=[('ID', np.int64), ('Reduction', np.int64), ('Name', np.str_, 20)])
+        array['ID'] = [1, 2, 3]
+        array['Reduction'] = [1000, 5000, 60000]
+        array['Name'] = ['a', 'b b', 'c']
+        result = self.teb.getConfigData('test', array.dtype.descr, raw=buildConfigPayload(array))
+        np.testing.assert_array_equal(result, array)
+
+
+if __name__ == '__main__':
+    unittest.main()
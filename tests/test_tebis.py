@@ -5,8 +5,15 @@ These tests focus on configuration and initialization without requiring a live s
 import unittest
 from unittest.mock import Mock, patch, MagicMock
 import datetime
+import threading
+import time
 import numpy as np
-from pytebis.tebis import Tebis, TebisMST, TebisException, TebisOracleDBException
+from pytebis.tebis import (
+    Tebis, TebisMST, TebisRMST, TebisVMST, TebisException, TebisOracleDBException,
+    TebisTimeoutException, TebisConnectionException,
+    TebisGroupElement, TebisGroupMember, TebisTreeElement, TebisMapTreeGroup
+)
+from pytebis.timeutils import alignRange
 
 
 class TestTebisConfiguration(unittest.TestCase):
@@ -259,5 +266,444 @@ class TestTebisDataCalculations(unittest.TestCase):
         self.assertEqual(nNmbX, 1)
 
 
+class TestTebisIncrementalRefresh(unittest.TestCase):
+    """Test the incremental refresh of the mst registry"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        config = {
+            'host': '192.168.1.10',
+            'configfile': '/path/to/config.txt'
+        }
+        self.teb = Tebis(configuration=config)
+        self.mst1 = TebisMST(100, 'Temperature', '°C', 'Temperature sensor')
+        self.mst2 = TebisMST(101, 'Pressure', 'bar', 'Pressure sensor')
+        self.teb.msts = [self.mst1, self.mst2]
+        self.teb.mstById = {100: self.mst1, 101: self.mst2}
+        self.teb.mstByName = {'Temperature': self.mst1, 'Pressure': self.mst2}
+        self.teb.configHashes = {'RsRedCTs': 'a', 'Msts': 'b', 'VMsts': 'c'}
+
+    def _fakeConfigRaw(self, hashes):
+        def getConfigRaw(type):
+            self.teb.configHashes[type] = hashes[type]
+            return b''
+        return getConfigRaw
+
+    def test_unchanged_config_is_skipped(self):
+        """Test that an unchanged payload does not rebuild anything"""
+        self.teb.getConfigRaw = self._fakeConfigRaw({'RsRedCTs': 'a', 'Msts': 'b', 'VMsts': 'c'})
+        self.teb.buildMstsFromSocket = Mock()
+
+        self.assertIsNone(self.teb.refreshMstsIncremental())
+        self.teb.buildMstsFromSocket.assert_not_called()
+
+    def test_changed_msts_are_updated_in_place(self):
+        """Test that added, removed and changed msts are applied to the existing registry"""
+        self.teb.getConfigRaw = self._fakeConfigRaw({'RsRedCTs': 'a', 'Msts': 'x', 'VMsts': 'c'})
+        self.teb.buildMstsFromSocket = Mock(return_value=[
+            TebisMST(100, 'Temperature', 'K', 'Temperature sensor'),
+            TebisMST(102, 'Flow', 'm3/h', 'Flow sensor'),
+        ])
+        listener = Mock()
+        self.teb.addChangeListener(listener)
+
+        change = self.teb.refreshMstsIncremental()
+
+        self.assertEqual([m.id for m in change.added], [102])
+        self.assertEqual([m.id for m in change.removed], [101])
+        self.assertEqual(change.changed, [self.mst1])
+        self.assertIs(self.teb.getMst(id=100), self.mst1)
+        self.assertEqual(self.mst1.unit, 'K')
+        self.assertIsNone(self.teb.getMst(name='Pressure'))
+        self.assertEqual(self.teb.getMst(name='Flow').id, 102)
+        self.assertEqual([m.id for m in self.teb.msts], [100, 102])
+        listener.assert_called_once_with(change)
+
+    def test_renamed_mst_updates_name_index(self):
+        """Test that a renamed mst is reachable by its new name only"""
+        self.teb.applyMstChanges([
+            TebisMST(100, 'Temp', '°C', 'Temperature sensor'),
+            self.mst2,
+        ], Mock(added=[], removed=[], changed=[]))
+
+        self.assertIs(self.teb.getMst(name='Temp'), self.mst1)
+        self.assertNotIn('Temperature', self.teb.mstByName)
+
+    def test_changed_type_drops_old_attributes(self):
+        """Test that an mst which changes from RMST to VMST keeps no RMST attributes"""
+        rmst = TebisRMST([100, 'Temperature', '°C', 'Temperature sensor', 1, 'V', 0, 10, 0, 100])
+        rmst.currentValue = 42.0
+        self.teb.mstById[100] = rmst
+        self.teb.mstByName['Temperature'] = rmst
+        change = Mock(added=[], removed=[], changed=[])
+        self.teb.applyMstChanges([
+            TebisVMST([100, 'Temperature', '°C', 'Temperature sensor', 1, 'a+b', 1]),
+            self.mst2,
+        ], change)
+
+        self.assertEqual(change.changed, [rmst])
+        self.assertIsInstance(rmst, TebisVMST)
+        self.assertEqual(rmst.formula, 'a+b')
+        for attr in ('mode', 'elunit', 'elFrom', 'elTo', 'phyFrom', 'phyTo'):
+            self.assertFalse(hasattr(rmst, attr), attr)
+        self.assertEqual(rmst.currentValue, 42.0)
+
+    def test_auto_refresh_thread(self):
+        """Test that the background refresher calls the incremental refresh"""
+        called = threading.Event()
+        self.teb.refreshMstsIncremental = Mock(side_effect=lambda: called.set())
+
+        self.teb.startAutoRefresh(interval=0.01)
+        self.assertTrue(called.wait(2))
+        self.teb.stopAutoRefresh(timeout=2)
+
+        self.assertIsNone(self.teb.autoRefreshThread)
+
+
+class TestTebisGroupQueries(unittest.TestCase):
+    """Test reading data for groups and tree nodes"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        config = {
+            'host': '192.168.1.10',
+            'configfile': '/path/to/config.txt',
+            'useOracle': True
+        }
+        self.teb = Tebis(configuration=config)
+        msts = [TebisMST(100, 'Temperature'), TebisMST(101, 'Pressure'), TebisMST(102, 'Flow')]
+        self.teb.mstById = dict((m.id, m) for m in msts)
+        self.teb.mstByName = dict((m.name, m) for m in msts)
+        grp1 = TebisGroupElement((1, 'G1', ''))
+        grp2 = TebisGroupElement((2, 'G2', ''))
+        for grp, ids in ((grp1, [100, 101]), (grp2, [101, 102])):
+            for pos, id in enumerate(ids):
+                member = TebisGroupMember((grp.id, pos, id, 0, 1, '', 1, True, '', 1))
+                member.mst = self.teb.mstById[id]
+                grp.members.append(member)
+        self.teb.tebisGrpsById = {1: grp1, 2: grp2}
+        root = TebisTreeElement((1, None, 0, 'Root'))
+        child = TebisTreeElement((2, 1, 0, 'Child'))
+        root.childs.append(child)
+        self.teb.tebisTree = [root]
+        map1 = TebisMapTreeGroup((1,))
+        map1.groups.append(grp1)
+        map2 = TebisMapTreeGroup((2,))
+        map2.groups.append(grp2)
+        self.teb.tebisMapTreeGroupById = {1: map1, 2: map2}
+        self.data = np.zeros(3, dtype=[('timestamp', np.int64), ('Temperature', np.float32),
+                                       ('Pressure', np.float32), ('Flow', np.float32)])
+        self.data['Pressure'] = 5.0
+        self.teb.getDataAsNP = Mock(return_value=self.data)
+
+    def test_groups_fetch_each_mst_once(self):
+        """Test that msts shared between groups are only requested once"""
+        result = self.teb.getDataForGroups([1, 2], 0, 10, 1)
+
+        self.assertEqual(self.teb.getDataAsNP.call_args[0][0], [100, 101, 102])
+        self.assertEqual(result[1].dtype.names, ('timestamp', 'Temperature', 'Pressure'))
+        self.assertEqual(result[2].dtype.names, ('timestamp', 'Pressure', 'Flow'))
+        self.assertTrue(np.shares_memory(result[1], self.data))
+        self.assertTrue(np.all(result[2]['Pressure'] == 5.0))
+
+    def test_unknown_group(self):
+        """Test that an unknown group id raises"""
+        with self.assertRaises(TebisException):
+            self.teb.getDataForGroups([1, 999], 0, 10, 1)
+
+    def test_groups_without_data(self):
+        """Test that an empty timespan returns None for every group"""
+        self.teb.getDataAsNP = Mock(return_value=None)
+        self.assertEqual(self.teb.getDataForGroups([1, 2], 0, 10, 1), {1: None, 2: None})
+
+    def test_tree_node_recursive(self):
+        """Test that a tree node collects the groups of all child nodes"""
+        result = self.teb.getDataForTreeNode(1, 0, 10, 1)
+        self.assertEqual(sorted(result.keys()), [1, 2])
+
+        result = self.teb.getDataForTreeNode(1, 0, 10, 1, recursive=False)
+        self.assertEqual(list(result.keys()), [1])
+
+    def test_tree_node_not_found(self):
+        """Test that an unknown tree node raises"""
+        with self.assertRaises(TebisException):
+            self.teb.getDataForTreeNode(999, 0, 10, 1)
+
+
+class TestTebisRequestPlanning(unittest.TestCase):
+    """Test the splitting of LoadData requests"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        config = {
+            'host': '192.168.1.10',
+            'configfile': '/path/to/config.txt',
+            'requests': {'maxIdsPerRequest': 100, 'maxPointsPerRequest': 1000}
+        }
+        self.teb = Tebis(configuration=config)
+
+    def test_split_by_ids(self):
+        """Test that many msts over a short timespan are split by ids"""
+        plan = self.teb.planLoadData(list(range(250)), 10, 100000, 1000)
+
+        self.assertEqual([len(p[0]) for p in plan], [100, 100, 50])
+        self.assertEqual([p[1] for p in plan], [0, 100, 200])
+        self.assertTrue(all(p[2] == 100000 and p[3] == 10 and p[4] == 0 for p in plan))
+
+    def test_split_by_points(self):
+        """Test that the ids per request are limited by the max points"""
+        plan = self.teb.planLoadData(list(range(10)), 400, 100000, 1000)
+
+        self.assertEqual([len(p[0]) for p in plan], [2, 2, 2, 2, 2])
+
+    def test_split_by_time(self):
+        """Test that a long timespan is split into adjacent windows"""
+        plan = self.teb.planLoadData([1, 2], 2500, 10000000, 1000)
+
+        windows = sorted(set((p[2], p[3], p[4]) for p in plan), key=lambda w: w[2])
+        self.assertEqual(windows, [(10000000 - 2000000, 500, 0), (10000000 - 1000000, 1000, 500), (10000000, 1000, 1500)])
+        self.assertEqual(len(plan), 6)
+
+    def test_no_time_split_for_raw(self):
+        """Test that the time split can be disabled"""
+        plan = self.teb.planLoadData([1, 2], 2500, 10000000, 1000, allowTimeSplit=False)
+
+        self.assertEqual(plan, [([1], 0, 10000000, 2500, 0), ([2], 1, 10000000, 2500, 0)])
+
+    def test_adaptive_points(self):
+        """Test that measured throughput reduces the request size"""
+        self.teb.config['requests']['maxPointsPerRequest'] = 10000000
+        self.teb.config['requests']['minPointsPerRequest'] = 1000
+        self.teb.updateRequestStats(100000, 0.0, 1.0)
+
+        self.assertEqual(self.teb.getMaxPointsPerRequest(), 200000)
+
+
+class TestTebisMultiRange(unittest.TestCase):
+    """Test the merging of multiple time ranges"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': '192.168.1.10'})
+        self.teb.reductions = [1000]
+        mst = TebisMST(100, 'Temperature')
+        self.teb.mstById = {100: mst}
+        self.teb.mstByName = {'Temperature': mst}
+
+    def test_ranges_are_merged(self):
+        """Test that overlapping and adjacent ranges are loaded once"""
+        self.teb.executeLoadPlan = Mock(side_effect=lambda plan, nCT, types, data: data)
+        ranges = [[1700000100, 1700000200], [1700000000, 1700000050], [1700000040, 1700000100], [1700000300, 1700000310]]
+
+        data = self.teb.getDataAsNPMulti([100], ranges, 1)
+
+        plan = self.teb.executeLoadPlan.call_args[0][0]
+        self.assertEqual([(p[2], p[3], p[4]) for p in plan], [(1700000200000, 200, 0), (1700000310000, 10, 200)])
+        self.assertEqual(len(data), 210)
+        self.assertEqual(data.dtype.names, ('timestamp', 'Temperature'))
+
+    def test_align_range(self):
+        """Test the calculation of TimeR and nNmbX"""
+        nTimeR, nNmbX = alignRange(1700000000500, 1700000010700, 1)
+        self.assertEqual(self.teb.alignBinRange(1, nNmbX, nTimeR), (1000, 10, 1700000010000))
+
+
+class TestTebisSingleFlight(unittest.TestCase):
+    """Test the sharing of concurrent identical queries"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': '192.168.1.10', 'requests': {'singleFlight': True}})
+        self.teb.reductions = [1000]
+        self.teb.mstById = dict((id, TebisMST(id, f'mst{id}')) for id in (1, 2, 3))
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+        def load(plan, nCT, types, data):
+            self.started.set()
+            self.release.wait(5)
+            data = np.zeros(10, dtype=types)
+            for i, name in enumerate(data.dtype.names):
+                data[name] = i
+            return data
+        self.teb.executeLoadPlan = Mock(side_effect=load)
+
+    def query(self, ids, results, key):
+        try:
+            results[key] = self.teb.getDataAsNP(ids, 1700000000, 1700000010, 1)
+        except Exception as e:
+            results[key] = e
+
+    def run_queries(self, queries):
+        results = {}
+        first = threading.Thread(target=self.query, args=(queries[0], results, 0))
+        first.start()
+        self.started.wait(5)
+        threads = [threading.Thread(target=self.query, args=(ids, results, i + 1)) for i, ids in enumerate(queries[1:])]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        self.release.set()
+        for thread in [first] + threads:
+            thread.join()
+        return results
+
+    def test_identical_and_subset_queries_share_one_load(self):
+        """Test that identical and subset queries wait for the running query"""
+        results = self.run_queries([[1, 2, 3], [1, 2, 3], [3, 1], [2]])
+
+        self.assertEqual(self.teb.executeLoadPlan.call_count, 1)
+        self.assertEqual(results[2].dtype.names, ('timestamp', 'mst3', 'mst1'))
+        self.assertTrue(np.all(results[2]['mst3'] == 3))
+        self.assertEqual(results[3].dtype.names, ('timestamp', 'mst2'))
+        self.assertTrue(np.all(results[3]['mst2'] == 2))
+
+    def test_other_window_is_loaded(self):
+        """Test that a query with other msts is loaded separately"""
+        self.teb.mstById[4] = TebisMST(4, 'mst4')
+        self.run_queries([[1, 2], [1, 4]])
+
+        self.assertEqual(self.teb.executeLoadPlan.call_count, 2)
+        self.assertEqual(self.teb.inFlight, {})
+
+    def test_error_is_shared(self):
+        """Test that the waiting queries get the error of the running query"""
+        def fail(plan, nCT, types, data):
+            self.started.set()
+            self.release.wait(5)
+            raise TebisException('failed')
+        self.teb.executeLoadPlan = Mock(side_effect=fail)
+
+        results = self.run_queries([[1, 2], [1]])
+
+        self.assertIsInstance(results[0], TebisException)
+        self.assertIsInstance(results[1], TebisException)
+        self.assertEqual(self.teb.executeLoadPlan.call_count, 1)
+
+    def test_local_timestamps_are_not_shifted_twice(self):
+        """Test that localizing a shared result doesn't change it for the others"""
+        self.teb.config['localTimestamps'] = True
+        results = self.run_queries([[1, 2], [1, 2]])
+
+        np.testing.assert_array_equal(results[0]['timestamp'], results[1]['timestamp'])
+
+
+class TestTebisThreadSafety(unittest.TestCase):
+    """Test the shared registry and the per thread state"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': '192.168.1.10'})
+        self.mst = TebisMST(1, 'old')
+        self.teb.mstById = {1: self.mst}
+        self.teb.mstByName = {'old': self.mst}
+
+    def test_registry_properties(self):
+        """Test that the registry attributes are delegated"""
+        self.assertIs(self.teb.registry.mstById[1], self.mst)
+        self.teb.reductions = [1000]
+        self.assertEqual(self.teb.registry.reductions, [1000])
+
+    def test_refresh_swaps_registry(self):
+        """Test that other threads see the old registry until the refresh is done"""
+        loading = threading.Event()
+        release = threading.Event()
+
+        def loadReductions():
+            self.teb.reductions = [1000]
+            loading.set()
+            release.wait(5)
+
+        def loadMsts():
+            mst = TebisMST(2, 'new')
+            self.teb.msts = [mst]
+            self.teb.mstById = {2: mst}
+            self.teb.mstByName = {'new': mst}
+        self.teb.loadReductions = loadReductions
+        self.teb.loadMstsnVMstsFromSocket = loadMsts
+        self.teb.loadGroupsFromSocket = Mock()
+
+        refresh = threading.Thread(target=self.teb.refreshMsts)
+        refresh.start()
+        loading.wait(5)
+        self.assertIs(self.teb.getMst(name='old'), self.mst)
+        self.assertEqual(self.teb.reductions, [])
+        release.set()
+        refresh.join()
+        self.assertIsNone(self.teb.getMst(name='old'))
+        self.assertEqual(self.teb.getMst(name='new').id, 2)
+        self.assertEqual(self.teb.reductions, [1000])
+
+    def test_socket_per_thread(self):
+        """Test that the socket of socketConnect is stored per thread"""
+        self.teb.sock = 'main'
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(self.teb.sock))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [None])
+        self.assertEqual(self.teb.sock, 'main')
+
+    def test_time_offset_calculated_once(self):
+        """Test that concurrent callers calculate the live values offset only once"""
+        self.teb.config['liveValues'].update({'timeOffset': None, 'lastTimeOffsetCalculation': None})
+
+        def calc():
+            time.sleep(0.05)
+            self.teb.config['liveValues']['timeOffset'] = 5
+            self.teb.config['liveValues']['lastTimeOffsetCalculation'] = time.time()
+        self.teb.calcTimeOffset = Mock(side_effect=calc)
+        threads = [threading.Thread(target=self.teb.getCurrentTime) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.teb.calcTimeOffset.call_count, 1)
+
+
+class TestTebisSocketHandling(unittest.TestCase):
+    """Test the socket handling with broken and slow connections"""
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def setUp(self, mock_refresh):
+        self.teb = Tebis(configuration={'host': 'localhost'})
+
+    def test_header_in_parts(self):
+        """Test that a header received in several parts is read completely"""
+        sock = Mock()
+        sock.recv.side_effect = [b'1 0 ', b'5'.ljust(12, b'\x00'), b'hel', b'lo']
+        self.assertEqual(self.teb.receiveOnSocket(sock), b'hello')
+
+    def test_closed_connection(self):
+        """Test that a closed connection raises instead of looping"""
+        sock = Mock()
+        sock.recv.side_effect = [b'1 0 5'.ljust(16, b'\x00'), b'he', b'']
+        with self.assertRaises(TebisConnectionException):
+            self.teb.receiveOnSocket(sock)
+        self.assertTrue(issubclass(TebisConnectionException, TebisException))
+
+    def test_deadline_passed(self):
+        """Test that an exceeded deadline raises before reading"""
+        sock = Mock()
+        with self.assertRaises(TebisTimeoutException):
+            self.teb.receiveOnSocket(sock, deadline=self.teb.getDeadline(-1))
+        sock.recv.assert_not_called()
+
+    def test_read_timeout_limited_by_deadline(self):
+        """Test that the socket timeout is the smaller of read timeout and remaining time"""
+        sock = Mock()
+        sock.recv.side_effect = [b'1 0 2'.ljust(16, b'\x00'), b'ok']
+        self.teb.receiveOnSocket(sock, deadline=self.teb.getDeadline(5))
+        self.assertLessEqual(sock.settimeout.call_args[0][0], 5)
+
+    @patch('pytebis.tebis.time.sleep')
+    def test_retry_backoff(self, mock_sleep):
+        """Test the exponential backoff between the retries"""
+        self.teb.config['retry'] = {'attempts': 4, 'backoff': 0.1, 'maxBackoff': 0.3, 'jitter': False}
+        self.teb.requestOnce = Mock(side_effect=[TebisConnectionException(), TebisTimeoutException(), TebisException(), b'data'])
+        self.assertEqual(self.teb.requestOnSocket('<tebis>'), b'data')
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [0.1, 0.2, 0.3])
+
+
 if __name__ == '__main__':
     unittest.main()
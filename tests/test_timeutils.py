@@ -0,0 +1,129 @@
+"""
+Unit tests for the timestamp helpers
+"""
+import unittest
+import datetime
+import time
+from unittest.mock import Mock, patch
+import numpy as np
+import pandas as pd
+from pytebis.tebis import Tebis
+from pytebis.timeutils import (
+    localizeTimestamps, utcOffsetTable, toTimestampMs, toTimestampsMs, alignRange, alignRanges
+)
+
+
+def pandas_localize(timestamps, tz):
+    return pd.to_datetime(pd.Series(timestamps), unit='ms').dt.tz_localize('UTC').dt.tz_convert(tz).dt.tz_localize(None)
+
+
+class TestLocalizeTimestamps(unittest.TestCase):
+    """Test the vectorized timezone conversion"""
+
+    def test_matches_pandas_over_dst(self):
+        """Test the conversion across several DST transitions against pandas"""
+        timestamps = np.arange(1679792400000 - 7200000, 1679792400000 + 2 * 365 * 86400000, 600000, dtype=np.int64)
+
+        result = localizeTimestamps(timestamps, 'Europe/Berlin')
+
+        expected = pandas_localize(timestamps, 'Europe/Berlin')
+        np.testing.assert_array_equal(result.astype('datetime64[ms]'), expected.values.astype('datetime64[ms]'))
+
+    def test_transition_table(self):
+        """Test that the exact transition is found"""
+        transitions, offsets = utcOffsetTable('Europe/Berlin', 1679700000000, 1679900000000)
+
+        self.assertEqual(transitions.tolist(), [1679792400000])
+        self.assertEqual(offsets.tolist(), [3600000, 7200000])
+
+    def test_no_timezone(self):
+        timestamps = np.array([1, 2, 3], dtype=np.int64)
+        np.testing.assert_array_equal(localizeTimestamps(timestamps, None), timestamps)
+
+
+class TestTebisTimezone(unittest.TestCase):
+    """Test the timezone configuration of the Tebis class"""
+
+    def make_data(self):
+        data = np.zeros(3, dtype=[('timestamp', np.int64), ('a', np.float32)])
+        data['timestamp'] = [1679792400000 - 1000, 1679792400000, 1679792400000 + 1000]
+        return data
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def test_pandas_uses_configured_timezone(self, mock_refresh):
+        teb = Tebis(configuration={'host': '192.168.1.10', 'timezone': 'America/New_York'})
+        teb.getDataAsNP = Mock(return_value=self.make_data())
+
+        df = teb.getDataAsPD(['a'], 0, 1)
+
+        expected = pandas_localize(self.make_data()['timestamp'], 'America/New_York')
+        np.testing.assert_array_equal(df.index.values, expected.values)
+        self.assertEqual(df.index.name, 'timestamp')
+
+    @patch('pytebis.tebis.Tebis.refreshMsts')
+    def test_local_timestamps_for_np(self, mock_refresh):
+        teb = Tebis(configuration={'host': '192.168.1.10', 'localTimestamps': True})
+
+        data = teb.localizeResult(self.make_data())
+
+        self.assertEqual(data['timestamp'].tolist(), [1679792400000 - 1000 + 3600000, 1679792400000 + 7200000, 1679792400000 + 1000 + 7200000])
+
+
+class TestTimeArguments(unittest.TestCase):
+    """Test the normalization of the time arguments"""
+
+    def test_scalars(self):
+        dt = datetime.datetime(2023, 12, 1, 12, 0, 0)
+        self.assertEqual(toTimestampMs(dt), dt.timestamp() * 1000.0)
+        self.assertEqual(toTimestampMs(1701432000.5), 1701432000500.0)
+        self.assertEqual(toTimestampMs(1701432000), 1701432000000.0)
+        self.assertEqual(toTimestampMs(1701432000000), 1701432000000)
+        self.assertEqual(toTimestampMs(np.datetime64('2023-12-01T12:00:00')), 1701432000000.0)
+        self.assertEqual(toTimestampMs(pd.Timestamp('2023-12-01 12:00:00', tz='UTC')), 1701432000000.0)
+        self.assertEqual(toTimestampMs('2023-12-01 12:00:00.000'), dt.timestamp() * 1000.0)
+        self.assertEqual(toTimestampMs('2023-12-01T12:00:00'), dt.timestamp() * 1000.0)
+
+    def test_naive_pandas_is_utc(self):
+        """Test that naive pandas scalars, lists and columns are all UTC"""
+        try:
+            with patch.dict('os.environ', {'TZ': 'Europe/Berlin'}):
+                time.tzset()
+                timestamp = pd.Timestamp('2024-01-01')
+                self.assertEqual(toTimestampMs(timestamp), 1704067200000)
+                np.testing.assert_array_equal(toTimestampsMs([timestamp, timestamp]), [1704067200000] * 2)
+                np.testing.assert_array_equal(toTimestampsMs(pd.Series([timestamp])), [1704067200000])
+                np.testing.assert_array_equal(toTimestampsMs(pd.DatetimeIndex([timestamp])), [1704067200000])
+                aware = pd.Timestamp('2024-01-01', tz='Europe/Berlin')
+                self.assertEqual(toTimestampMs(aware), 1704063600000)
+                np.testing.assert_array_equal(toTimestampsMs(pd.Series([aware])), [1704063600000])
+        finally:
+            time.tzset()
+
+    def test_cache_is_typed(self):
+        """Test that equal values of different types don't share a cache entry"""
+        self.assertEqual(toTimestampMs(1600000000000.0), 1600000000000000.0)
+        self.assertEqual(toTimestampMs(np.int64(1600000000000)), 1600000000000)
+        self.assertEqual(toTimestampMs(np.datetime64('2023-12-01T12:00:00')), 1701432000000.0)
+        self.assertEqual(toTimestampMs(datetime.datetime(2023, 12, 1, 12)), datetime.datetime(2023, 12, 1, 12).timestamp() * 1000.0)
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            toTimestampMs([1, 2])
+
+    def test_arrays(self):
+        """Test that the vectorized conversion matches the scalar one"""
+        values = [1701432000, 1701432000000, 1701435600]
+        np.testing.assert_array_equal(toTimestampsMs(values), [1701432000000, 1701432000000, 1701435600000])
+        np.testing.assert_array_equal(toTimestampsMs(np.array([1701432000.25])), [1701432000250])
+        dates = pd.date_range('2023-12-01', periods=3, freq='h')
+        np.testing.assert_array_equal(toTimestampsMs(dates), [1701388800000, 1701392400000, 1701396000000])
+        strings = ['2023-12-01 12:00:00.000', '2023-12-01 13:00:00.000', '2023-12-01 12:00:00.000']
+        np.testing.assert_array_equal(toTimestampsMs(strings), [toTimestampMs(s) for s in strings])
+
+    def test_align_range(self):
+        """Test the calculation of nTimeR and nNmbX"""
+        self.assertEqual(alignRange(1701432000, 1701435600, 1), (1701435600000, 3600.0))
+        self.assertEqual(alignRange(1701432000, 1701432000, 1), (1701432000000, 1))
+        nTimeR, nNmbX = alignRanges([1701432000, 1701432000], [1701435600, 1701432600], 10)
+        np.testing.assert_array_equal(nTimeR, [1701435600000, 1701432600000])
+        np.testing.assert_array_equal(nNmbX, [360, 60])